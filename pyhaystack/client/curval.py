@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Current value store.  This keeps the most recent `curVal` of each point seen
+in `read` results and watch polls, so that `point.value` can be answered
+without going back to the server while the value is fresh enough.
+
+If NumPy is available, numeric values are also kept in a fixed-size ring
+buffer per point, so recent history can be inspected as a NumPy array::
+
+    store = session.cur_vals
+    store.recent('my.point.id', 10)         # Last 10 values
+    store.recent_times('my.point.id', 10)   # … and when they were seen
+"""
+
+from threading import Lock
+from time import time
+
+import hszinc
+from six import string_types
+
+try:
+    import numpy
+
+    HAVE_NUMPY = True
+except ImportError:  # pragma: no cover
+    # Not covered, since we'll always have 'numpy' available during tests.
+    HAVE_NUMPY = False
+
+
+class CurValRing(object):
+    """
+    The values of a single point.  Samples are written twice, `capacity`
+    apart, so that the last `n` samples are always contiguous in memory and
+    can be returned as a slice without copying.  Without NumPy, only the
+    last sample is kept.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        if HAVE_NUMPY:
+            self.values = numpy.full(2 * capacity, numpy.nan, dtype=numpy.float64)
+            self.times = numpy.full(2 * capacity, numpy.nan, dtype=numpy.float64)
+        else:
+            self.values = None
+            self.times = None
+        self.pos = 0
+        self.count = 0
+        self.last = None
+        self.last_time = None
+
+    def append(self, ts, raw, val):
+        """
+        Record a sample: the raw value as received, and its numeric form.
+        """
+        self.last = raw
+        self.last_time = ts
+        if self.values is None:
+            return
+
+        pos = self.pos
+        self.values[pos] = self.values[pos + self.capacity] = val
+        self.times[pos] = self.times[pos + self.capacity] = ts
+        self.pos = (pos + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def recent(self, array, n):
+        """
+        Return a read-only view of the last `n` entries of `array`.
+        """
+        if (n is None) or (n > self.count):
+            n = self.count
+        end = self.pos + self.capacity
+        view = array[end - n : end]
+        view.flags.writeable = False
+        return view
+
+
+class CurValStore(object):
+    """
+    Store of the current values of points, keyed by point ID.
+    """
+
+    def __init__(self, capacity=64, max_age=0.0):
+        """
+        Initialise a new current value store.
+
+        :param capacity: Number of samples held for each point.
+        :param max_age: Default maximum age (in seconds) of a value returned
+                        by `get`.  If 0, stored values are never used.
+        """
+        self._capacity = capacity
+        self._max_age = max_age
+        self._lock = Lock()
+        self._rings = {}
+
+    @property
+    def enabled(self):
+        """
+        Return whether stored values may be used, i.e. whether the results
+        of reads are worth recording.
+        """
+        return self._max_age > 0
+
+    @property
+    def max_age(self):
+        """
+        Return the default maximum age of values returned by `get`.
+        """
+        return self._max_age
+
+    def __contains__(self, point_id):
+        with self._lock:
+            return point_id in self._rings
+
+    def __len__(self):
+        with self._lock:
+            return len(self._rings)
+
+    def update(self, point_id, val, ts=None):
+        """
+        Record a new value for a point.
+
+        :param point_id: ID of the point.
+        :param val: Its value.
+        :param ts: When the value was seen (seconds since epoch), defaults to
+                   now.
+        """
+        if ts is None:
+            ts = time()
+        num = self._to_float(val)
+        with self._lock:
+            try:
+                ring = self._rings[point_id]
+            except KeyError:
+                ring = CurValRing(self._capacity)
+                self._rings[point_id] = ring
+            ring.append(ts, val, num)
+
+    def update_rows(self, rows, ts=None):
+        """
+        Record the `curVal` of every row (of a read or watch grid) that has
+        one.
+        """
+        if ts is None:
+            ts = time()
+        for row in rows:
+            ref = row.get("id")
+            if (not isinstance(ref, hszinc.Ref)) or ("curVal" not in row):
+                continue
+            self.update(ref.name, row["curVal"], ts)
+
+    def touch(self, point_ids, ts=None):
+        """
+        Mark the last values seen for some points as still current, e.g.
+        because a watch poll reported no change for them.
+        """
+        if ts is None:
+            ts = time()
+        with self._lock:
+            for point_id in point_ids:
+                ring = self._rings.get(point_id)
+                if ring is not None:
+                    ring.last_time = ts
+
+    def get(self, point_id, max_age=None, default=None):
+        """
+        Return the last value seen for a point, if it is younger than
+        `max_age` seconds.  Otherwise return `default`.  A `max_age` of 0
+        never returns a stored value.
+        """
+        if max_age is None:
+            max_age = self._max_age
+        with self._lock:
+            ring = self._rings.get(point_id)
+            if (ring is None) or ((time() - ring.last_time) >= max_age):
+                return default
+            return ring.last
+
+    def age(self, point_id):
+        """
+        Return the age in seconds of the last value seen for a point, or None
+        if none has been seen.
+        """
+        with self._lock:
+            ring = self._rings.get(point_id)
+            if ring is None:
+                return None
+            return time() - ring.last_time
+
+    def recent(self, point_id, n=None):
+        """
+        Return the last `n` numeric values of a point (all stored values if
+        `n` is None), oldest first, as a read-only NumPy array.  This is a
+        view on the store; values that are not numeric read as NaN.
+        """
+        if not HAVE_NUMPY:
+            raise NotImplementedError("numpy not available.")
+        with self._lock:
+            ring = self._rings.get(point_id)
+            if ring is None:
+                return numpy.empty(0, dtype=numpy.float64)
+            return ring.recent(ring.values, n)
+
+    def recent_times(self, point_id, n=None):
+        """
+        Return the times (seconds since epoch) that the last `n` values of a
+        point were seen, matching `recent`.
+        """
+        if not HAVE_NUMPY:
+            raise NotImplementedError("numpy not available.")
+        with self._lock:
+            ring = self._rings.get(point_id)
+            if ring is None:
+                return numpy.empty(0, dtype=numpy.float64)
+            return ring.recent(ring.times, n)
+
+    def discard(self, point_id):
+        """
+        Forget everything about a point.
+        """
+        with self._lock:
+            self._rings.pop(point_id, None)
+
+    def clear(self):
+        """
+        Forget everything.
+        """
+        with self._lock:
+            self._rings.clear()
+
+    @staticmethod
+    def _to_float(val):
+        """
+        Return the numeric form of a value, or NaN if it has none.
+        """
+        if isinstance(val, hszinc.Quantity):
+            val = getattr(val, "value", getattr(val, "magnitude", val))
+        if isinstance(val, bool):
+            return 1.0 if val else 0.0
+        if isinstance(val, string_types):
+            return float("nan")
+        try:
+            return float(val)
+        except (TypeError, ValueError):
+            return float("nan")
@@ -79,6 +79,15 @@ class EquipMixin(object):
             self._add_points()
             return self._list_of_points
 
+    def point_values(self, result_format=None, callback=None):
+        """
+        Read the current values of all the points of this equipment in as
+        few requests as possible.  See `HaystackSession.read_cur_vals`.
+        """
+        return self._session.read_cur_vals(
+            self.points, result_format=result_format, callback=callback
+        )
+
     def refresh(self):
         """
         Re-create local list of equipments
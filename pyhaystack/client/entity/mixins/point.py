@@ -43,7 +43,26 @@ class HisMixin(object):
         )
 
 
+# Marker for a current value that is missing or too old.
+_STALE = object()
+
+
 class PointMixin(object):
     @property
     def value(self):
+        """
+        Return the current value of the point.  This is answered from the
+        session's current value store if it is fresh enough, otherwise the
+        point is read from the server.
+        """
+        value = self._session.cur_vals.get(self.id.name, default=_STALE)
+        if value is not _STALE:
+            return value
         return (self._session.read(ids=self.id).result)[0]["curVal"]
+
+    def recent_values(self, n=None):
+        """
+        Return the last `n` numeric values seen for this point, oldest
+        first, as a read-only NumPy array.
+        """
+        return self._session.cur_vals.recent(self.id.name, n)
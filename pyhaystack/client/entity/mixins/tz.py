@@ -8,6 +8,9 @@ Mix-ins for entities exposing a 'tz' tag
 import hszinc
 import pytz
 
+# Resolved timezones, keyed by Project Haystack timezone name.
+_TZ_CACHE = {}
+
 
 class TzMixin(object):
     """
@@ -38,4 +41,12 @@ class TzMixin(object):
         """
         Return the timezone information (datetime.tzinfo) for this entity.
         """
-        return pytz.timezone(self.iana_tz)
+        hs_tz = self.hs_tz
+        try:
+            return _TZ_CACHE[hs_tz]
+        except KeyError:
+            pass
+
+        tz = pytz.timezone(self.iana_tz)
+        _TZ_CACHE[hs_tz] = tz
+        return tz
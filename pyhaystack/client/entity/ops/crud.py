@@ -7,6 +7,8 @@ These are state machines that perform CRUD operations on entities at a
 high-level.
 """
 
+from threading import Lock
+
 import hszinc
 import fysom
 
@@ -84,3 +86,154 @@ class EntityTagUpdateOperation(HaystackOperation):
         Return the result from the state machine.
         """
         self._done(event.result)
+
+
+class EntityTagCommitAllOperation(HaystackOperation):
+    """
+    Batched tag update state machine.  This commits the pending tag changes
+    of many entities using multi-row updates of a bounded size, then applies
+    each returned row to the entity it belongs to.  The result is a dict of
+    the entities that were updated, keyed by ID.
+
+    If any batch fails, the entities in the remaining batches are still
+    committed, and the first failure is raised once all batches are done.
+    Entities in failed batches keep their pending changes, so the commit may
+    be retried.
+    """
+
+    def __init__(self, session, entities, batch_size):
+        """
+        Initialise a commit of the given entities.
+
+        :param session: Haystack HTTP session object.
+        :param entities: Entities to commit.  Those without pending changes
+                         are skipped.
+        :param batch_size: Maximum number of entities per update request.
+        """
+        super(EntityTagCommitAllOperation, self).__init__(result_copy=False)
+        self._log = session._log.getChild("commit_all")
+        self._session = session
+
+        # Snapshot the changes to send now, so that changes made while the
+        # commit is in flight are not lost.
+        self._entities = {}
+        self._sent = {}
+        self._updates = []
+        for entity in entities:
+            tags = entity.tags
+            if not getattr(tags, "is_dirty", False):
+                continue
+            entity_id = entity.id.name
+            if entity_id in self._entities:
+                continue
+            updates = tags._tag_updates.copy()
+            updates["id"] = entity.id
+            for tag in tags._tag_deletions:
+                updates[tag] = hszinc.REMOVE
+            self._entities[entity_id] = entity
+            self._sent[entity_id] = dict(
+                (tag, val) for (tag, val) in updates.items() if tag != "id"
+            )
+            self._updates.append(updates)
+
+        self._batches = [
+            self._updates[n : n + batch_size]
+            for n in range(0, len(self._updates), batch_size)
+        ]
+        self._lock = Lock()
+        self._todo = set()
+        self._updated = {}
+        self._error = None
+
+        self._state_machine = fysom.Fysom(
+            initial="init",
+            final="done",
+            events=[
+                # Event             Current State       New State
+                ("do_update", "init", "update"),
+                ("update_done", "update", "done"),
+                ("exception", "*", "done"),
+            ],
+            callbacks={"onenterupdate": self._do_update, "onenterdone": self._do_done},
+        )
+
+    def go(self):
+        """
+        Start sending the updates.
+        """
+        self._state_machine.do_update()
+
+    def _do_update(self, event):
+        """
+        Send each batch of updates.
+        """
+        try:
+            self._todo = set(range(len(self._batches)))
+            if not self._todo:
+                self._state_machine.update_done(result={})
+                return
+
+            for idx, batch in enumerate(self._batches):
+                self._log.debug("Committing batch %d: %d entities", idx, len(batch))
+                self._session.update(
+                    batch,
+                    callback=lambda operation, idx=idx, **kw: self._on_update(
+                        operation, idx
+                    ),
+                )
+        except:  # Catch all exceptions to pass to caller.
+            self._state_machine.exception(result=AsynchronousException())
+
+    def _on_update(self, operation, idx):
+        """
+        Route the rows returned for a batch to their entities.
+        """
+        try:
+            grid = operation.result
+            for row in grid:
+                row = row.copy()
+                entity_id = row.pop("id", None)
+                entity = None
+                if isinstance(entity_id, hszinc.Ref):
+                    entity = self._entities.get(entity_id.name)
+                if entity is None:
+                    self._log.debug("Ignoring row for %s: %r", entity_id, row)
+                    continue
+
+                entity.tags._update_tags(row)
+                self._clear_sent(entity.tags, self._sent[entity_id.name])
+                with self._lock:
+                    self._updated[entity_id.name] = entity
+        except:  # Catch all exceptions to pass to caller.
+            self._log.debug("Batch %d fails", idx, exc_info=1)
+            with self._lock:
+                if self._error is None:
+                    self._error = AsynchronousException()
+
+        with self._lock:
+            self._todo.discard(idx)
+            if self._todo:
+                return
+
+        if self._error is not None:
+            self._state_machine.exception(result=self._error)
+        else:
+            self._state_machine.update_done(result=self._updated)
+
+    @staticmethod
+    def _clear_sent(tags, sent):
+        """
+        Clear the pending changes that were committed.  Tags changed again
+        while the commit was in flight keep their newer change.
+        """
+        for (tag, val) in sent.items():
+            if val is hszinc.REMOVE:
+                tags._tag_deletions.discard(tag)
+            elif (tag in tags._tag_updates) and (tags._tag_updates[tag] == val):
+                del tags._tag_updates[tag]
+
+    def _do_done(self, event):
+        """
+        Return the result from the state machine.
+        """
+        self._done(event.result)
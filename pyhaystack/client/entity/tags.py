@@ -69,10 +69,14 @@ class BaseEntityTags(object):
         """
         return self._tags[tag]
 
+    # Tags which determine the timezone of a point.
+    _TZ_TAGS = ("tz", "equipRef", "siteRef")
+
     def _update_tags(self, tags):
         """
         Update the value of given tags.
         """
+        tz_before = [self._tags.get(tag) for tag in self._TZ_TAGS]
         stale = set(self._tags.keys())
         for tag, value in tags.items():
             # The "absence" of tags is not obvious
@@ -85,6 +89,20 @@ class BaseEntityTags(object):
         for tag in stale:
             self._tags.pop(tag, None)
 
+        if tz_before != [self._tags.get(tag) for tag in self._TZ_TAGS]:
+            self._on_tz_tags_changed()
+
+    def _on_tz_tags_changed(self):
+        """
+        Invalidate any point timezones the session derived from this entity.
+        """
+        entity = self._entity()
+        if entity is None:
+            return
+        session = entity._session
+        if hasattr(session, "_invalidate_point_tz"):
+            session._invalidate_point_tz(entity._entity_id)
+
 
 class BaseMutableEntityTags(BaseEntityTags):
     """
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+History write-behind buffer.  This collects individual history samples for
+many points in memory, and pushes them to the server in large batches using
+the session's `his_write_frame` operation (which in turn uses multi-point
+hisWrite where the server supports it).
+
+Typical usage::
+
+    buf = session.his_write_buffer(max_samples=5000, flush_interval=30.0)
+    buf.add('my.point.id', datetime.datetime.now(tz=pytz.utc), 21.5)
+    # … more samples …
+    buf.close()     # Flushes anything still pending
+"""
+
+from threading import Condition, Timer
+from time import time
+
+from six import string_types
+
+from ..exception import HisWriteBufferFullError
+
+
+class HisWriteBuffer(object):
+    """
+    A write-behind buffer for history samples.  Samples are held per point
+    and flushed when either `max_samples` samples are pending, or
+    `flush_interval` seconds have elapsed since the last flush.
+    """
+
+    def __init__(
+        self,
+        session,
+        max_samples=1000,
+        flush_interval=60.0,
+        max_pending=None,
+        tz=None,
+        requeue=True,
+        on_add=None,
+        on_flushed=None,
+        on_error=None,
+        log=None,
+    ):
+        """
+        Initialise a new history write buffer.
+
+        :param session: Haystack HTTP session object.
+        :param max_samples: Number of pending samples that triggers a flush.
+        :param flush_interval: Maximum number of seconds between flushes.  If
+                               None, flushing is only triggered by size or by
+                               an explicit call to `flush`.
+        :param max_pending: Maximum number of samples that may be held
+                            (pending and in-flight) before `add` applies
+                            back-pressure.  If None, there is no limit.
+        :param tz: Timezone used to localise naive timestamps, default is UTC.
+        :param requeue: If True, samples from a failed flush are put back in
+                        the buffer for the next attempt.
+        :param on_add: Durability hook, called as on_add(point_id, ts, val)
+                       for every sample accepted into the buffer.
+        :param on_flushed: Durability hook, called as on_flushed(batch) once
+                           a batch ({point_id: {ts: val}}) has been accepted
+                           by the server.
+        :param on_error: Called as on_error(batch, operation) when a batch
+                         could not be written.
+        :param log: Logging object for reporting messages.
+        """
+        if log is None:
+            log = session._log.getChild("his_write_buffer")
+        self._log = log
+        self._session = session
+        self._max_samples = max_samples
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._tz = tz
+        self._requeue = requeue
+        self._on_add = on_add
+        self._on_flushed = on_flushed
+        self._on_error = on_error
+
+        self._cond = Condition()
+        self._pending = {}  # point_id -> {ts: val}
+        self._pending_count = 0
+        self._inflight_count = 0
+        self._last_flush = time()
+        self._timer = None
+        self._closed = False
+
+        self._schedule()
+
+    @property
+    def pending(self):
+        """
+        Return the number of samples waiting to be flushed.
+        """
+        with self._cond:
+            return self._pending_count
+
+    @property
+    def inflight(self):
+        """
+        Return the number of samples currently being written to the server.
+        """
+        with self._cond:
+            return self._inflight_count
+
+    @property
+    def is_closed(self):
+        """
+        Return true if the buffer has been closed.
+        """
+        return self._closed
+
+    def add(self, point, ts, val, block=True, timeout=None):
+        """
+        Add a single sample to the buffer.
+
+        :param point: The point entity, or its ID, to write to.
+        :param ts: Timestamp (datetime.datetime) of the sample.
+        :param val: Value of the sample.
+        :param block: If the buffer is full, wait for space.  Otherwise
+                      raise HisWriteBufferFullError straight away.
+        :param timeout: Maximum time to wait for space, in seconds.
+        """
+        self.extend(point, {ts: val}, block=block, timeout=timeout)
+
+    def extend(self, point, series, block=True, timeout=None):
+        """
+        Add several samples for a point to the buffer.  `series` may be a
+        dict mapping timestamps to values, a list of (ts, value) tuples or a
+        Pandas Series object.
+        """
+        if self._closed:
+            raise ValueError("Buffer is closed")
+
+        point_id = self._point_id(point)
+        if hasattr(series, "to_dict"):
+            series = series.to_dict()
+        if isinstance(series, dict):
+            series = list(series.items())
+        else:
+            series = list(series)
+
+        if self._max_pending is not None:
+            self._wait_for_room(len(series), block, timeout)
+
+        with self._cond:
+            point_data = self._pending.setdefault(point_id, {})
+            for ts, val in series:
+                if ts not in point_data:
+                    self._pending_count += 1
+                point_data[ts] = val
+
+            flush = (self._max_samples is not None) and (
+                self._pending_count >= self._max_samples
+            )
+
+        if self._on_add is not None:
+            for ts, val in series:
+                self._on_add(point_id, ts, val)
+
+        if flush:
+            self._log.debug("Size threshold reached, flushing")
+            self.flush()
+
+    def flush(self, callback=None):
+        """
+        Push all pending samples to the server.  Returns the write operation,
+        or None if there was nothing to write.
+        """
+        with self._cond:
+            batch = self._pending
+            count = self._pending_count
+            self._pending = {}
+            self._pending_count = 0
+            self._inflight_count += count
+            self._last_flush = time()
+
+        if not batch:
+            return None
+
+        # Collate into {ts: {point_id: val}} for his_write_frame.
+        frame = {}
+        for point_id, point_data in batch.items():
+            for ts, val in point_data.items():
+                frame.setdefault(ts, {})[point_id] = val
+
+        self._log.debug("Flushing %d samples for %d points", count, len(batch))
+
+        def _on_done(operation, **kwargs):
+            self._on_flush_done(operation, batch, count)
+
+        op = self._session.his_write_frame(frame, tz=self._tz, callback=_on_done)
+        if callback is not None:
+            if op.is_done:
+                callback(operation=op)
+            else:
+                op.done_sig.connect(callback)
+        return op
+
+    def close(self):
+        """
+        Stop the flush timer and write out anything still pending.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._session._his_buffers.discard(self)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        op = self.flush()
+        if op is not None:
+            op.wait()
+
+    # Private methods
+
+    def _point_id(self, point):
+        """
+        Return the fully qualified ID of a point as a string.
+        """
+        if isinstance(point, string_types):
+            return point
+        return self._session._obj_to_ref(point).name
+
+    def _wait_for_room(self, count, block, timeout):
+        """
+        Apply back-pressure: wait until there is room for `count` more
+        samples, flushing what we have if that will help.
+        """
+        deadline = None if timeout is None else (time() + timeout)
+        while True:
+            with self._cond:
+                used = self._pending_count + self._inflight_count
+                if (used == 0) or ((used + count) <= self._max_pending):
+                    return
+                if not block:
+                    raise HisWriteBufferFullError()
+
+                if self._pending_count == 0:
+                    # Everything is in flight, wait for it to land.
+                    remaining = None if deadline is None else (deadline - time())
+                    if (remaining is not None) and (remaining <= 0):
+                        raise HisWriteBufferFullError()
+                    self._cond.wait(remaining)
+                    continue
+
+            # Make room by pushing out what is pending.
+            op = self.flush()
+            if (op is not None) and op.is_done and op.is_failed:
+                raise HisWriteBufferFullError()
+
+    def _on_flush_done(self, operation, batch, count):
+        """
+        Handle the result of a flush.
+        """
+        try:
+            operation.result
+            failed = False
+        except:  # Catch all exceptions so we can requeue.
+            self._log.warning("Failed to flush %d samples", count, exc_info=1)
+            failed = True
+
+        with self._cond:
+            self._inflight_count -= count
+            if failed and self._requeue:
+                for point_id, point_data in batch.items():
+                    pending = self._pending.setdefault(point_id, {})
+                    for ts, val in point_data.items():
+                        # Newer samples win.
+                        if ts not in pending:
+                            pending[ts] = val
+                            self._pending_count += 1
+            self._cond.notify_all()
+
+        if failed:
+            if self._on_error is not None:
+                self._on_error(batch, operation)
+        elif self._on_flushed is not None:
+            self._on_flushed(batch)
+
+    def _schedule(self, delay=None):
+        """
+        Arm the periodic flush timer.
+        """
+        if (self._flush_interval is None) or self._closed:
+            return
+        if delay is None:
+            delay = self._flush_interval
+        self._timer = Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        """
+        Periodic flush.
+        """
+        delay = None
+        try:
+            delay = self._flush_interval - (time() - self._last_flush)
+            if delay <= 0:
+                delay = None
+                self.flush()
+        except:  # Never let the timer thread die.
+            self._log.warning("Periodic flush failed", exc_info=1)
+        finally:
+            self._schedule(delay)
@@ -10,6 +10,7 @@ from __future__ import unicode_literals
 
 import shlex
 import re
+from threading import Lock
 
 try:
     from urllib.parse import quote_plus
@@ -21,7 +22,16 @@ try:
 except ImportError:
     from urllib import basejoin as urljoin
 
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
 from .auth import AuthenticationCredentials
+from .breaker import CircuitBreaker
+from .exceptions import HTTPCircuitOpenError
+from .limit import AIMDLimit, HostLimiter
+from ...util.asyncexc import AsynchronousException
 
 
 class HTTPClient(object):
@@ -50,6 +60,14 @@ class HTTPClient(object):
         log=None,
         insecure_requests_warning=True,
         requests_session=True,
+        rate_limit=None,
+        rate_burst=None,
+        max_concurrency=None,
+        min_concurrency=1,
+        initial_concurrency=None,
+        latency_target=None,
+        circuit_threshold=None,
+        circuit_reset_timeout=30.0,
     ):
         """
         Instantiate a HTTP client instance with some default parameters.
@@ -85,6 +103,30 @@ class HTTPClient(object):
                         inclusding cookies and it is problematic with some
                         implementations like Skyspark. This flag allows to 
                         disable this Session and eliminate cookies round-trip.
+        :param rate_limit:
+                        If not None, the maximum average number of requests
+                        per second sent to each host.
+        :param rate_burst:
+                        Number of requests that may be sent at once before
+                        rate_limit applies, defaults to rate_limit.
+        :param max_concurrency:
+                        If not None, requests in progress on each host are
+                        limited to an adaptive limit of up to this many.
+        :param min_concurrency:
+                        Lowest the adaptive concurrency limit may drop to.
+        :param initial_concurrency:
+                        Starting adaptive concurrency limit, defaults to
+                        min_concurrency.
+        :param latency_target:
+                        Responses slower than this many seconds cause the
+                        adaptive concurrency limit to be cut.
+        :param circuit_threshold:
+                        If not None, after this many consecutive connection
+                        failures or time-outs, requests to that host fail at
+                        once with HTTPCircuitOpenError.
+        :param circuit_reset_timeout:
+                        Number of seconds before a request is let through
+                        to a host that was failing, to see if it is back.
         """
 
         # Stash these defaults for later.  These can be modified at any time
@@ -104,6 +146,22 @@ class HTTPClient(object):
             self.silence_insecured_warnings()
         self.requests_session = requests_session
 
+        # Per-host throttling, see the limit module.
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.initial_concurrency = initial_concurrency
+        self.latency_target = latency_target
+        self._limiters = {}
+        self._limiters_lk = Lock()
+
+        # Per-host circuit breakers, see the breaker module.
+        self.circuit_threshold = circuit_threshold
+        self.circuit_reset_timeout = circuit_reset_timeout
+        self._breakers = {}
+        self._breakers_lk = Lock()
+
     def request(
         self,
         method,
@@ -123,6 +181,7 @@ class HTTPClient(object):
         exclude_cookies=None,
         exclude_proxies=None,
         accept_status=None,
+        stream=False,
     ):
         """
         Perform a request with this client.  Most parameters here exist to either
@@ -176,6 +235,9 @@ class HTTPClient(object):
                         If not None, this gives a list of status codes that
                         will not raise an error, but instead be passed through
                         for the Haystack client to handle.
+        :param stream:  If True, the body of the response is given as a
+                        file-like object to be read as it arrives, rather
+                        than as bytes.  Not all clients support this.
         """
         # Is this an absolute URL?
         if not self.PROTO_RE.match(uri):
@@ -248,20 +310,120 @@ class HTTPClient(object):
                 cookies,
                 body,
             )
-        self._request(
-            method=method,
-            uri=uri,
-            callback=callback,
-            body=body,
-            headers=headers,
-            cookies=cookies,
-            auth=auth,
-            timeout=timeout,
-            proxies=proxies,
-            tls_verify=tls_verify,
-            tls_cert=tls_cert,
-            accept_status=accept_status,
-        )
+        # Fail fast if the host is known to be down.
+        breaker = self.get_breaker(uri)
+        if breaker is not None:
+            try:
+                breaker.check()
+            except HTTPCircuitOpenError:
+                callback(AsynchronousException())
+                return
+            callback = breaker.wrap(callback)
+
+        # Only passed when needed, for clients that do not support it.
+        extra = {"stream": True} if stream else {}
+
+        def _start(done=None):
+            def _callback(response):
+                if done is not None:
+                    done(response)
+                callback(response)
+
+            try:
+                self._request(
+                    method=method,
+                    uri=uri,
+                    callback=_callback,
+                    body=body,
+                    headers=headers,
+                    cookies=cookies,
+                    auth=auth,
+                    timeout=timeout,
+                    proxies=proxies,
+                    tls_verify=tls_verify,
+                    tls_cert=tls_cert,
+                    accept_status=accept_status,
+                    **extra
+                )
+            except:
+                if done is None:
+                    raise
+                # Queued requests may start on another thread, so report
+                # failures through the callback.
+                _callback(AsynchronousException())
+
+        limiter = self.get_limiter(uri)
+        if limiter is None:
+            _start()
+        else:
+            limiter.submit(_start)
+
+    def get_limiter(self, uri):
+        """
+        Return the HostLimiter for the host of a URI, or None if requests
+        are not throttled.
+        """
+        if (self.rate_limit is None) and (self.max_concurrency is None):
+            return None
+
+        host = urlparse(uri).netloc
+        with self._limiters_lk:
+            try:
+                return self._limiters[host]
+            except KeyError:
+                pass
+
+            if self.max_concurrency is not None:
+                concurrency = AIMDLimit(
+                    initial=self.initial_concurrency,
+                    minimum=self.min_concurrency,
+                    maximum=self.max_concurrency,
+                    latency_target=self.latency_target,
+                )
+            else:
+                concurrency = None
+            limiter = HostLimiter(
+                rate=self.rate_limit,
+                burst=self.rate_burst,
+                concurrency=concurrency,
+                log=self.log,
+            )
+            self._limiters[host] = limiter
+            return limiter
+
+    def get_breaker(self, uri):
+        """
+        Return the CircuitBreaker for the host of a URI, or None if circuit
+        breaking is disabled.
+        """
+        if self.circuit_threshold is None:
+            return None
+
+        host = urlparse(uri).netloc
+        with self._breakers_lk:
+            try:
+                return self._breakers[host]
+            except KeyError:
+                pass
+
+            breaker = CircuitBreaker(
+                host,
+                threshold=self.circuit_threshold,
+                reset_timeout=self.circuit_reset_timeout,
+                log=self.log,
+            )
+            self._breakers[host] = breaker
+            return breaker
+
+    @property
+    def circuit_status(self):
+        """
+        Return the status of the circuit breaker for each host contacted,
+        as a dict of host to the breaker's status dict.
+        """
+        with self._breakers_lk:
+            breakers = list(self._breakers.values())
+        return dict((breaker.host, breaker.get_status()) for breaker in breakers)
 
     def get(self, uri, callback, **kwargs):
         """
@@ -327,6 +489,7 @@ class HTTPClient(object):
         tls_verify,
         tls_cert,
         accept_status,
+        stream=False,
     ):
         """
         Perform a HTTP request using the underlying implementation.  This is
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Per-host circuit breaker.  When a host goes offline, every request sent to
+it waits out the full time-out before failing.  A CircuitBreaker counts
+consecutive connection failures and time-outs to a host; once `threshold`
+is reached, it "opens" and requests to that host fail at once with
+HTTPCircuitOpenError instead of being sent.
+
+After `reset_timeout` seconds, the breaker is "half-open": one request is
+let through as a probe.  If the host answers (with any status), the breaker
+closes and requests flow again, otherwise it opens for another
+`reset_timeout` seconds.  This is configured through the HTTP client
+arguments, e.g.::
+
+    session = pyhaystack.connect(..., http_args={
+        'circuit_threshold': 3, 'circuit_reset_timeout': 60.0})
+"""
+
+from threading import Lock
+from time import time
+
+from .exceptions import HTTPCircuitOpenError, HTTPConnectionError
+from ...util.asyncexc import AsynchronousException
+
+# Breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker(object):
+    """
+    Tracks whether a single host is reachable.
+    """
+
+    def __init__(self, host, threshold=5, reset_timeout=30.0, log=None):
+        """
+        :param host: Host name (and port), used in messages.
+        :param threshold: Number of consecutive connection failures that
+                          open the breaker.
+        :param reset_timeout: Number of seconds the breaker stays open before
+                              a probe request is let through.
+        :param log: Logging object for reporting messages.
+        """
+        self.host = host
+        self.threshold = max(1, threshold)
+        self.reset_timeout = reset_timeout
+        self._log = log
+        self._lock = Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probe_at = None
+
+    @property
+    def state(self):
+        """
+        Return the state of the breaker: "closed", "open" or "half-open".
+        """
+        with self._lock:
+            if (self._state == OPEN) and (self._retry_in(time()) <= 0):
+                return HALF_OPEN
+            return self._state
+
+    @property
+    def failures(self):
+        """
+        Return the number of consecutive connection failures.
+        """
+        return self._failures
+
+    @property
+    def opened_at(self):
+        """
+        Return when the breaker last opened, or None if it is closed.
+        """
+        return self._opened_at
+
+    def get_status(self):
+        """
+        Return a dict describing the breaker, for monitoring.
+        """
+        with self._lock:
+            now = time()
+            state = self._state
+            if (state == OPEN) and (self._retry_in(now) <= 0):
+                state = HALF_OPEN
+            return {
+                "state": state,
+                "failures": self._failures,
+                "opened_at": self._opened_at,
+                "retry_in": self._retry_in(now) if state == OPEN else 0.0,
+            }
+
+    def check(self):
+        """
+        Raise HTTPCircuitOpenError if a request may not be sent now.  In the
+        half-open state, only one probe request is permitted at a time.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return
+
+            now = time()
+            retry_in = self._retry_in(now)
+            if retry_in > 0:
+                raise HTTPCircuitOpenError(
+                    "Circuit open for %s, retry in %.1f seconds" % (self.host, retry_in)
+                )
+
+            # Let a probe through.  If it never reports back, another is
+            # permitted once reset_timeout passes again.
+            self._state = HALF_OPEN
+            self._probe_at = now
+
+        if self._log is not None:
+            self._log.info("Probing %s", self.host)
+
+    def record(self, response):
+        """
+        Record the outcome of a request: a response, or an
+        AsynchronousException.
+        """
+        failed = isinstance(response, AsynchronousException) and isinstance(
+            response.exception, HTTPConnectionError
+        )
+        if failed and isinstance(response.exception, HTTPCircuitOpenError):
+            # Not a real attempt.
+            return
+
+        with self._lock:
+            previous = self._state
+            if not failed:
+                self._state = CLOSED
+                self._failures = 0
+                self._opened_at = None
+                self._probe_at = None
+            else:
+                self._failures += 1
+                if (previous == HALF_OPEN) or (self._failures >= self.threshold):
+                    self._state = OPEN
+                    self._opened_at = time()
+                    self._probe_at = None
+            state = self._state
+
+        if (self._log is not None) and (state != previous):
+            if state == OPEN:
+                self._log.warning(
+                    "%s unreachable after %d attempts, failing requests for "
+                    "%.1f seconds",
+                    self.host,
+                    self._failures,
+                    self.reset_timeout,
+                )
+            else:
+                self._log.info("%s reachable again", self.host)
+
+    def wrap(self, callback):
+        """
+        Return a callback that records the outcome of a request before
+        passing it to `callback`.
+        """
+
+        def _callback(response):
+            self.record(response)
+            callback(response)
+
+        return _callback
+
+    def _retry_in(self, now):
+        """
+        Return the number of seconds until a request may be sent.
+        """
+        if self._state == CLOSED:
+            return 0.0
+        if self._state == HALF_OPEN:
+            # A probe is in progress.
+            return self._probe_at + self.reset_timeout - now
+        return self._opened_at + self.reset_timeout - now
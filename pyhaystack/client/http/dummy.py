@@ -3,6 +3,8 @@
 Asynchronous Dummy HTTP client.
 """
 
+from io import BytesIO
+
 from .base import HTTPClient, HTTPResponse
 from .auth import BasicAuthenticationCredentials, DigestAuthenticationCredentials
 from .exceptions import (
@@ -47,6 +49,7 @@ class DummyHttpServer(object):
         tls_verify,
         tls_cert,
         accept_status,
+        stream=False,
     ):
         """
         Submit a request.
@@ -68,6 +71,7 @@ class DummyHttpServer(object):
             tls_verify,
             tls_cert,
             accept_status,
+            stream,
         )
         self._requests[rq_id] = rq
         self._rq_order.append(rq_id)
@@ -120,6 +124,7 @@ class DummyHttpClient(HTTPClient):
         tls_verify,
         tls_cert,
         accept_status,
+        stream=False,
     ):
         self._server.submit_request(
             method,
@@ -134,6 +139,7 @@ class DummyHttpClient(HTTPClient):
             tls_verify,
             tls_cert,
             accept_status,
+            stream,
         )
 
 
@@ -160,6 +166,7 @@ class DummyHttpClientRequest(object):
         tls_verify,
         tls_cert,
         accept_status,
+        stream=False,
     ):
         """
         Collect all the parameters supplied in the request.
@@ -177,6 +184,7 @@ class DummyHttpClientRequest(object):
         self._tls_verify = tls_verify
         self._tls_cert = tls_cert
         self._accept_status = accept_status
+        self._stream = stream
 
     # Access methods
 
@@ -254,6 +262,10 @@ class DummyHttpClientRequest(object):
         if ((self._accept_status is None) and (status < 400)) or (
             status in self._accept_status
         ):
+            if self._stream:
+                if not isinstance(content, bytes):
+                    content = content.encode("utf-8")
+                content = BytesIO(content)
             result = HTTPResponse(status, headers.copy(), content, cookies.copy())
         else:
             try:
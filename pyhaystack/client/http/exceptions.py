@@ -28,6 +28,15 @@ class HTTPTimeoutError(HTTPConnectionError):
     pass
 
 
+class HTTPCircuitOpenError(HTTPConnectionError):
+    """
+    Error class to represent that a request was not sent, as recent attempts
+    to connect to the host have failed.
+    """
+
+    pass
+
+
 class HTTPRedirectError(HTTPBaseError):
     """
     Error class to represent that the server's redirections are looping.
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Client-side request throttling.  Some servers (e.g. older Niagara JACEs) fall
+over if sent more than a few requests at once, while others happily take
+hundreds.  A HostLimiter sits in front of a single host and applies:
+
+- a token bucket rate limit: at most `rate` requests a second on average,
+  with bursts of up to `burst` requests;
+- an adaptive concurrency limit, adjusted by AIMD (additive increase,
+  multiplicative decrease): the limit grows by one request for each
+  limit's worth of timely responses, and is cut whenever the server answers
+  429 (Too Many Requests) or 503 (Service Unavailable), times out, or takes
+  longer than `latency_target` to respond.
+
+Requests over either limit are queued, not refused, and are started (from
+whichever thread releases capacity, or from a timer) as soon as they may.
+These are configured through the HTTP client arguments, e.g.::
+
+    session = pyhaystack.connect(..., http_args={
+        'rate_limit': 20.0, 'max_concurrency': 16, 'latency_target': 2.0})
+"""
+
+from collections import deque
+from threading import Lock, Timer
+from time import time
+
+from .exceptions import HTTPStatusError, HTTPTimeoutError
+from ...util.asyncexc import AsynchronousException
+
+# Status codes taken to mean the server is overloaded.
+OVERLOAD_STATUS = (429, 503)
+
+
+class TokenBucket(object):
+    """
+    A token bucket holding up to `burst` tokens, refilled at `rate` tokens
+    per second.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.burst
+        self._last = time()
+
+    def take(self, now=None):
+        """
+        Take a token.  Returns 0 if one was available, otherwise the number
+        of seconds until one will be.
+        """
+        if now is None:
+            now = time()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self.rate
+
+
+class AIMDLimit(object):
+    """
+    An adaptive concurrency limit.
+    """
+
+    def __init__(
+        self,
+        initial=None,
+        minimum=1,
+        maximum=64,
+        latency_target=None,
+        backoff=0.5,
+    ):
+        """
+        :param initial: Starting limit, defaults to `minimum`.
+        :param minimum: Lowest the limit may be cut to.
+        :param maximum: Highest the limit may grow to.
+        :param latency_target: Responses slower than this many seconds count
+                               as a sign of overload.  None to disable.
+        :param backoff: Factor the limit is multiplied by on overload.
+        """
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self._limit = float(initial if initial is not None else self.minimum)
+        self._limit = min(self.maximum, max(self.minimum, self._limit))
+        self._last_cut = 0.0
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def update(self, started, latency, overloaded):
+        """
+        Adjust the limit given the outcome of a request.
+
+        :param started: When the request was started.
+        :param latency: How long it took, in seconds.
+        :param overloaded: Whether the server reported overload.
+        """
+        if (self.latency_target is not None) and (latency > self.latency_target):
+            overloaded = True
+
+        if overloaded:
+            # Cut once per round of requests: those already in flight when
+            # the limit was last cut do not cut it again.
+            if started >= self._last_cut:
+                self._limit = max(self.minimum, self._limit * self.backoff)
+                self._last_cut = time()
+        else:
+            self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+
+
+class HostLimiter(object):
+    """
+    Throttles the requests made to a single host.
+    """
+
+    def __init__(self, rate=None, burst=None, concurrency=None, log=None):
+        """
+        :param rate: Maximum average requests per second, or None.
+        :param burst: Token bucket size, defaults to `rate`.
+        :param concurrency: An AIMDLimit, or None for no concurrency limit.
+        :param log: Logging object for reporting messages.
+        """
+        self._bucket = TokenBucket(rate, burst) if rate else None
+        self._concurrency = concurrency
+        self._log = log
+        self._lock = Lock()
+        self._queue = deque()
+        self._in_flight = 0
+        self._timer = None
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    @property
+    def limit(self):
+        """
+        Return the current concurrency limit, or None if there is none.
+        """
+        if self._concurrency is None:
+            return None
+        return self._concurrency.limit
+
+    def submit(self, start):
+        """
+        Start a request now, or queue it until the limits permit.  `start` is
+        called with a `done` function, which the request must call with its
+        response (or AsynchronousException) once it finishes.
+        """
+        with self._lock:
+            self._queue.append(start)
+        self._dispatch()
+
+    def _dispatch(self):
+        """
+        Start as many queued requests as the limits allow.
+        """
+        while True:
+            with self._lock:
+                if not self._queue or (self._timer is not None):
+                    return
+                if (self._concurrency is not None) and (
+                    self._in_flight >= self._concurrency.limit
+                ):
+                    return
+                if self._bucket is not None:
+                    delay = self._bucket.take()
+                    if delay > 0:
+                        self._timer = Timer(delay, self._on_timer)
+                        self._timer.daemon = True
+                        self._timer.start()
+                        return
+                start = self._queue.popleft()
+                self._in_flight += 1
+
+            self._run(start)
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+        self._dispatch()
+
+    def _run(self, start):
+        started = time()
+        finished = []
+
+        def _done(response):
+            if finished:
+                return
+            finished.append(True)
+            self._on_done(started, response)
+
+        try:
+            start(_done)
+        except:
+            # The request could not even be started: free its slot.
+            if not finished:
+                finished.append(True)
+                with self._lock:
+                    self._in_flight -= 1
+            raise
+
+    def _on_done(self, started, response):
+        """
+        Record the outcome of a request, then start any that are waiting.
+        """
+        latency = time() - started
+        overloaded = is_overload(response)
+        with self._lock:
+            self._in_flight -= 1
+            if self._concurrency is not None:
+                self._concurrency.update(started, latency, overloaded)
+        if overloaded and (self._log is not None):
+            self._log.debug("Server overloaded, concurrency limit now %s", self.limit)
+        self._dispatch()
+
+
+def is_overload(response):
+    """
+    Return whether a response (or AsynchronousException) indicates that the
+    server is overloaded.
+    """
+    if isinstance(response, AsynchronousException):
+        exception = response.exception
+        if isinstance(exception, HTTPTimeoutError):
+            return True
+        if isinstance(exception, HTTPStatusError):
+            return exception.status in OVERLOAD_STATUS
+        return False
+    return getattr(response, "status_code", None) in OVERLOAD_STATUS
@@ -43,6 +43,7 @@ class SyncHttpClient(HTTPClient):
         tls_verify,
         tls_cert,
         accept_status,
+        stream=False,
     ):
 
         if auth is not None:
@@ -70,6 +71,7 @@ class SyncHttpClient(HTTPClient):
                         proxies=proxies,
                         verify=tls_verify,
                         cert=tls_cert,
+                        stream=stream,
                     )
 
                     if (accept_status is None) or (
@@ -115,10 +117,17 @@ class SyncHttpClient(HTTPClient):
                 # TODO: handle this with a more specific exception
                 raise HTTPBaseError(e.message)
 
+            if stream:
+                # Hand over the raw stream, undoing any transfer encoding.
+                response.raw.decode_content = True
+                body = response.raw
+            else:
+                body = response.content
+
             result = HTTPResponse(
                 response.status_code,
                 dict(response.headers),
-                response.content,
+                body,
                 dict(response.cookies),
             )
         except Exception as e:
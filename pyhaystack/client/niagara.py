@@ -5,6 +5,7 @@ Tridium Niagara Client support (AX and N4)
 """
 
 from .session import HaystackSession
+from .http.auth import BasicAuthenticationCredentials
 from .ops.vendor.niagara import NiagaraAXAuthenticateOperation
 from .ops.vendor.niagara_scram import Niagara4ScramAuthenticateOperation
 from .mixins.vendor.niagara.bql import BQLOperation, BQLMixin
@@ -35,6 +36,7 @@ class NiagaraHaystackSession(HaystackSession, BQLMixin, EncodingMixin):
         self._username = username
         self._password = password
         self._authenticated = False
+        self._pre_auth = None
         self._uri = uri
 
     @property
@@ -65,7 +67,28 @@ class NiagaraHaystackSession(HaystackSession, BQLMixin, EncodingMixin):
         finally:
             self._auth_op = None
 
+    def _import_state(self, state):
+        """
+        Resume a saved session.  AX authenticates every request, so the Basic
+        credentials are rebuilt from this session's own user name and
+        password rather than being saved with the cookies.
+        """
+        super(NiagaraHaystackSession, self)._import_state(state)
+        if state is None:
+            self._client.auth = self._pre_auth
+            self._pre_auth = None
+        else:
+            self._pre_auth = self._client.auth
+            self._client.auth = BasicAuthenticationCredentials(
+                self._username, self._password
+            )
+        self._authenticated = state is not None
+
     def logout(self):
+        self._close_his_buffers()
+        self._close_watch_managers()
+        self._discard_state()
+
         def callback(response):
             try:
                 status_code = response.status_code
@@ -133,7 +156,15 @@ class Niagara4HaystackSession(HaystackSession, BQLMixin, EncodingMixin):
         finally:
             self._auth_op = None
 
+    def _import_state(self, state):
+        super(Niagara4HaystackSession, self)._import_state(state)
+        self._authenticated = state is not None
+
     def logout(self):
+        self._close_his_buffers()
+        self._close_watch_managers()
+        self._discard_state()
+
         def callback(response):
             try:
                 status_code = response.status_code
@@ -49,37 +49,7 @@ class EntityRetrieveOperation(state.HaystackOperation):
                 raise
 
             self._log.debug("Received grid: %s", grid)
-
-            # Iterate over each row:
-            for row in grid:
-                # Ignore rows that don't specify an ID.
-                if "id" not in row:
-                    continue
-
-                row = row.copy()
-                entity_ref = row.pop("id")
-
-                # This entity does not exist
-                if entity_ref is None:
-                    continue
-
-                entity_id = entity_ref.name
-
-                try:
-                    entity = self._entities[entity_id]
-                    entity._update_tags(row)
-                except KeyError:
-                    try:
-                        entity = self._session._entities[entity_id]
-                        entity._update_tags(row)
-                    except KeyError:
-                        entity = self._session._tagging_model.create_entity(
-                            entity_id, row
-                        )
-
-                # Stash/update entity references.
-                self._session._entities[entity_id] = entity
-                self._entities[entity_id] = entity
+            self._store_rows(grid)
 
             if self._single:
                 try:
@@ -92,6 +62,39 @@ class EntityRetrieveOperation(state.HaystackOperation):
         except:  # Catch all exceptions to pass to caller.
             self._state_machine.exception(result=AsynchronousException())
 
+    def _store_rows(self, grid):
+        """
+        Create or update the entities described by the rows of a grid.
+        """
+        # Iterate over each row:
+        for row in grid:
+            # Ignore rows that don't specify an ID.
+            if "id" not in row:
+                continue
+
+            row = row.copy()
+            entity_ref = row.pop("id")
+
+            # This entity does not exist
+            if entity_ref is None:
+                continue
+
+            entity_id = entity_ref.name
+
+            try:
+                entity = self._entities[entity_id]
+                entity._update_tags(row)
+            except KeyError:
+                try:
+                    entity = self._session._entities[entity_id]
+                    entity._update_tags(row)
+                except KeyError:
+                    entity = self._session._tagging_model.create_entity(entity_id, row)
+
+            # Stash/update entity references.
+            self._session._entities[entity_id] = entity
+            self._entities[entity_id] = entity
+
     def _do_done(self, event):
         """
         Return the result from the state machine.
@@ -13,6 +13,7 @@ from ...util import state
 from ...exception import HaystackError, AuthenticationProblem
 from ...util.asyncexc import AsynchronousException
 from six import string_types
+from threading import Timer
 from time import time
 
 
@@ -32,7 +33,16 @@ class BaseAuthOperation(state.HaystackOperation):
     A base class authentication operations.
     """
 
-    def __init__(self, session, uri, retries=2, cache=False):
+    def __init__(
+        self,
+        session,
+        uri,
+        retries=2,
+        cache=False,
+        cache_key=None,
+        cache_expiry=None,
+        idempotent=True,
+    ):
         """
         Initialise a request for the authenticating with the given URI and arguments.
 
@@ -44,16 +54,31 @@ class BaseAuthOperation(state.HaystackOperation):
         :param retries: Number of retries permitted in case of failure.
         :param cache: Whether or not to cache this result.  If True, the
                       result is cached by the session object.
+        :param cache_key: Name of the key to use when the object is cached.
+        :param cache_expiry: How long (in seconds) to cache the result, if
+                             not the session's default.
+        :param idempotent: Whether the request may safely be repeated if it
+                           fails.  The session's retry policy decides which
+                           failures are retried.
         """
 
         super(BaseAuthOperation, self).__init__()
 
         self._retries = retries
+        self._idempotent = idempotent
+        self._attempt = 0
+        self._started = False
         self._session = session
         self._uri = uri
         self._headers = {}
 
         self._cache = cache
+        if cache and (cache_key is None):
+            cache_key = uri
+        self._cache_key = cache_key
+        if cache_expiry is None:
+            cache_expiry = session._grid_expiry
+        self._cache_expiry = cache_expiry
 
         self._state_machine = fysom.Fysom(
             initial="init",
@@ -87,6 +112,11 @@ class BaseAuthOperation(state.HaystackOperation):
         """
         Start the request.
         """
+        if not self._started:
+            self._started = True
+            policy = getattr(self._session, "_retry_policy", None)
+            if policy is not None:
+                policy.note_request()
         self._check_auth()
 
     def _check_auth(self, *args):
@@ -121,23 +151,106 @@ class BaseAuthOperation(state.HaystackOperation):
 
     def _do_check_cache(self, event):
         """
-        Implement if needed
+        See if there's cache for this result.
         """
-        self._state_machine.cache_miss()  # Nope
-        return
+        if not self._cache:
+            self._state_machine.cache_miss()  # Nope
+            return
+
+        # Initialise data
+        op = None
+        grid = None
+        expiry = 0.0
+
+        with self._session._grid_lk:
+            try:
+                (op, expiry, grid) = self._session._grid_cache[self._cache_key]
+            except KeyError:
+                # Not in cache
+                pass
+
+            if (grid is not None) and (expiry <= time()):
+                # Expired.
+                grid = None
+
+            if (grid is None) and ((op is None) or (op is self) or op.is_done):
+                # We have a cache miss, and nobody is fetching it.
+                op = self
+                self._session._grid_cache[self._cache_key] = (op, expiry, grid)
+
+        if grid is not None:
+            self._state_machine.cache_hit(result=grid)
+            return
+
+        if op is self:
+            # We're it, go and get it.
+            self._state_machine.cache_miss()
+        else:
+            # Wait for that state machine to finish and proxy its result.
+            proxied = []
+
+            def _proxy(operation, **kwargs):
+                with self._session._grid_lk:
+                    if proxied:
+                        return
+                    proxied.append(operation)
+
+                try:
+                    res = operation.result
+                except:
+                    self._state_machine.exception(result=AsynchronousException())
+                    return
+
+                self._state_machine.cache_hit(result=res)
+
+            op.done_sig.connect(_proxy)
+            if op.is_done:
+                # It finished before we started listening.
+                _proxy(op)
+
+    def _store_cache(self, result):
+        """
+        Cache the result, if caching is enabled.
+        """
+        if self._cache:
+            with self._session._grid_lk:
+                self._session._grid_cache[self._cache_key] = (
+                    None,
+                    time() + self._cache_expiry,
+                    result,
+                )
 
     def _on_response(self, response):
         raise NotImplementedError()
 
     def _do_fail_retry(self, event):
         """
-        Determine whether we retry or fail outright.
+        Determine whether we retry or fail outright.  The session's retry
+        policy decides if the failure is worth retrying, and how long to
+        wait first.
         """
+        error = getattr(event, "result", None)
+        delay = None
         if self._retries > 0:
-            self._retries -= 1
-            self._state_machine.retry()
+            policy = getattr(self._session, "_retry_policy", None)
+            if policy is None:
+                delay = 0.0
+            else:
+                delay = policy.get_delay(error, self._attempt, self._idempotent)
+
+        if delay is None:
+            self._state_machine.abort(result=error)
+            return
+
+        self._retries -= 1
+        self._attempt += 1
+        if delay > 0:
+            self._log.debug("Retrying in %.2f seconds", delay)
+            timer = Timer(delay, self._state_machine.retry)
+            timer.daemon = True
+            timer.start()
         else:
-            self._state_machine.abort(result=event.result)
+            self._state_machine.retry()
 
     def _do_auth_failed(self, event):
         """
@@ -171,9 +284,11 @@ class BaseGridOperation(BaseAuthOperation):
         retries=2,
         cache=False,
         cache_key=None,
+        cache_expiry=None,
         accept_status=None,
         headers=None,
         exclude_cookies=None,
+        idempotent=True,
     ):
         """
         Initialise a request for the grid with the given URI and arguments.
@@ -194,15 +309,25 @@ class BaseGridOperation(BaseAuthOperation):
         :param cache: Whether or not to cache this result.  If True, the
                       result is cached by the session object.
         :param cache_key: Name of the key to use when the object is cached.
+        :param cache_expiry: How long (in seconds) to cache the result, if
+                             not the session's default.
         :param accept_status: What status codes to accept, in addition to the
                             usual ones?
         :param exclude_cookies:
                         If True, exclude all default cookies and use only
                         the cookies given.  Otherwise, this is an iterable
                         of cookie names to be excluded.
+        :param idempotent: Whether the request may safely be repeated.
         """
 
-        super(BaseGridOperation, self).__init__(session, uri)
+        super(BaseGridOperation, self).__init__(
+            session,
+            uri,
+            cache=cache,
+            cache_key=cache_key,
+            cache_expiry=cache_expiry,
+            idempotent=idempotent,
+        )
         if args is not None:
             # Convert scalars to strings
             args = dict(
@@ -228,11 +353,6 @@ class BaseGridOperation(BaseAuthOperation):
         self._accept_status = accept_status
         self._exclude_cookies = exclude_cookies
 
-        self._cache = cache
-        if cache and (cache_key is None):
-            cache_key = uri
-        self._cache_key = cache_key
-
         if expect_format == hszinc.MODE_ZINC:
             self._headers[b"Accept"] = "text/zinc"
         elif expect_format == hszinc.MODE_JSON:
@@ -242,52 +362,6 @@ class BaseGridOperation(BaseAuthOperation):
                 "expect_format must be one onf hszinc.MODE_ZINC " "or hszinc.MODE_JSON"
             )
 
-    def _do_check_cache(self, event):
-        """
-        See if there's cache for this grid.
-        """
-        if not self._cache:
-            self._state_machine.cache_miss()  # Nope
-            return
-
-        # Initialise data
-        op = None
-        grid = None
-        expiry = 0.0
-
-        with self._session._grid_lk:
-            try:
-                (op, expiry, grid) = self._session._grid_cache[self._cache_key]
-            except KeyError:
-                # Not in cache
-                pass
-
-            if (grid is None) or (expiry <= time()):
-                # We have a cache miss.
-                op = self
-                grid = None
-                self._session._grid_cache[self._cache_key] = (op, expiry, grid)
-
-        if grid is not None:
-            self._state_machine.cache_hit(result=grid)
-            return
-
-        if op is self:
-            # We're it, go and get it.
-            self._state_machine.cache_miss()
-        else:
-            # Wait for that state machine to finish and proxy its result.
-            def _proxy(op):
-                try:
-                    res = op.result
-                except:
-                    self._state_machine.exception(AsynchronousException())
-                    return
-
-                self._state_machine.cache_hit(res)
-
-            op.done_sig.connect(_proxy)
-
     def _on_response(self, response):
         """
         Process the response given back by the HTTP server.
@@ -345,13 +419,7 @@ class BaseGridOperation(BaseAuthOperation):
                 decoded = decoded[0]
 
             # If we get here, then the request itself succeeded.
-            if self._cache:
-                with self._session._grid_lk:
-                    self._session._grid_cache[self._cache_key] = (
-                        None,
-                        time() + self._session._grid_expiry,
-                        decoded,
-                    )
+            self._store_cache(decoded)
             self._state_machine.response_ok(result=decoded)
         except:  # Catch all exceptions for the caller.
             self._log.debug("Parse fails", exc_info=1)
@@ -406,6 +474,11 @@ class PostGridOperation(BaseGridOperation):
     read back a ZINC grid.
     """
 
+    # Operations that only read, and so may be safely repeated.
+    IDEMPOTENT_OPS = frozenset(
+        ["about", "formats", "ops", "read", "nav", "hisRead", "watchPoll"]
+    )
+
     def __init__(
         self, session, uri, grid, args=None, post_format=hszinc.MODE_ZINC, **kwargs
     ):
@@ -416,16 +489,21 @@ class PostGridOperation(BaseGridOperation):
         :param session: Haystack HTTP session object.
         :param uri: Possibly partial URI relative to the server base address
                     to perform a query.  No arguments shall be given here.
-        :param grid: Grid (or grids) to be posted to the server.
+        :param grid: Grid (or grids) to be posted to the server, or the
+                     grid already encoded (as bytes) in `post_format`.
         :param post_format: What format to post grids in?
         :param args: Dictionary of key-value pairs to be given as arguments.
         """
         self._log = session._log.getChild("post_grid.%s" % uri)
+        kwargs.setdefault("idempotent", uri in self.IDEMPOTENT_OPS)
         super(PostGridOperation, self).__init__(
             session=session, uri=uri, args=args, **kwargs
         )
         # Convert the grids to their native format
-        self._body = hszinc.dump(grid, mode=post_format).encode("utf-8")
+        if isinstance(grid, bytes):
+            self._body = grid
+        else:
+            self._body = hszinc.dump(grid, mode=post_format).encode("utf-8")
         if post_format == hszinc.MODE_ZINC:
             self._content_type = "text/zinc"
         else:
@@ -17,7 +17,8 @@ from ...util import state
 from ...util.asyncexc import AsynchronousException
 
 try:
-    from pandas import Series, DataFrame
+    from pandas import Series, DataFrame, DatetimeIndex, to_datetime
+    import numpy
 
     HAVE_PANDAS = True
 except ImportError:  # pragma: no cover
@@ -39,6 +40,37 @@ def _resolve_tz(tz):
             return hszinc.zoneinfo.timezone(tz)
 
 
+def _to_datetime_index(timestamps, tz=None):
+    """
+    Convert a sequence of timezone-aware timestamps to a pandas DatetimeIndex
+    in a single vectorised operation, translating them to `tz`.  If `tz` is
+    None, the timezone of the first timestamp is used.
+    """
+    index = to_datetime(list(timestamps), utc=True)
+    if (tz is None) and len(timestamps):
+        tz = timestamps[0].tzinfo
+    if tz is not None:
+        index = index.tz_convert(tz)
+    return index
+
+
+def _localise_index(index, tz):
+    """
+    Localise (if naive) or convert (if timezone-aware) a whole pandas
+    DatetimeIndex to the timezone `tz` in one operation.  Ambiguous and
+    non-existent local times are handled like pytz's `localize` does by
+    default: standard time is assumed.
+    """
+    index = DatetimeIndex(index)
+    if index.tz is None:
+        return index.tz_localize(
+            tz,
+            ambiguous=numpy.zeros(len(index), dtype=bool),
+            nonexistent="shift_forward",
+        )
+    return index.tz_convert(tz)
+
+
 class HisReadSeriesOperation(state.HaystackOperation):
     """
     Read the series data from a 'point' entity and present it in a concise
@@ -117,7 +149,8 @@ class HisReadSeriesOperation(state.HaystackOperation):
             operation.wait
             grid = operation.result
 
-            if self._tz is None:
+            if (self._tz is None) or (self._series_format == self.FORMAT_SERIES):
+                # Series timestamps are converted in one go below.
                 conv_ts = lambda ts: ts
             else:
                 conv_ts = lambda ts: ts.astimezone(self._tz)
@@ -147,6 +180,8 @@ class HisReadSeriesOperation(state.HaystackOperation):
                                 continue
                     else:
                         values = data
+                    if self._tz is not None:
+                        index = _to_datetime_index(index, self._tz)
                 except ValueError:
                     values = []
                     index = []
@@ -269,6 +304,15 @@ class HisReadFrameOperation(state.HaystackOperation):
             self._log.debug("No multi-his-read support, emulating")
             self._state_machine.do_single_read()
 
+    def _get_conv_ts(self):
+        """
+        Return the function used to translate timestamps of each row.  Data
+        frame indexes are translated in one go during post-processing.
+        """
+        if (self._tz is None) or (self._frame_format == self.FORMAT_FRAME):
+            return lambda ts: ts
+        return lambda ts: ts.astimezone(self._tz)
+
     def _get_ts_rec(self, ts):
         try:
             return self._data_by_ts[ts]
@@ -293,11 +337,7 @@ class HisReadFrameOperation(state.HaystackOperation):
         """
         try:
             grid = operation.result
-
-            if self._tz is None:
-                conv_ts = lambda ts: ts
-            else:
-                conv_ts = lambda ts: ts.astimezone(self._tz)
+            conv_ts = self._get_conv_ts()
 
             for row in grid:
                 ts = conv_ts(row["ts"])
@@ -330,17 +370,14 @@ class HisReadFrameOperation(state.HaystackOperation):
         self._log.debug("Response back for column %s", col)
         try:
             grid = operation.result
-
-            if self._tz is None:
-                conv_ts = lambda ts: ts
-            else:
-                conv_ts = lambda ts: ts.astimezone(self._tz)
+            conv_ts = self._get_conv_ts()
 
             self._log.debug("%d records for %s: %s", len(grid), col, grid)
             for row in grid:
                 ts = conv_ts(row["ts"])
                 if self._tz is None:
                     self._tz = ts.tzinfo
+                    conv_ts = self._get_conv_ts()
 
                 rec = self._get_ts_rec(ts)
                 val = row.get("val")
@@ -374,6 +411,8 @@ class HisReadFrameOperation(state.HaystackOperation):
             elif self._frame_format == self.FORMAT_FRAME:
                 # Build from dict
                 data = MetaDataFrame.from_dict(self._data_by_ts, orient="index")
+                if len(data.index):
+                    data.index = _to_datetime_index(data.index, self._tz)
 
                 def convert_quantity(val):
                     """
@@ -394,7 +433,7 @@ class HisReadFrameOperation(state.HaystackOperation):
                     else:
                         return ""
 
-                for name, serie in data.iteritems():
+                for name, serie in data.items():
                     """
                     Convert Quantity and put unit in metadata
                     """
@@ -446,6 +485,9 @@ class HisWriteSeriesOperation(state.HaystackOperation):
         self._series = series
         self._tz = _resolve_tz(tz)
 
+        # Entities consulted while resolving the timezone.
+        self._sources = set()
+
         self._state_machine = fysom.Fysom(
             initial="init",
             final="done",
@@ -478,6 +520,10 @@ class HisWriteSeriesOperation(state.HaystackOperation):
         )
 
     def go(self):
+        if self._tz is None:
+            # Have we resolved the timezone of this point before?
+            self._tz = self._session._get_cached_point_tz(self._entity_id)
+
         if self._tz is not None:  # Do we have a timezone?
             # We do!
             self._state_machine.have_tz()
@@ -511,6 +557,7 @@ class HisWriteSeriesOperation(state.HaystackOperation):
         if hasattr(self._point, "tz") and isinstance(self._point.tz, tzinfo):
             # We have our timezone.
             self._tz = self._point.tz
+            self._session._cache_point_tz(self._entity_id, self._tz)
             self._state_machine.have_tz()
         else:
             # Nope, look at the equip then.
@@ -537,9 +584,11 @@ class HisWriteSeriesOperation(state.HaystackOperation):
         See if the equip has a timezone?
         """
         equip = event.equip
+        self._sources.add(equip._entity_id)
         if hasattr(equip, "tz") and isinstance(equip.tz, tzinfo):
             # We have our timezone.
             self._tz = equip.tz
+            self._session._cache_point_tz(self._entity_id, self._tz, self._sources)
             self._state_machine.have_tz()
         else:
             # Nope, look at the site then.
@@ -566,9 +615,11 @@ class HisWriteSeriesOperation(state.HaystackOperation):
         See if the site has a timezone?
         """
         site = event.site
+        self._sources.add(site._entity_id)
         if hasattr(site, "tz") and isinstance(site.tz, tzinfo):
             # We have our timezone.
             self._tz = site.tz
+            self._session._cache_point_tz(self._entity_id, self._tz, self._sources)
             self._state_machine.have_tz()
         else:
             try:
@@ -585,7 +636,21 @@ class HisWriteSeriesOperation(state.HaystackOperation):
         """
         try:
             # Process the timestamp records into an appropriate format.
-            if hasattr(self._series, "to_dict"):
+            if HAVE_PANDAS and isinstance(self._series, Series):
+                # Time-shift the whole index at once.
+                series = self._series.dropna()
+                if len(series) == 0:
+                    self._state_machine.write_done(result=None)
+                    return
+                index = _localise_index(series.index, self._tz)
+                records = dict(zip(index.to_pydatetime(), series.tolist()))
+                self._session.his_write(
+                    point=self._entity_id,
+                    timestamp_records=records,
+                    callback=self._on_write,
+                )
+                return
+            elif hasattr(self._series, "to_dict"):
                 records = self._series.to_dict()
             elif not isinstance(self._series, dict):
                 records = dict(self._series)
@@ -642,6 +707,226 @@ class HisWriteSeriesOperation(state.HaystackOperation):
         self._done(event.result)
 
 
+class PointTzResolveOperation(state.HaystackOperation):
+    """
+    Resolve the timezones of many 'point' entities in bulk.  This operation
+    performs the following steps::
+
+        For each point not in the session timezone cache:
+        # State: read_points
+            Retrieve all the points in a single read.
+            Points with a 'tz' tag are resolved.
+        # State: read_equips
+            Retrieve the equips of unresolved points in a single read.
+            Points whose equip has a 'tz' tag are resolved.
+        # State: read_sites
+            Retrieve the sites of unresolved points in a single read.
+            Points whose site has a 'tz' tag are resolved.
+        Return a dict of point IDs to timezones.
+        # State: done
+
+    """
+
+    def __init__(self, session, points, refresh):
+        """
+        Initialise a request for the timezones of the named points.
+
+        :param session: Haystack HTTP session object.
+        :param points: A list of point entities or IDs.
+        :param refresh: Ignore timezones already in the session cache.
+        """
+        super(PointTzResolveOperation, self).__init__(result_deepcopy=False)
+        self._log = session._log.getChild("resolve_point_tz")
+        self._session = session
+        self._point_ids = [session._obj_to_ref(p).name for p in points]
+        self._refresh = refresh
+        self._points = {}
+        self._tz = {}
+
+        # Unresolved points: point_id -> (ref_id, set of sources)
+        self._need_equip = {}
+        self._need_site = {}
+
+        self._state_machine = fysom.Fysom(
+            initial="init",
+            final="done",
+            events=[
+                # Event             Current State       New State
+                ("go", "init", "read_points"),
+                ("points_done", "read_points", "read_equips"),
+                ("equips_done", "read_equips", "read_sites"),
+                ("sites_done", "read_sites", "done"),
+                ("exception", "*", "done"),
+            ],
+            callbacks={
+                "onenterread_points": self._do_read_points,
+                "onenterread_equips": self._do_read_equips,
+                "onenterread_sites": self._do_read_sites,
+                "onenterdone": self._do_done,
+            },
+        )
+
+    def go(self):
+        self._state_machine.go()
+
+    @staticmethod
+    def _entity_tz(entity):
+        """
+        Return the timezone of an entity, or None if it has none.
+        """
+        try:
+            tz = entity.tz
+        except (AttributeError, KeyError):
+            return None
+        return tz if isinstance(tz, tzinfo) else None
+
+    @staticmethod
+    def _ref_name(entity, tag):
+        """
+        Return the ID referenced by the given tag, or None.
+        """
+        ref = entity.tags.get(tag)
+        return ref.name if isinstance(ref, hszinc.Ref) else None
+
+    def _resolved(self, point_id, tz, sources=None):
+        self._tz[point_id] = tz
+        self._session._cache_point_tz(point_id, tz, sources)
+
+    def _do_read_points(self, event):
+        """
+        Read the points whose timezones are not yet known.
+        """
+        try:
+            todo = []
+            for point_id in self._point_ids:
+                tz = None
+                if not self._refresh:
+                    tz = self._session._get_cached_point_tz(point_id)
+                if tz is None:
+                    todo.append(point_id)
+                else:
+                    self._tz[point_id] = tz
+
+            if not todo:
+                self._state_machine.points_done()
+                return
+
+            self._session.get_entity(
+                todo, refresh=self._refresh, single=False, callback=self._on_read_points
+            )
+        except:  # Catch all exceptions to pass to caller.
+            self._state_machine.exception(result=AsynchronousException())
+
+    def _on_read_points(self, operation, **kwargs):
+        try:
+            self._points = operation.result
+            for point_id in self._point_ids:
+                if point_id in self._tz:
+                    continue
+
+                point = self._points.get(point_id)
+                if point is None:
+                    self._tz[point_id] = None
+                    continue
+
+                tz = self._entity_tz(point)
+                if tz is not None:
+                    self._resolved(point_id, tz)
+                    continue
+
+                equip_id = self._ref_name(point, "equipRef")
+                site_id = self._ref_name(point, "siteRef")
+                if equip_id is not None:
+                    self._need_equip[point_id] = (equip_id, set([equip_id]))
+                elif site_id is not None:
+                    self._need_site[point_id] = (site_id, set([site_id]))
+                else:
+                    self._tz[point_id] = None
+
+            self._state_machine.points_done()
+        except:  # Catch all exceptions to pass to caller.
+            self._state_machine.exception(result=AsynchronousException())
+
+    def _do_read_equips(self, event):
+        """
+        Read the equips of the points that are not yet resolved.
+        """
+        try:
+            equip_ids = set([e[0] for e in self._need_equip.values()])
+            if not equip_ids:
+                self._state_machine.equips_done()
+                return
+
+            self._session.get_entity(
+                list(equip_ids), single=False, callback=self._on_read_equips
+            )
+        except:  # Catch all exceptions to pass to caller.
+            self._state_machine.exception(result=AsynchronousException())
+
+    def _on_read_equips(self, operation, **kwargs):
+        try:
+            equips = operation.result
+            for point_id, (equip_id, sources) in self._need_equip.items():
+                equip = equips.get(equip_id)
+                tz = None if equip is None else self._entity_tz(equip)
+                if tz is not None:
+                    self._resolved(point_id, tz, sources)
+                    continue
+
+                # Try the site, preferring the one the equip refers to.
+                site_id = None
+                if equip is not None:
+                    site_id = self._ref_name(equip, "siteRef")
+                if site_id is None:
+                    site_id = self._ref_name(self._points[point_id], "siteRef")
+
+                if site_id is None:
+                    self._tz[point_id] = None
+                else:
+                    self._need_site[point_id] = (site_id, sources | set([site_id]))
+
+            self._state_machine.equips_done()
+        except:  # Catch all exceptions to pass to caller.
+            self._state_machine.exception(result=AsynchronousException())
+
+    def _do_read_sites(self, event):
+        """
+        Read the sites of the points that are not yet resolved.
+        """
+        try:
+            site_ids = set([s[0] for s in self._need_site.values()])
+            if not site_ids:
+                self._state_machine.sites_done(result=self._tz)
+                return
+
+            self._session.get_entity(
+                list(site_ids), single=False, callback=self._on_read_sites
+            )
+        except:  # Catch all exceptions to pass to caller.
+            self._state_machine.exception(result=AsynchronousException())
+
+    def _on_read_sites(self, operation, **kwargs):
+        try:
+            sites = operation.result
+            for point_id, (site_id, sources) in self._need_site.items():
+                site = sites.get(site_id)
+                tz = None if site is None else self._entity_tz(site)
+                if tz is not None:
+                    self._resolved(point_id, tz, sources)
+                else:
+                    self._tz[point_id] = None
+
+            self._state_machine.sites_done(result=self._tz)
+        except:  # Catch all exceptions to pass to caller.
+            self._state_machine.exception(result=AsynchronousException())
+
+    def _do_done(self, event):
+        """
+        Return the result from the state machine.
+        """
+        self._done(event.result)
+
+
 class HisWriteFrameOperation(state.HaystackOperation):
     """
     Write the series data to several 'point' entities.
@@ -674,80 +959,70 @@ class HisWriteFrameOperation(state.HaystackOperation):
                 else ts.astimezone(tz)
             )
 
-        # Convert frame to list of records.
-        if HAVE_PANDAS:
-            # Convert Pandas frame to dict of dicts form.
-            if isinstance(frame, DataFrame):
-                self._log.debug("Convert from Pandas DataFrame")
-                raw_frame = frame.to_dict(orient="dict")
-                frame = {}
-                for col, col_data in raw_frame.items():
-                    for ts, val in col_data.items():
+        if HAVE_PANDAS and isinstance(frame, DataFrame):
+            # Pandas frames are consumed column-wise, as-is.
+            self._log.debug("Using Pandas DataFrame")
+            frame = self._prepare_frame(session, columns, frame, tz)
+            columns = set(frame.columns)
+        else:
+            # Convert dict of dicts to records, de-referencing column names.
+            if isinstance(frame, dict):
+                if columns is None:
+
+                    def _to_rec(item):
+                        (ts, raw_record) = item
+                        record = raw_record.copy()
+                        record["ts"] = ts
+                        return record
+
+                else:
+
+                    def _to_rec(item):
+                        (ts, raw_record) = item
+                        record = {}
+                        for col, val in raw_record.items():
+                            entity = columns[col]
+                            if hasattr(entity, "id"):
+                                entity = entity.id
+                            if isinstance(entity, hszinc.Ref):
+                                entity = entity.name
+                            record[entity] = val
+
+                        record["ts"] = ts
+                        return record
+
+                frame = list(map(_to_rec, list(frame.items())))
+            elif columns is not None:
+                # Columns are aliased.  De-alias the column names.
+                frame = deepcopy(frame)
+                for row in frame:
+                    ts = row.pop("ts")
+                    raw = row.copy()
+                    row.clear()
+                    row["ts"] = ts
+                    for column, point in columns.items():
                         try:
-                            frame_rec = frame[ts]
+                            value = raw.pop(column)
                         except KeyError:
-                            frame_rec = {}
-                            frame[ts] = frame_rec
-                        frame[col] = val
-
-        # Convert dict of dicts to records, de-referencing column names.
-        if isinstance(frame, dict):
-            if columns is None:
-
-                def _to_rec(item):
-                    (ts, raw_record) = item
-                    record = raw_record.copy()
-                    record["ts"] = ts
-                    return record
-
-            else:
-
-                def _to_rec(item):
-                    (ts, raw_record) = item
-                    record = {}
-                    for col, val in raw_record.items():
-                        entity = columns[col]
-                        if hasattr(entity, "id"):
-                            entity = entity.id
-                        if isinstance(entity, hszinc.Ref):
-                            entity = entity.name
-                        record[entity] = val
-
-                    record["ts"] = ts
-                    return record
-
-            frame = list(map(_to_rec, list(frame.items())))
-        elif columns is not None:
-            # Columns are aliased.  De-alias the column names.
-            frame = deepcopy(frame)
-            for row in frame:
-                ts = row.pop("ts")
-                raw = row.copy()
-                row.clear()
-                row["ts"] = ts
-                for column, point in columns.items():
-                    try:
-                        value = raw.pop(column)
-                    except KeyError:
-                        self._log.debug(
-                            "At %s missing column %s (for %s): %s",
-                            ts,
-                            column,
-                            point,
-                            raw,
-                        )
-                        continue
-                    row[session._obj_to_ref(point).name] = value
-
-        # Localise all timestamps, extract columns:
-        columns = set()
-
-        def _localise_rec(r):
-            r["ts"] = localise(r["ts"])
-            columns.update(set(r.keys()) - set(["ts"]))
-            return r
-
-        frame = list(map(_localise_rec, frame))
+                            self._log.debug(
+                                "At %s missing column %s (for %s): %s",
+                                ts,
+                                column,
+                                point,
+                                raw,
+                            )
+                            continue
+                        row[session._obj_to_ref(point).name] = value
+
+            # Localise all timestamps, extract columns:
+            columns = set()
+
+            def _localise_rec(r):
+                r["ts"] = localise(r["ts"])
+                columns.update(set(r.keys()) - set(["ts"]))
+                return r
+
+            frame = list(map(_localise_rec, frame))
 
         self._session = session
         self._frame = frame
@@ -776,6 +1051,25 @@ class HisWriteFrameOperation(state.HaystackOperation):
             },
         )
 
+    @staticmethod
+    def _prepare_frame(session, columns, frame, tz):
+        """
+        Prepare a Pandas DataFrame for writing without expanding it into
+        per-cell Python objects: de-alias the column names to point IDs, drop
+        columns with no data and time-shift the whole index at once.
+        """
+        if columns is not None:
+            frame = frame[list(columns.keys())]
+            names = [session._obj_to_ref(columns[col]).name for col in frame.columns]
+        else:
+            names = [session._obj_to_ref(col).name for col in frame.columns]
+
+        frame = frame.copy(deep=False)
+        frame.columns = names
+        frame = frame.loc[:, frame.notna().any(axis=0).to_numpy()]
+        frame.index = _localise_index(frame.index, tz)
+        return frame
+
     def go(self):
         if not bool(self._columns):
             self._log.debug("No data to write")
@@ -829,23 +1123,46 @@ class HisWriteFrameOperation(state.HaystackOperation):
 
     def _do_single_write(self, event):
         """
-        Submit the data in single write requests.
+        Resolve the timezones of all the points, then submit the data in
+        single write requests.
+        """
+        self._session.resolve_point_tz(
+            list(self._columns), callback=self._on_resolve_tz
+        )
+
+    def _on_resolve_tz(self, operation, **kwargs):
+        """
+        Submit a write request for each point, in that point's timezone.
         """
+        try:
+            point_tz = operation.result
+        except:  # Let each write resolve its own point's timezone.
+            self._log.debug("Unable to resolve point timezones", exc_info=1)
+            point_tz = {}
+
         for point in self._columns:
             self._log.debug("Point %s", point)
 
             # Extract a series for this column
-            series = dict(
-                [
-                    (r["ts"], r[point])
-                    for r in filter(lambda r: r.get(point) is not None, self._frame)
-                ]
-            )
+            if HAVE_PANDAS and isinstance(self._frame, DataFrame):
+                series = self._frame[point].dropna()
+            else:
+                series = dict(
+                    [
+                        (r["ts"], r[point])
+                        for r in filter(
+                            lambda r: r.get(point) is not None, self._frame
+                        )
+                    ]
+                )
 
+            # The series operation converts the timestamps to the point's
+            # own timezone, resolving it if that failed above.
             self._session.his_write_series(
                 point,
                 series,
-                callback=lambda operation, **kw: self._on_single_write(
+                tz=point_tz.get(point),
+                callback=lambda operation, point=point, **kw: self._on_single_write(
                     operation, point=point
                 ),
             )
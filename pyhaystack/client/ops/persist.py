@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Session restore operation.  This resumes a session from saved state where
+the server still accepts it, and logs in afresh where it does not.
+"""
+
+import fysom
+import hszinc
+
+from ...util import state
+from ...util.asyncexc import AsynchronousException
+
+
+class SessionRestoreOperation(state.HaystackOperation):
+    """
+    Authenticate a session by restoring its saved state, falling back to the
+    session's normal log-in operation.
+
+    The saved state is applied to the session, then checked by requesting
+    the server's 'about' grid.  If that succeeds, the result is the saved
+    state and `restored` is True.  Otherwise the state is discarded, and the
+    result is that of the log-in operation.
+    """
+
+    def __init__(self, session):
+        """
+        Restore the state of a session, or log in.
+
+        :param session: Haystack HTTP session object.
+        """
+        super(SessionRestoreOperation, self).__init__(result_deepcopy=False)
+        self._log = session._log.getChild("restore")
+        self._session = session
+        self._saved_state = None
+        self.restored = False
+
+        self._state_machine = fysom.Fysom(
+            initial="init",
+            final="done",
+            events=[
+                # Event             Current State       New State
+                ("probe", "init", "probing"),
+                ("probe_ok", "probing", "done"),
+                ("login", ["init", "probing"], "login"),
+                ("login_done", "login", "done"),
+                ("exception", "*", "done"),
+            ],
+            callbacks={
+                "onenterprobing": self._do_probe,
+                "onenterlogin": self._do_login,
+                "onenterdone": self._do_done,
+            },
+        )
+
+    def go(self):
+        try:
+            self._saved_state = self._session._load_state()
+        except:  # Never let a broken store prevent a log-in
+            self._log.warning("Unable to load session state", exc_info=1)
+
+        if self._saved_state is None:
+            self._state_machine.login()
+        else:
+            self._state_machine.probe()
+
+    def _do_probe(self, event):
+        """
+        Apply the saved state and check the server accepts it.
+        """
+        try:
+            self._session._import_state(self._saved_state)
+            if self._session._grid_format == hszinc.MODE_JSON:
+                accept = "application/json"
+            else:
+                accept = "text/zinc"
+            self._session._get("about", self._on_probe, headers={b"Accept": accept})
+        except:  # Catch all exceptions, and log in instead.
+            self._log.debug("Unable to probe saved state", exc_info=1)
+            self._state_machine.login()
+
+    def _on_probe(self, response):
+        """
+        See whether the server accepted the saved state.
+        """
+        try:
+            if isinstance(response, AsynchronousException):
+                response.reraise()
+
+            content_type = response.content_type
+            if content_type in ("text/zinc", "text/plain"):
+                grid = hszinc.parse(response.text, mode=hszinc.MODE_ZINC)
+            elif content_type == "application/json":
+                grid = hszinc.parse(response.text, mode=hszinc.MODE_JSON)
+            else:
+                # Probably a log-in page.
+                raise ValueError("Unexpected content type %s" % content_type)
+
+            if "err" in grid.metadata:
+                raise ValueError("Probe fails: %s" % grid.metadata.get("dis"))
+        except:
+            self._log.info("Saved session state is stale, logging in", exc_info=1)
+            self._state_machine.login()
+            return
+
+        self._log.debug("Restored saved session state")
+        self.restored = True
+        self._state_machine.probe_ok(result=self._saved_state)
+
+    def _do_login(self, event):
+        """
+        Discard any saved state and log in normally.
+        """
+        try:
+            if self._saved_state is not None:
+                self._session._discard_state()
+                self._session._import_state(None)
+            op = self._session._AUTH_OPERATION(self._session)
+            op.done_sig.connect(self._on_login)
+            op.go()
+        except:  # Catch all exceptions to pass to caller.
+            self._log.debug("Hit exception", exc_info=1)
+            self._state_machine.exception(result=AsynchronousException())
+
+    def _on_login(self, operation, **kwargs):
+        """
+        Pass on the result of the log-in.
+        """
+        try:
+            result = operation.result
+        except:  # Catch all exceptions to pass to caller.
+            self._state_machine.exception(result=AsynchronousException())
+            return
+        self._state_machine.login_done(result=result)
+
+    def _do_done(self, event):
+        """
+        Return the result from the state machine.
+        """
+        self._done(event.result)
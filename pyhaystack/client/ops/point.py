@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Point operations.  These read and write the present values of many points at
+once.
+"""
+
+from threading import Lock
+
+import fysom
+import hszinc
+
+from ...util import state
+from ...util.asyncexc import AsynchronousException
+from .his import HAVE_PANDAS
+
+if HAVE_PANDAS:
+    from .his import MetaSeries
+
+
+class ReadCurValsOperation(state.HaystackOperation):
+    """
+    Read the current values (curVal) of many points, using multi-ID read
+    requests of a bounded size.
+    """
+
+    FORMAT_DICT = "dict"
+    FORMAT_SERIES = "series"
+
+    def __init__(self, session, points, batch_size, result_format):
+        """
+        Read the current values of points.
+
+        :param session: Haystack HTTP session object.
+        :param points: Points (entities or IDs) to read.
+        :param batch_size: Maximum number of points per read request.
+        :param result_format: What format to present the values in.
+        """
+        super(ReadCurValsOperation, self).__init__(result_deepcopy=False)
+        self._log = session._log.getChild("read_cur_vals")
+
+        if result_format not in (self.FORMAT_DICT, self.FORMAT_SERIES):
+            raise ValueError("Unrecognised result_format %s" % result_format)
+        if (result_format == self.FORMAT_SERIES) and (not HAVE_PANDAS):
+            raise NotImplementedError("pandas not available.")
+
+        self._session = session
+        self._result_format = result_format
+
+        # De-duplicate IDs, keeping their order.
+        self._point_ids = []
+        seen = set()
+        for point in points:
+            point_id = session._obj_to_ref(point).name
+            if point_id not in seen:
+                seen.add(point_id)
+                self._point_ids.append(point_id)
+
+        self._batches = [
+            self._point_ids[n : n + batch_size]
+            for n in range(0, len(self._point_ids), batch_size)
+        ]
+        self._lock = Lock()
+        self._todo = set()
+        self._values = {}
+
+        self._state_machine = fysom.Fysom(
+            initial="init",
+            final="done",
+            events=[
+                # Event             Current State       New State
+                ("go", "init", "reading"),
+                ("read_done", "reading", "done"),
+                ("exception", "*", "done"),
+            ],
+            callbacks={
+                "onenterreading": self._do_read,
+                "onenterdone": self._do_done,
+            },
+        )
+
+    def go(self):
+        self._state_machine.go()
+
+    def _do_read(self, event):
+        """
+        Request each batch of points from the server.
+        """
+        try:
+            self._todo = set(range(len(self._batches)))
+            if not self._todo:
+                self._state_machine.read_done(result=self._format())
+                return
+
+            for idx, batch in enumerate(self._batches):
+                self._log.debug("Reading batch %d: %d points", idx, len(batch))
+                self._session.read(
+                    ids=batch,
+                    callback=lambda operation, idx=idx, **kw: self._on_read(
+                        operation, idx
+                    ),
+                )
+        except:  # Catch all exceptions to pass to caller.
+            self._log.debug("Hit exception", exc_info=1)
+            self._state_machine.exception(result=AsynchronousException())
+
+    def _on_read(self, operation, idx):
+        """
+        Collect the values from one batch.
+        """
+        if self._state_machine.current != "reading":
+            # Already failed
+            return
+
+        try:
+            grid = operation.result
+            with self._lock:
+                for row in grid:
+                    ref = row.get("id")
+                    if isinstance(ref, hszinc.Ref):
+                        self._values[ref.name] = row.get("curVal")
+                self._todo.discard(idx)
+                done = not self._todo
+
+            if done:
+                self._state_machine.read_done(result=self._format())
+        except:  # Catch all exceptions to pass to caller.
+            self._log.debug("Hit exception", exc_info=1)
+            self._state_machine.exception(result=AsynchronousException())
+
+    def _format(self):
+        """
+        Present the values in the requested format.
+        """
+        values = [(p, self._values.get(p)) for p in self._point_ids]
+        if self._result_format == self.FORMAT_DICT:
+            return dict(values)
+
+        data = []
+        units = {}
+        for point_id, value in values:
+            if isinstance(value, hszinc.Quantity):
+                units[point_id] = value.unit
+                value = value.value
+            data.append(value)
+        series = MetaSeries(data=data, index=self._point_ids)
+        series.add_meta("units", units)
+        return series
+
+    def _do_done(self, event):
+        """
+        Return the result from the state machine.
+        """
+        self._done(event.result)
+
+
+class PointWriteManyOperation(state.HaystackOperation):
+    """
+    Write values to many points.  The writes are sent as individual
+    pointWrite requests with a bounded number in flight at once, or, for
+    servers known to accept multi-row pointWrite grids, posted in batches.
+
+    The result is a list with an entry for each write, in the order given:
+    None if the write succeeded, or the exception raised if it failed.
+    """
+
+    STRATEGY_MULTI = "multi"
+    STRATEGY_SINGLE = "single"
+
+    def __init__(self, session, writes, who, max_concurrency, batch_size, strategy):
+        """
+        Write values to points.
+
+        :param session: Haystack HTTP session object.
+        :param writes: List of (point, level, val) or (point, level, val,
+                       duration) tuples.
+        :param who: Identity of the writer.
+        :param max_concurrency: Maximum number of single writes in flight.
+        :param batch_size: Maximum number of rows per multi-row write.
+        :param strategy: How to perform the writes: 'single' or 'multi'.
+                         Standard Haystack servers only accept 'single'.
+        """
+        super(PointWriteManyOperation, self).__init__(result_deepcopy=False)
+        self._log = session._log.getChild("point_write_many")
+
+        if strategy not in (self.STRATEGY_MULTI, self.STRATEGY_SINGLE):
+            raise ValueError("Unrecognised strategy %s" % strategy)
+
+        self._session = session
+        self._who = who
+        self._max_concurrency = max(1, max_concurrency)
+        self._batch_size = batch_size
+        self._strategy = strategy
+
+        self._writes = []
+        for write in writes:
+            point, level, val = write[0:3]
+            duration = write[3] if len(write) > 3 else None
+            self._writes.append((point, level, val, duration))
+
+        self._lock = Lock()
+        self._results = [None] * len(self._writes)
+        self._next = 0
+        self._in_flight = 0
+        self._sending = False
+        self._todo = len(self._writes)
+
+        self._state_machine = fysom.Fysom(
+            initial="init",
+            final="done",
+            events=[
+                # Event             Current State       New State
+                ("no_data", "init", "done"),
+                ("do_multi_write", "init", "multi_write"),
+                ("do_single_write", "init", "single_write"),
+                ("all_write_done", "multi_write", "done"),
+                ("all_write_done", "single_write", "done"),
+                ("exception", "*", "done"),
+            ],
+            callbacks={
+                "onentermulti_write": self._do_multi_write,
+                "onentersingle_write": self._do_single_write,
+                "onenterdone": self._do_done,
+            },
+        )
+
+    def go(self):
+        if not self._writes:
+            self._state_machine.no_data(result=[])
+        elif self._strategy == self.STRATEGY_MULTI:
+            self._state_machine.do_multi_write()
+        else:
+            self._state_machine.do_single_write()
+
+    def _do_multi_write(self, event):
+        """
+        Post the writes as multi-row pointWrite grids.
+        """
+        try:
+            batches = [
+                list(range(n, min(n + self._batch_size, len(self._writes))))
+                for n in range(0, len(self._writes), self._batch_size)
+            ]
+            for batch in batches:
+                grid = hszinc.Grid()
+                for col in ("id", "level", "val", "who", "duration"):
+                    grid.column[col] = {}
+                for idx in batch:
+                    point, level, val, duration = self._writes[idx]
+                    row = {
+                        "id": self._session._obj_to_ref(point),
+                        "level": level,
+                        "val": val,
+                    }
+                    if self._who is not None:
+                        row["who"] = self._who
+                    if duration is not None:
+                        row["duration"] = duration
+                    grid.append(row)
+
+                self._session._post_grid(
+                    "pointWrite",
+                    grid,
+                    callback=lambda operation, batch=batch, **kw: self._on_write(
+                        operation, batch
+                    ),
+                )
+        except:  # Catch all exceptions to pass to caller.
+            self._log.debug("Hit exception", exc_info=1)
+            self._state_machine.exception(result=AsynchronousException())
+
+    def _do_single_write(self, event):
+        """
+        Start the first single writes.
+        """
+        self._send_writes()
+
+    def _send_writes(self):
+        """
+        Send single writes until max_concurrency are in flight or none
+        remain.  Writes may finish (and call this again) before point_write
+        returns, e.g. with a synchronous HTTP client; those calls leave the
+        sending to the loop already running, rather than recursing.
+        """
+        with self._lock:
+            if self._sending:
+                return
+            self._sending = True
+
+        while True:
+            with self._lock:
+                if (self._next >= len(self._writes)) or (
+                    self._in_flight >= self._max_concurrency
+                ):
+                    self._sending = False
+                    return
+                idx = self._next
+                self._next += 1
+                self._in_flight += 1
+            self._write(idx)
+
+    def _write(self, idx):
+        """
+        Send a single write.
+        """
+        point, level, val, duration = self._writes[idx]
+        try:
+            self._session.point_write(
+                point,
+                level=level,
+                val=val,
+                who=self._who,
+                duration=duration,
+                callback=lambda operation, **kw: self._on_single_write(operation, idx),
+            )
+        except Exception as e:
+            self._log.debug("Write %d fails", idx, exc_info=1)
+            with self._lock:
+                self._in_flight -= 1
+            self._record([idx], e)
+
+    def _on_single_write(self, operation, idx):
+        """
+        Record the outcome of a single write, then send the next one.
+        """
+        with self._lock:
+            self._in_flight -= 1
+        self._on_write(operation, [idx])
+        self._send_writes()
+
+    def _on_write(self, operation, indices):
+        """
+        Record the outcome of the writes given by indices.
+        """
+        try:
+            operation.result
+            error = None
+        except Exception as e:
+            self._log.debug("Write fails", exc_info=1)
+            error = e
+        self._record(indices, error)
+
+    def _record(self, indices, error):
+        """
+        Store the result of some writes, finishing when all are known.
+        """
+        with self._lock:
+            for idx in indices:
+                self._results[idx] = error
+            self._todo -= len(indices)
+            done = self._todo <= 0
+
+        if done:
+            self._state_machine.all_write_done(result=self._results)
+
+    def _do_done(self, event):
+        """
+        Return the result from the state machine.
+        """
+        self._done(event.result)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Session pool operations.  These run the same session operation on many
+servers at once and merge what comes back.
+"""
+
+from threading import Lock
+
+import fysom
+
+from ...util import state
+from ...util.asyncexc import AsynchronousException
+
+
+class FanOutOperation(state.HaystackOperation):
+    """
+    Call a session method on each of a number of servers in a SessionPool,
+    and combine the results.
+
+    The result is whatever `merge` makes of a dict mapping each server key to
+    the result from that server.  Servers that fail are left out of that
+    dict; their exceptions are given in the `errors` attribute, keyed by
+    server, so one server being down does not spoil the whole query.
+    """
+
+    def __init__(self, pool, keys, method, args=None, kwargs=None, merge=None):
+        """
+        Initialise a fan-out query.
+
+        :param pool: The SessionPool holding the sessions.
+        :param keys: Keys of the servers to query.
+        :param method: Name of the session method to call.
+        :param args: Positional arguments for the method, either a tuple
+                     used for every server, or a callable that is given
+                     the server key and returns the tuple.
+        :param kwargs: Keyword arguments for the method, as for args.
+        :param merge: Function that combines the per-server results.  If
+                      None, the result is the dict of per-server results.
+        """
+        super(FanOutOperation, self).__init__(result_copy=False)
+        self._log = pool._log.getChild("fan_out.%s" % method)
+        self._pool = pool
+        self._keys = list(keys)
+        self._method = method
+        self._args = args or ()
+        self._kwargs = kwargs or {}
+        self._merge = merge
+        self._lock = Lock()
+        self._todo = set(self._keys)
+        self._results = {}
+        self.errors = {}
+
+        self._state_machine = fysom.Fysom(
+            initial="init",
+            final="done",
+            events=[
+                # Event             Current State       New State
+                ("go", "init", "querying"),
+                ("query_done", "querying", "done"),
+                ("exception", "*", "done"),
+            ],
+            callbacks={
+                "onenterquerying": self._do_query,
+                "onenterdone": self._do_done,
+            },
+        )
+
+    def go(self):
+        self._state_machine.go()
+
+    def _do_query(self, event):
+        """
+        Queue a call for each server.  The pool starts them as each server's
+        concurrency limit permits.
+        """
+        if not self._keys:
+            self._finish()
+            return
+
+        for key in self._keys:
+            self._pool._submit(key, lambda release, key=key: self._start(key, release))
+
+    def _start(self, key, release):
+        """
+        Call the method on one server.  `release` must be called once the
+        call is done, to let the next queued call for that server start.
+        """
+        try:
+            args = self._args(key) if callable(self._args) else self._args
+            kwargs = self._kwargs(key) if callable(self._kwargs) else self._kwargs
+            method = getattr(self._pool[key], self._method)
+            self._log.debug("Querying %s", key)
+            method(
+                *args,
+                callback=lambda operation, **kw: self._on_result(
+                    key, operation, release
+                ),
+                **kwargs
+            )
+        except Exception as e:
+            self._log.debug("Query of %s fails", key, exc_info=1)
+            release()
+            self._record(key, error=e)
+
+    def _on_result(self, key, operation, release):
+        """
+        Collect the result from one server.
+        """
+        release()
+        try:
+            result = operation.result
+        except Exception as e:
+            self._log.debug("Query of %s fails", key, exc_info=1)
+            self._record(key, error=e)
+            return
+        self._record(key, result=result)
+
+    def _record(self, key, result=None, error=None):
+        with self._lock:
+            if error is None:
+                self._results[key] = result
+            else:
+                self.errors[key] = error
+            self._todo.discard(key)
+            done = not self._todo
+
+        if done:
+            self._finish()
+
+    def _finish(self):
+        """
+        Merge the results and finish.
+        """
+        try:
+            if self._merge is None:
+                result = self._results
+            else:
+                result = self._merge(self._results)
+            self._state_machine.query_done(result=result)
+        except:  # Catch all exceptions to pass to caller.
+            self._log.debug("Merge fails", exc_info=1)
+            self._state_machine.exception(result=AsynchronousException())
+
+    def _do_done(self, event):
+        """
+        Return the result from the state machine.
+        """
+        self._done(event.result)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Replica operations.  These run a read-only session operation on one replica
+of a replicated server, failing over to the others if it cannot be reached.
+"""
+
+import fysom
+
+from ...util import state
+from ...util.asyncexc import AsynchronousException
+from ..http.exceptions import HTTPConnectionError
+
+
+class ReplicaOperation(state.HaystackOperation):
+    """
+    Call a session method on the least busy healthy replica.  If that replica
+    cannot be connected to, it is marked as down and the call is repeated on
+    the next replica, until one answers or all have been tried.
+
+    The result is that of the call on the replica that answered.
+    """
+
+    def __init__(self, replicas, method, args, kwargs):
+        """
+        Initialise a call on a replica.
+
+        :param replicas: The ReplicaHaystackSession holding the replicas.
+        :param method: Name of the session method to call.
+        :param args: Positional arguments for the method.
+        :param kwargs: Keyword arguments for the method.
+        """
+        super(ReplicaOperation, self).__init__(result_copy=False)
+        self._log = replicas._log.getChild("replica.%s" % method)
+        self._replicas = replicas
+        self._method = method
+        self._args = args
+        self._kwargs = kwargs
+        self._tried = set()
+        self._error = None
+
+        self._state_machine = fysom.Fysom(
+            initial="init",
+            final="done",
+            events=[
+                # Event             Current State       New State
+                ("go", "init", "calling"),
+                ("call_done", "calling", "done"),
+                ("unreachable", "calling", "failover"),
+                ("retry", "failover", "calling"),
+                ("exception", "*", "done"),
+            ],
+            callbacks={
+                "onentercalling": self._do_call,
+                "onenterfailover": self._do_failover,
+                "onenterdone": self._do_done,
+            },
+        )
+
+    def go(self):
+        self._state_machine.go()
+
+    def _do_call(self, event):
+        """
+        Call the method on the best replica not yet tried.
+        """
+        idx = self._replicas._acquire(exclude=self._tried)
+        if idx is None:
+            if self._error is None:
+                try:
+                    raise HTTPConnectionError("No replica available")
+                except HTTPConnectionError:
+                    self._error = AsynchronousException()
+            self._state_machine.exception(result=self._error)
+            return
+
+        self._tried.add(idx)
+        try:
+            session = self._replicas.sessions[idx]
+            self._log.debug("Calling %s on replica %d", self._method, idx)
+            getattr(session, self._method)(
+                *self._args,
+                callback=lambda operation, **kw: self._on_result(idx, operation),
+                **self._kwargs
+            )
+        except:  # Catch all exceptions to pass to caller.
+            self._log.debug("Hit exception", exc_info=1)
+            self._replicas._release(idx)
+            self._state_machine.exception(result=AsynchronousException())
+
+    def _on_result(self, idx, operation):
+        """
+        Pass on the result, or fail over if the replica could not be reached.
+        """
+        self._replicas._release(idx)
+        try:
+            result = operation.result
+        except HTTPConnectionError:
+            self._log.warning("Replica %d cannot be reached", idx, exc_info=1)
+            self._error = AsynchronousException()
+            self._state_machine.unreachable(idx=idx)
+            return
+        except:  # Catch all exceptions to pass to caller.
+            self._state_machine.exception(result=AsynchronousException())
+            return
+
+        self._replicas._mark_up(idx)
+        self._state_machine.call_done(result=result)
+
+    def _do_failover(self, event):
+        """
+        Mark the replica that could not be reached as down, and try another.
+        """
+        self._replicas._mark_down(event.idx)
+        self._state_machine.retry()
+
+    def _do_done(self, event):
+        """
+        Return the result from the state machine.
+        """
+        self._done(event.result)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Watch operations.  These drive the server-side watches held by a
+WatchManager.
+"""
+
+from threading import Lock
+
+import fysom
+
+from ...util import state
+from ...util.asyncexc import AsynchronousException
+
+
+class WatchPollOperation(state.HaystackOperation):
+    """
+    Poll all the watches (shards) of a watch manager, and merge the changes
+    reported by each into a single result: a dict mapping the IDs of the
+    changed points to their new watch rows.  Shards whose watch is not open
+    are re-subscribed instead of polled.
+    """
+
+    def __init__(self, manager, shards, refresh):
+        """
+        Initialise a poll of the given shards.
+
+        :param manager: The WatchManager that owns the shards.
+        :param shards: The shards to poll.
+        :param refresh: Request the current values of all watched points.
+        """
+        super(WatchPollOperation, self).__init__(result_deepcopy=False)
+        self._log = manager._log.getChild("poll")
+        self._manager = manager
+        self._shards = list(shards)
+        self._refresh = refresh
+        self._lock = Lock()
+        self._changes = {}
+        self._todo = set()
+
+        self._state_machine = fysom.Fysom(
+            initial="init",
+            final="done",
+            events=[
+                # Event             Current State       New State
+                ("go", "init", "polling"),
+                ("poll_done", "polling", "done"),
+                ("exception", "*", "done"),
+            ],
+            callbacks={
+                "onenterpolling": self._do_poll,
+                "onenterdone": self._do_done,
+            },
+        )
+
+    def go(self):
+        self._state_machine.go()
+
+    def _do_poll(self, event):
+        """
+        Issue a request for every shard.  These run concurrently if the HTTP
+        client permits.
+        """
+        try:
+            self._todo = set(range(len(self._shards)))
+            if not self._todo:
+                self._state_machine.poll_done(result={})
+                return
+
+            for idx, shard in enumerate(self._shards):
+                op = self._manager._request(
+                    shard,
+                    on_changes=lambda changes, idx=idx: self._on_changes(idx, changes),
+                    refresh=self._refresh,
+                )
+                if op is None:
+                    # Still being opened, nothing to report yet.
+                    self._on_changes(idx, {})
+        except:  # Catch all exceptions to pass to caller.
+            self._log.debug("Hit exception", exc_info=1)
+            self._state_machine.exception(result=AsynchronousException())
+
+    def _on_changes(self, idx, changes):
+        """
+        Merge the changes reported by a shard.
+        """
+        with self._lock:
+            self._changes.update(changes)
+            self._todo.discard(idx)
+            done = not self._todo
+
+        if done and (self._state_machine.current == "polling"):
+            self._state_machine.poll_done(result=self._changes)
+
+    def _do_done(self, event):
+        """
+        Return the result from the state machine.
+        """
+        self._done(event.result)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Session state persistence.  Logging in can take several round trips (SCRAM
+needs four or more), which dominates the run time of short-lived scripts.  A
+session given a state store saves what it needs to resume (cookies,
+authorisation headers and token expiry) after each log-in, and on the next
+start tries that saved state before logging in again::
+
+    store = SessionStateStore('~/.cache/pyhaystack', secret=os.environ['KEY'])
+    session = pyhaystack.connect(..., state_store=store)
+
+The state is encrypted at rest with AES-GCM (which needs the `cryptography`
+package), with a key derived from `secret`, and the files are readable only
+by their owner.  Saved state that has expired, that fails to decrypt, or
+that the server no longer accepts is discarded and a normal log-in is
+performed.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+from time import time
+
+from six import binary_type
+
+from ..util.crypto import check_cryptography, seal, unseal
+
+
+def _pack(value):
+    """
+    Encode a header or cookie name/value for JSON, preserving bytes.
+    """
+    if isinstance(value, binary_type):
+        return ["b", base64.b64encode(value).decode("us-ascii")]
+    return ["s", value]
+
+
+def _unpack(value):
+    (kind, value) = value
+    if kind == "b":
+        return base64.b64decode(value.encode("us-ascii"))
+    return value
+
+
+def pack_map(values):
+    """
+    Encode a dict of headers or cookies for JSON.  None is preserved.
+    """
+    if values is None:
+        return None
+    return [[_pack(k), _pack(v)] for (k, v) in dict(values).items()]
+
+
+def unpack_map(values):
+    """
+    Decode a dict of headers or cookies encoded by `pack_map`.
+    """
+    if values is None:
+        return None
+    return dict((_unpack(k), _unpack(v)) for (k, v) in values)
+
+
+class SessionStateStore(object):
+    """
+    An encrypted, file-based store of session state.  Each session's state is
+    kept in its own file in `path`, named after a hash of the session's key
+    (its type, server URI and user name).
+    """
+
+    def __init__(self, path, secret, max_age=3600.0):
+        """
+        Initialise a session state store.
+
+        :param path: Directory to keep the state files in.  It is created
+                     (readable only by its owner) if it does not exist.
+        :param secret: Secret (bytes or string) to derive the keys used to
+                       encrypt the state from.
+        :param max_age: Number of seconds after which saved state with no
+                        expiry of its own is no longer used.  None means the
+                        state is tried regardless of its age.
+        """
+        check_cryptography("encrypt session state")
+        if not secret:
+            raise ValueError("A secret is required to encrypt session state")
+        self._path = os.path.expanduser(path)
+        self._secret = secret
+        self._max_age = max_age
+
+    def _filename(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self._path, "%s.state" % digest)
+
+    def load(self, key):
+        """
+        Return the state saved for a session, or None if there is none that
+        may still be valid.
+        """
+        filename = self._filename(key)
+        try:
+            with open(filename, "rb") as f:
+                blob = f.read()
+        except (IOError, OSError):
+            return None
+
+        try:
+            state = json.loads(unseal(self._secret, blob).decode("utf-8"))
+            if state.get("key") != key:
+                raise ValueError("State belongs to another session")
+        except ValueError:
+            self.discard(key)
+            return None
+
+        now = time()
+        expires = state.get("expires")
+        if expires is not None:
+            stale = expires <= now
+        elif self._max_age is not None:
+            stale = (state.get("saved") or 0.0) + self._max_age <= now
+        else:
+            stale = False
+
+        if stale:
+            self.discard(key)
+            return None
+        return state
+
+    def save(self, key, state):
+        """
+        Save the state of a session.  The file is written to a temporary
+        name first, so that a concurrent reader never sees it half-written.
+        """
+        state = dict(state, key=key, saved=time())
+        blob = seal(self._secret, json.dumps(state).encode("utf-8"))
+
+        if not os.path.isdir(self._path):
+            os.makedirs(self._path, 0o700)
+        (fd, tmp_name) = tempfile.mkstemp(dir=self._path, suffix=".tmp")
+        try:
+            os.chmod(tmp_name, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            os.rename(tmp_name, self._filename(key))
+        except:
+            os.unlink(tmp_name)
+            raise
+
+    def discard(self, key):
+        """
+        Forget the state of a session.
+        """
+        try:
+            os.unlink(self._filename(key))
+        except (IOError, OSError):
+            pass
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Multi-server session pool.  This holds sessions to many Project Haystack
+servers, and runs queries across all of them concurrently, so a query of the
+whole portfolio takes as long as the slowest server rather than the sum of
+them all::
+
+    pool = SessionPool({
+        'site1': dict(implementation='n4', uri='https://site1',
+                      username='user', password='pass'),
+        'site2': dict(implementation='skyspark', uri='https://site2',
+                      username='user', password='pass', project='demo'),
+    }, max_concurrency=4)
+
+    op = pool.find_entity('equip and ahu')
+    op.wait()
+    op.result       # {('site1', 'ahu1'): <entity>, ('site2', 'ahu7'): ...}
+    op.errors       # {} unless a server failed
+"""
+
+import logging
+from collections import deque
+from threading import Lock
+
+import hszinc
+from six import iteritems
+
+from .loader import get_instance
+from .session import HaystackSession
+from .ops import pool as pool_ops
+from .ops.his import HAVE_PANDAS
+
+if HAVE_PANDAS:
+    import pandas
+
+
+class SessionPool(object):
+    """
+    A pool of sessions, keyed by a server name of the caller's choosing.
+    Each server runs at most `max_concurrency` pool queries at a time; any
+    more wait their turn.
+    """
+
+    _FAN_OUT_OPERATION = pool_ops.FanOutOperation
+
+    # Column added to merged `read` results naming the source server.
+    SERVER_COLUMN = "server"
+
+    def __init__(self, servers=None, max_concurrency=4, log=None):
+        """
+        Initialise a session pool.
+
+        :param servers: Optional dict mapping server keys to sessions, or to
+                        dicts of arguments for `pyhaystack.connect`
+                        (including 'implementation').
+        :param max_concurrency: Maximum number of queries in progress on any
+                                one server.
+        :param log: Logging object for reporting messages.
+        """
+        if log is None:
+            log = logging.getLogger("pyhaystack.client.%s" % self.__class__.__name__)
+        self._log = log
+        self._max_concurrency = max(1, max_concurrency)
+        self._lock = Lock()
+        self._sessions = {}
+        self._in_flight = {}
+        self._pending = {}
+
+        for (key, session) in iteritems(servers or {}):
+            if isinstance(session, dict):
+                self.add(key, **session)
+            else:
+                self.add(key, session)
+
+    def __getitem__(self, key):
+        return self._sessions[key]
+
+    def __contains__(self, key):
+        return key in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __iter__(self):
+        return iter(list(self._sessions.keys()))
+
+    def keys(self):
+        return list(self._sessions.keys())
+
+    def add(self, key, implementation=None, *args, **kwargs):
+        """
+        Add a server to the pool.  `implementation` is either a session
+        instance, or the implementation name or class to instantiate using
+        `pyhaystack.connect` with the remaining arguments.
+        """
+        if isinstance(implementation, HaystackSession):
+            session = implementation
+        else:
+            session = get_instance(implementation, *args, **kwargs)
+
+        with self._lock:
+            if key in self._sessions:
+                raise KeyError("Server %s is already in the pool" % key)
+            self._sessions[key] = session
+            self._in_flight[key] = 0
+            self._pending[key] = deque()
+        return session
+
+    def remove(self, key):
+        """
+        Remove a server from the pool, returning its session.
+        """
+        with self._lock:
+            session = self._sessions.pop(key)
+            self._in_flight.pop(key, None)
+            self._pending.pop(key, None)
+        return session
+
+    def close(self):
+        """
+        Log out of every server.
+        """
+        for key in self.keys():
+            try:
+                self._sessions[key].logout()
+            except:  # Don't let one server stop the others.
+                self._log.warning("Failed to log out of %s", key, exc_info=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def fan_out(
+        self, method, args=None, kwargs=None, keys=None, merge=None, callback=None
+    ):
+        """
+        Call a session method on many servers concurrently.  The result is a
+        dict mapping server keys to the results from those servers, or
+        whatever `merge` makes of that dict.  Failures are reported in the
+        operation's `errors` attribute.
+
+        :param method: Name of the session method to call.
+        :param args: Positional arguments for the method: a tuple, or a
+                     callable taking the server key and returning a tuple.
+        :param kwargs: Keyword arguments for the method: a dict, or a
+                       callable taking the server key and returning a dict.
+        :param keys: Servers to query, default is all of them.
+        :param merge: Function combining the dict of per-server results.
+        :param callback: Asynchronous result callback.
+        """
+        if keys is None:
+            keys = self.keys()
+        op = self._FAN_OUT_OPERATION(
+            self, keys, method, args=args, kwargs=kwargs, merge=merge
+        )
+        if callback is not None:
+            op.done_sig.connect(callback)
+        op.go()
+        return op
+
+    def find_entity(self, filter_expr, limit=None, keys=None, callback=None):
+        """
+        Find the entities matching a filter expression on every server.  The
+        result is a dict mapping (server key, entity ID) to the entity.
+
+        :param filter_expr: The filter expression to search for.
+        :param limit: Optional limit to number of entities per server.
+        :param keys: Servers to query, default is all of them.
+        :param callback: Asynchronous result callback.
+        """
+        return self.fan_out(
+            "find_entity",
+            args=(filter_expr,),
+            kwargs={"limit": limit},
+            keys=keys,
+            merge=self._merge_entities,
+            callback=callback,
+        )
+
+    def read(self, ids=None, filter_expr=None, limit=None, keys=None, callback=None):
+        """
+        Read entities from every server.  The result is a single grid holding
+        the rows from all servers, with a `server` column giving the key of
+        the server each came from.
+
+        :param ids: IDs to read, either a list used for all servers, or a
+                    dict mapping server keys to the IDs to read from each (in
+                    which case only those servers are queried).
+        :param filter_expr: A filter expression that describes the entities
+                            of interest.
+        :param limit: A limit on the number of entities per server.
+        :param keys: Servers to query, default is all of them.
+        :param callback: Asynchronous result callback.
+        """
+        if isinstance(ids, dict):
+            per_server = ids
+            if keys is None:
+                keys = list(per_server.keys())
+            kwargs = lambda key: {
+                "ids": per_server[key],
+                "filter_expr": filter_expr,
+                "limit": limit,
+            }
+        else:
+            kwargs = {"ids": ids, "filter_expr": filter_expr, "limit": limit}
+
+        return self.fan_out(
+            "read", kwargs=kwargs, keys=keys, merge=self._merge_grids, callback=callback
+        )
+
+    def his_read_frame(
+        self, columns, rng, tz=None, frame_format=None, keys=None, callback=None
+    ):
+        """
+        Read the history of points on many servers.  If the servers all
+        return data frames, the result is a single data frame whose columns
+        are indexed by (server key, column); otherwise it is a dict mapping
+        server keys to their results.
+
+        :param columns: Dict mapping server keys to the columns (as accepted
+                        by `HaystackSession.his_read_frame`) to read from
+                        that server.  Only those servers are queried.
+        :param rng: Historical read range.
+        :param tz: Optional timezone to translate timestamps to.
+        :param frame_format: Optional desired format for the data frames.
+        :param keys: Servers to query, default is all of those in columns.
+        :param callback: Asynchronous result callback.
+        """
+        if keys is None:
+            keys = list(columns.keys())
+        return self.fan_out(
+            "his_read_frame",
+            args=lambda key: (columns[key], rng),
+            kwargs={"tz": tz, "frame_format": frame_format},
+            keys=keys,
+            merge=self._merge_frames,
+            callback=callback,
+        )
+
+    # Private methods/properties
+
+    def _submit(self, key, start):
+        """
+        Start a call on a server, or queue it if that server is busy.  The
+        call is given a `release` function to call once it is done.
+        """
+        with self._lock:
+            if self._in_flight[key] < self._max_concurrency:
+                self._in_flight[key] += 1
+                run = True
+            else:
+                self._pending[key].append(start)
+                run = False
+
+        if run:
+            self._run(key, start)
+
+    def _run(self, key, start):
+        released = []
+
+        def _release():
+            # Guard against a call releasing its slot twice.
+            if not released:
+                released.append(True)
+                self._release(key)
+
+        start(_release)
+
+    def _release(self, key):
+        """
+        A call on a server is done: start the next queued one, if any.
+        """
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending:
+                start = pending.popleft()
+            else:
+                start = None
+                if key in self._in_flight:
+                    self._in_flight[key] -= 1
+
+        if start is not None:
+            self._run(key, start)
+
+    @staticmethod
+    def _merge_entities(results):
+        merged = {}
+        for (key, entities) in iteritems(results):
+            for (entity_id, entity) in iteritems(entities):
+                merged[(key, entity_id)] = entity
+        return merged
+
+    def _merge_grids(self, results):
+        merged = hszinc.Grid()
+        merged.column[self.SERVER_COLUMN] = {}
+        for key in sorted(results.keys(), key=str):
+            grid = results[key]
+            for (col, meta) in iteritems(grid.column):
+                if col not in merged.column:
+                    merged.column[col] = meta
+            for row in grid:
+                row = dict(row)
+                row[self.SERVER_COLUMN] = key
+                merged.append(row)
+        return merged
+
+    @staticmethod
+    def _merge_frames(results):
+        if (
+            HAVE_PANDAS
+            and results
+            and all(isinstance(r, pandas.DataFrame) for r in results.values())
+        ):
+            keys = sorted(results.keys(), key=str)
+            return pandas.concat([results[k] for k in keys], axis=1, keys=keys)
+        return results
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Replica-aware session.  Some sites serve the same Haystack database from a
+primary server and one or more hot standbys.  A ReplicaHaystackSession holds
+a session to each, spreads read-only operations across those that are up
+(sending each to the one with the fewest requests in progress), and sends
+everything else to the primary::
+
+    session = ReplicaHaystackSession([
+        dict(implementation='skyspark', uri='https://primary', ...),
+        dict(implementation='skyspark', uri='https://standby', ...),
+    ])
+    session.read(filter_expr='site')    # Either server
+    session.point_write(...)            # Primary only
+
+A replica that cannot be connected to is skipped for `cooldown` seconds, and
+read-only operations that were sent to it are repeated on another replica.
+"""
+
+import logging
+from threading import Lock
+from time import time
+
+from .loader import get_instance
+from .session import HaystackSession
+from .ops import replica as replica_ops
+
+
+class ReplicaHaystackSession(object):
+    """
+    A session to a set of replicated Project Haystack servers.  The first
+    session given is the primary.  Methods not listed in `READ_ONLY_METHODS`
+    (and all attributes) are those of the primary session.
+    """
+
+    _REPLICA_OPERATION = replica_ops.ReplicaOperation
+
+    # Session methods that may be answered by any replica.
+    READ_ONLY_METHODS = (
+        "about",
+        "formats",
+        "ops",
+        "read",
+        "nav",
+        "his_read",
+        "his_read_series",
+        "his_read_frame",
+    )
+
+    def __init__(self, sessions, cooldown=30.0, write_failover=False, log=None):
+        """
+        Initialise a replica-aware session.
+
+        :param sessions: List of sessions, or of dicts of arguments for
+                         `pyhaystack.connect` (including 'implementation').
+                         The first is the primary.
+        :param cooldown: Number of seconds a replica that could not be
+                         reached is left out before it is tried again.
+        :param write_failover: If True, and the primary is down, other
+                               operations are sent to the first replica that
+                               is up instead.  Only enable this if the
+                               standby accepts writes.
+        :param log: Logging object for reporting messages.
+        """
+        if log is None:
+            log = logging.getLogger("pyhaystack.client.%s" % self.__class__.__name__)
+        self._log = log
+
+        self.sessions = []
+        for session in sessions:
+            if not isinstance(session, HaystackSession):
+                session = get_instance(**session)
+            self.sessions.append(session)
+        if not self.sessions:
+            raise ValueError("At least one session is required")
+
+        self._cooldown = cooldown
+        self._write_failover = write_failover
+        self._lock = Lock()
+        self._outstanding = [0] * len(self.sessions)
+        self._down_until = [0.0] * len(self.sessions)
+        self._next = 0
+
+    @property
+    def primary(self):
+        """
+        Return the session to the primary server.
+        """
+        return self.sessions[0]
+
+    @property
+    def healthy(self):
+        """
+        Return the indices of the replicas that are not marked as down.
+        """
+        now = time()
+        with self._lock:
+            return [idx for (idx, until) in enumerate(self._down_until) if until <= now]
+
+    @property
+    def outstanding(self):
+        """
+        Return the number of requests in progress on each replica.
+        """
+        with self._lock:
+            return list(self._outstanding)
+
+    def about(self, *args, **kwargs):
+        return self._read_only("about", args, kwargs)
+
+    def formats(self, *args, **kwargs):
+        return self._read_only("formats", args, kwargs)
+
+    def ops(self, *args, **kwargs):
+        return self._read_only("ops", args, kwargs)
+
+    def read(self, *args, **kwargs):
+        return self._read_only("read", args, kwargs)
+
+    def nav(self, *args, **kwargs):
+        return self._read_only("nav", args, kwargs)
+
+    def his_read(self, *args, **kwargs):
+        return self._read_only("his_read", args, kwargs)
+
+    def his_read_series(self, *args, **kwargs):
+        return self._read_only("his_read_series", args, kwargs)
+
+    def his_read_frame(self, *args, **kwargs):
+        return self._read_only("his_read_frame", args, kwargs)
+
+    def logout(self):
+        """
+        Log out of every replica.
+        """
+        for session in self.sessions:
+            try:
+                session.logout()
+            except:  # Don't let one replica stop the others.
+                self._log.warning("Failed to log out of %s", session, exc_info=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.logout()
+
+    def __getattr__(self, name):
+        # Anything not defined here is handled by the writable session.
+        if name.startswith("__") or (name == "sessions"):
+            raise AttributeError(name)
+        return getattr(self._writer(), name)
+
+    # Private methods/properties
+
+    def _read_only(self, method, args, kwargs):
+        """
+        Call a read-only session method on the best replica.
+        """
+        callback = kwargs.pop("callback", None)
+        op = self._REPLICA_OPERATION(self, method, args, kwargs)
+        if callback is not None:
+            op.done_sig.connect(callback)
+        op.go()
+        return op
+
+    def _writer(self):
+        """
+        Return the session that takes operations that may write.
+        """
+        if self._write_failover:
+            healthy = self.healthy
+            if healthy and (0 not in healthy):
+                return self.sessions[healthy[0]]
+        return self.primary
+
+    def _acquire(self, exclude=()):
+        """
+        Pick the replica with the fewest requests in progress, preferring
+        those that are up, and count a request against it.  Ties are broken
+        in turn, so idle replicas share the load.  Returns None if every
+        replica is excluded.
+        """
+        now = time()
+        count = len(self.sessions)
+        with self._lock:
+            candidates = [idx for idx in range(count) if idx not in exclude]
+            if not candidates:
+                return None
+
+            up = [idx for idx in candidates if self._down_until[idx] <= now]
+            if up:
+                candidates = up
+
+            start = self._next
+            idx = min(
+                candidates,
+                key=lambda idx: (self._outstanding[idx], (idx - start) % count),
+            )
+            self._next = (idx + 1) % count
+            self._outstanding[idx] += 1
+            return idx
+
+    def _release(self, idx):
+        """
+        A request on a replica is done.
+        """
+        with self._lock:
+            self._outstanding[idx] -= 1
+
+    def _mark_down(self, idx):
+        """
+        Leave a replica out for a while, as it could not be reached.
+        """
+        with self._lock:
+            self._down_until[idx] = time() + self._cooldown
+
+    def _mark_up(self, idx):
+        """
+        A replica answered, so it is up.
+        """
+        with self._lock:
+            self._down_until[idx] = 0.0
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Retry policy.  This decides whether a failed request is worth repeating, and
+how long to wait first.  Requests are only retried if the failure is likely
+to be transient (the server could not be reached, or said it is busy), and
+only if repeating them is safe: a request that may have changed something
+on the server is only repeated if the server said it did not process it.
+
+Retries back off exponentially, with "full jitter" (a random delay up to the
+backoff) so that many clients do not retry in lock-step, and wait at least
+as long as the server asks in a `Retry-After` header.  A per-session retry
+budget stops retries from multiplying the load on a server that is
+struggling: over any `budget_window` seconds, retries may be at most
+`budget_ratio` of requests (or `budget_min` retries, whichever is more).
+"""
+
+import random
+from collections import deque
+from email.utils import mktime_tz, parsedate_tz
+from threading import Lock
+from time import time
+
+from .http.exceptions import (
+    HTTPBaseError,
+    HTTPCircuitOpenError,
+    HTTPRedirectError,
+    HTTPStatusError,
+)
+from ..util.asyncexc import AsynchronousException
+
+
+class RetryPolicy(object):
+    """
+    Decides whether, and when, failed requests are retried.
+    """
+
+    # Status codes that may succeed if tried again later.
+    TRANSIENT_STATUS = (408, 429, 500, 502, 503, 504)
+
+    # Status codes where the server did not act on the request, so even a
+    # request that is not idempotent may be repeated.  401 is retried after
+    # logging in again.
+    NOT_PROCESSED_STATUS = (401, 429, 503)
+
+    def __init__(
+        self,
+        base_delay=0.5,
+        max_delay=30.0,
+        max_retry_after=120.0,
+        budget_ratio=0.2,
+        budget_min=10,
+        budget_window=10.0,
+    ):
+        """
+        Initialise a retry policy.
+
+        :param base_delay: Backoff before the first retry, in seconds.  This
+                           doubles with each further retry.  Set to 0 to
+                           retry immediately.
+        :param max_delay: Most a backoff may grow to, in seconds.
+        :param max_retry_after: Most a Retry-After header may delay a retry.
+                                Requests asked to wait longer fail.
+        :param budget_ratio: Fraction of requests that may be retries.
+        :param budget_min: Number of retries permitted regardless of ratio.
+        :param budget_window: Period (in seconds) the budget applies over.
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.budget_ratio = budget_ratio
+        self.budget_min = budget_min
+        self.budget_window = budget_window
+
+        self._lock = Lock()
+        self._requests = deque()
+        self._retries = deque()
+
+    def note_request(self):
+        """
+        Count a new request against the budget.
+        """
+        with self._lock:
+            now = time()
+            self._requests.append(now)
+            self._expire(now)
+
+    def get_delay(self, error, attempt, idempotent):
+        """
+        Return how long to wait before retrying a failed request, or None if
+        it should not be retried.
+
+        :param error: The failure, as an AsynchronousException.
+        :param attempt: Number of retries already made.
+        :param idempotent: Whether the request may safely be repeated.
+        """
+        exception = error
+        if isinstance(error, AsynchronousException):
+            exception = error.exception
+        if not self.is_retryable(exception, idempotent):
+            return None
+
+        if isinstance(exception, HTTPStatusError) and (exception.status == 401):
+            # Log in again, no need to wait.
+            delay = 0.0
+        else:
+            delay = random.uniform(
+                0, min(self.max_delay, self.base_delay * (2**attempt))
+            )
+
+        retry_after = self.get_retry_after(exception)
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            delay = max(delay, retry_after)
+
+        if not self._spend():
+            return None
+        return delay
+
+    def is_retryable(self, exception, idempotent):
+        """
+        Return whether a request that failed with the given exception may be
+        retried.
+        """
+        if isinstance(exception, HTTPStatusError):
+            if exception.status in self.NOT_PROCESSED_STATUS:
+                return True
+            return idempotent and (exception.status in self.TRANSIENT_STATUS)
+        if isinstance(exception, (HTTPRedirectError, HTTPCircuitOpenError)):
+            # Circuit open: the host is down, so fail fast.
+            return False
+        # Connection failures and time-outs.
+        return idempotent and isinstance(exception, (HTTPBaseError, IOError))
+
+    @staticmethod
+    def get_retry_after(exception):
+        """
+        Return the delay (in seconds) asked for by a Retry-After header, if
+        any.
+        """
+        headers = getattr(exception, "headers", None)
+        if not headers:
+            return None
+
+        value = None
+        for (name, header) in headers.items():
+            if isinstance(name, bytes):
+                name = name.decode("us-ascii")
+            if name.lower() == "retry-after":
+                value = header
+                break
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            value = value.decode("us-ascii")
+
+        value = value.strip()
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(0.0, mktime_tz(parsed) - time())
+
+    def _spend(self):
+        """
+        Spend a retry from the budget, if any is left.
+        """
+        with self._lock:
+            now = time()
+            self._expire(now)
+            allowed = max(self.budget_min, self.budget_ratio * len(self._requests))
+            if len(self._retries) >= allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+    def _expire(self, now):
+        cutoff = now - self.budget_window
+        for counts in (self._requests, self._retries):
+            while counts and (counts[0] < cutoff):
+                counts.popleft()
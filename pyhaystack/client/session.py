@@ -17,7 +17,15 @@ from .ops import grid as grid_ops
 from .ops import entity as entity_ops
 from .ops import his as his_ops
 from .ops import feature as feature_ops
+from .ops import point as point_ops
+from .ops import persist as persist_ops
 from .entity.models.haystack import HaystackTaggingModel
+from .hisbuffer import HisWriteBuffer
+from .watch import WatchManager
+from .curval import CurValStore
+from .persist import pack_map, unpack_map
+from .retry import RetryPolicy
+from ..util import hisgrid
 
 
 class HaystackSession(object):
@@ -54,8 +62,17 @@ class HaystackSession(object):
     _HIS_READ_FRAME_OPERATION = his_ops.HisReadFrameOperation
     _HIS_WRITE_SERIES_OPERATION = his_ops.HisWriteSeriesOperation
     _HIS_WRITE_FRAME_OPERATION = his_ops.HisWriteFrameOperation
+    _POINT_TZ_RESOLVE_OPERATION = his_ops.PointTzResolveOperation
+    _READ_CUR_VALS_OPERATION = point_ops.ReadCurValsOperation
+    _POINT_WRITE_MANY_OPERATION = point_ops.PointWriteManyOperation
 
     _HAS_FEATURES_OPERATION = feature_ops.HasFeaturesOperation
+    _SESSION_RESTORE_OPERATION = persist_ops.SessionRestoreOperation
+
+    _HIS_WRITE_BUFFER = HisWriteBuffer
+    _WATCH_MANAGER = WatchManager
+    _CUR_VAL_STORE = CurValStore
+    _RETRY_POLICY = RetryPolicy
 
     def __init__(
         self,
@@ -68,6 +85,10 @@ class HaystackSession(object):
         log=None,
         pint=False,
         cache_expiry=3600.0,
+        cur_val_max_age=0.0,
+        cur_val_capacity=64,
+        state_store=None,
+        retry_policy=None,
     ):
         """
         Initialise a base Project Haystack session handler.
@@ -81,6 +102,16 @@ class HaystackSession(object):
         :param log: Logging object for reporting messages.
         :param pint: Configure hszinc to use basic quantity or Pint Quanity
         :param cache_expiry: Number of seconds before cached data expires.
+        :param cur_val_max_age: Number of seconds a point's current value,
+                                as seen in a read or watch, may be used
+                                for `point.value` before it is read again.
+        :param cur_val_capacity: Number of recent values kept per point.
+        :param state_store: Optional SessionStateStore, used to save the
+                            authentication state after logging in, and to
+                            resume from it instead of logging in again.
+        :param retry_policy: RetryPolicy deciding which failed requests are
+                             retried, and how long to wait first.  Defaults
+                             to retrying transient failures with backoff.
 
         See : https://pint.readthedocs.io/ for details about pint
         """
@@ -107,6 +138,15 @@ class HaystackSession(object):
         # Current in-progress authentication operation, if any.
         self._auth_op = None
 
+        # Retry policy for failed requests
+        if retry_policy is None:
+            retry_policy = self._RETRY_POLICY()
+        self._retry_policy = retry_policy
+
+        # Saved authentication state
+        self._state_store = state_store
+        self._pre_state = None
+
         # Entity references, stored as weakrefs
         self._entities = weakref.WeakValueDictionary()
 
@@ -118,6 +158,23 @@ class HaystackSession(object):
         self._grid_expiry = cache_expiry
         self._grid_cache = {}  # 'op' -> (op, expiry, grid)
 
+        # Point timezone cache
+        self._tz_lk = Lock()
+        self._tz_cache = {}  # point_id -> (tzinfo, source entity IDs)
+
+        # History write-behind buffers, flushed on logout.  These are held
+        # until closed, so pending samples are not lost if the caller drops
+        # a buffer.
+        self._his_buffers = set()
+
+        # Watch managers, closed on logout.
+        self._watch_managers = weakref.WeakSet()
+
+        # Current values of points, fed by reads and watches.
+        self._cur_vals = self._CUR_VAL_STORE(
+            capacity=cur_val_capacity, max_age=cur_val_max_age
+        )
+
     # Public methods/properties
 
     def authenticate(self, callback=None):
@@ -133,8 +190,12 @@ class HaystackSession(object):
 
         new = auth_op is None
         if new:
-            auth_op = self._AUTH_OPERATION(self)
-            auth_op.done_sig.connect(self._on_authenticate_done)
+            if self._state_store is not None:
+                auth_op = self._SESSION_RESTORE_OPERATION(self)
+                auth_op.done_sig.connect(self._on_restore_done)
+            else:
+                auth_op = self._AUTH_OPERATION(self)
+                auth_op.done_sig.connect(self._on_authenticate_done)
 
         if callback is not None:
             if auth_op.is_done:
@@ -182,10 +243,40 @@ class HaystackSession(object):
                             of interest.
         :param limit: A limit on the number of entities to return.
         """
+
+        if self._cur_vals.enabled:
+            # Record any current values seen, for `point.value`.
+            callback = self._store_cur_vals_callback(callback)
         return self._on_read(
             ids=ids, filter_expr=filter_expr, limit=limit, callback=callback
         )
 
+    def read_cur_vals(self, points, batch_size=100, result_format=None, callback=None):
+        """
+        Read the current values of many points, using as few requests as
+        possible.
+
+        :param points: Points (entities or IDs) to read.
+        :param batch_size: Maximum number of points per read request.
+        :param result_format: 'dict' to return a dict of values (Quantity
+                              objects keep their units), or 'series' to
+                              return a Pandas series with the units given
+                              in its metadata.  Defaults to 'series' if
+                              Pandas is available.
+        :param callback: Asynchronous result callback.
+        """
+        if result_format is None:
+            if his_ops.HAVE_PANDAS:
+                result_format = self._READ_CUR_VALS_OPERATION.FORMAT_SERIES
+            else:
+                result_format = self._READ_CUR_VALS_OPERATION.FORMAT_DICT
+
+        op = self._READ_CUR_VALS_OPERATION(self, points, batch_size, result_format)
+        if callback is not None:
+            op.done_sig.connect(callback)
+        op.go()
+        return op
+
     def nav(self, nav_id=None, callback=None):
         """
         The nav op is used navigate a project for learning and discovery. This
@@ -253,6 +344,37 @@ class HaystackSession(object):
             callback=callback,
         )
 
+    def point_write_many(
+        self,
+        writes,
+        who=None,
+        max_concurrency=8,
+        batch_size=100,
+        strategy="single",
+        callback=None,
+    ):
+        """
+        Write values to many points.  writes is a list of (point, level, val)
+        or (point, level, val, duration) tuples.
+
+        By default, up to max_concurrency single pointWrite requests are sent
+        at a time.  Batching is opt-in: with strategy='multi', the writes are
+        posted as multi-row pointWrite grids of up to batch_size rows.  Only
+        use this if the server is known to accept them, as the standard
+        pointWrite op takes a single row.
+
+        The result is a list with an entry for each write: None if it
+        succeeded, otherwise the exception that caused it to fail.
+        """
+        who = who or self._username
+        op = self._POINT_WRITE_MANY_OPERATION(
+            self, writes, who, max_concurrency, batch_size, strategy
+        )
+        if callback is not None:
+            op.done_sig.connect(callback)
+        op.go()
+        return op
+
     def his_read(self, point, rng, callback=None):
         """
         point is either the ID of the historical point entity, or an instance
@@ -402,6 +524,73 @@ class HaystackSession(object):
         op.go()
         return op
 
+    def resolve_point_tz(self, points, refresh=False, callback=None):
+        """
+        Resolve the timezones of many points at once.  The timezone of each
+        point is taken from its own 'tz' tag, or failing that, that of its
+        equip or site.  Points, equips and sites are each retrieved in a
+        single read, and the results are cached by the session for later
+        history writes.
+
+        Result is a dict mapping point IDs to datetime.tzinfo instances (or
+        None if the timezone could not be determined).
+
+        :param points: A list of point entities or IDs.
+        :param refresh: Ignore timezones previously cached by the session.
+        :param callback: Asynchronous result callback.
+        """
+        op = self._POINT_TZ_RESOLVE_OPERATION(self, points, refresh)
+        if callback is not None:
+            op.done_sig.connect(callback)
+        op.go()
+        return op
+
+    def his_write_buffer(self, max_samples=1000, flush_interval=60.0, **kwargs):
+        """
+        Create a write-behind buffer for historical data.  Samples added to
+        the buffer are written in batches once `max_samples` samples are
+        pending or every `flush_interval` seconds.  The session holds each
+        buffer until it is closed, and any buffers still open are flushed
+        when the session logs out.
+
+        :param max_samples: Number of pending samples that triggers a flush.
+        :param flush_interval: Maximum number of seconds between flushes.
+
+        See :py:class:`pyhaystack.client.hisbuffer.HisWriteBuffer` for the
+        other keyword arguments.
+        """
+        buf = self._HIS_WRITE_BUFFER(
+            self, max_samples=max_samples, flush_interval=flush_interval, **kwargs
+        )
+        self._his_buffers.add(buf)
+        return buf
+
+    def watch_manager(self, poll_interval=10.0, lease=60.0, **kwargs):
+        """
+        Create a watch manager, which subscribes points to a watch and polls
+        it for changes in a background thread (once started).  Any watch
+        managers still open are closed when the session logs out.
+
+        :param poll_interval: Number of seconds between polls of the watch.
+        :param lease: Lease time (in seconds) to request for the watch.
+
+        See :py:class:`pyhaystack.client.watch.WatchManager` for the other
+        keyword arguments.
+        """
+        manager = self._WATCH_MANAGER(
+            self, poll_interval=poll_interval, lease=lease, **kwargs
+        )
+        self._watch_managers.add(manager)
+        return manager
+
+    @property
+    def cur_vals(self):
+        """
+        Return the store of point current values seen in reads and watches.
+        See :py:class:`pyhaystack.client.curval.CurValStore`.
+        """
+        return self._cur_vals
+
     @property
     def site(self):
         """
@@ -505,7 +694,7 @@ class HaystackSession(object):
             grid.extend([{"id": self._obj_to_ref(p)} for p in points])
         else:
             grid.metadata["close"] = hszinc.MARKER
-        return self._post_grid("watchSub", grid, callback, **kwargs)
+        return self._post_grid("watchUnsub", grid, callback, **kwargs)
 
     def _on_watch_poll(self, watch, refresh, callback, **kwargs):
         grid = hszinc.Grid()
@@ -514,6 +703,8 @@ class HaystackSession(object):
         if not isinstance(watch, string_types):
             watch = watch.id
         grid.metadata["watchId"] = watch
+        if refresh:
+            grid.metadata["refresh"] = hszinc.MARKER
         return self._post_grid("watchPoll", grid, callback, **kwargs)
 
     def _on_point_write(self, point, level, val, who, duration, callback, **kwargs):
@@ -553,18 +744,22 @@ class HaystackSession(object):
     def _on_his_write(
         self, point, timestamp_records, callback, post_format=hszinc.MODE_ZINC, **kwargs
     ):
-        grid = hszinc.Grid()
-        grid.metadata["id"] = self._obj_to_ref(point)
-        grid.column["ts"] = {}
-        grid.column["val"] = {}
-
         if hasattr(timestamp_records, "to_dict"):
             timestamp_records = timestamp_records.to_dict()
 
         timestamp_records = list(timestamp_records.items())
         timestamp_records.sort(key=lambda rec: rec[0])
-        for (ts, val) in timestamp_records:
-            grid.append({"ts": ts, "val": val})
+
+        if post_format == hszinc.MODE_ZINC:
+            # Fixed shape grid, write the ZINC text out directly.
+            grid = hisgrid.dump_his_write(self._obj_to_ref(point), timestamp_records)
+        else:
+            grid = hszinc.Grid()
+            grid.metadata["id"] = self._obj_to_ref(point)
+            grid.column["ts"] = {}
+            grid.column["val"] = {}
+            for (ts, val) in timestamp_records:
+                grid.append({"ts": ts, "val": val})
 
         return self._post_grid(
             "hisWrite", grid, callback, post_format=post_format, **kwargs
@@ -680,6 +875,52 @@ class HaystackSession(object):
             "Don't know how to get the ID from a %s" % obj.__class__.__name__
         )
 
+    def _get_cached_point_tz(self, point):
+        """
+        Return the cached timezone of a point, or None if not known.
+        """
+        point_id = self._obj_to_ref(point).name
+        with self._tz_lk:
+            try:
+                return self._tz_cache[point_id][0]
+            except KeyError:
+                return None
+
+    def _cache_point_tz(self, point, tz, sources=None):
+        """
+        Cache the resolved timezone of a point.  `sources` lists the IDs of
+        the entities the timezone was derived from, a change to any of their
+        timezone-related tags will invalidate the cached value.
+        """
+        point_id = self._obj_to_ref(point).name
+        sources = set(sources or [])
+        sources.add(point_id)
+        with self._tz_lk:
+            self._tz_cache[point_id] = (tz, frozenset(sources))
+
+    def _invalidate_point_tz(self, entity_id):
+        """
+        Drop cached point timezones derived from the given entity.
+        """
+        with self._tz_lk:
+            stale = [
+                point_id
+                for point_id, (_, sources) in self._tz_cache.items()
+                if entity_id in sources
+            ]
+            for point_id in stale:
+                self._tz_cache.pop(point_id, None)
+
+    def _evict_entities(self, entity_ids):
+        """
+        Forget everything held locally about the given entities, e.g. because
+        they have been deleted.
+        """
+        for entity_id in entity_ids:
+            self._entities.pop(entity_id, None)
+            self._cur_vals.discard(entity_id)
+            self._invalidate_point_tz(entity_id)
+
     # Private methods/properties
 
     def _on_authenticate_done(self, operation, **kwargs):
@@ -691,6 +932,84 @@ class HaystackSession(object):
         """
         raise NotImplementedError("To be implemented in %s" % self.__class__.__name__)
 
+    def _on_restore_done(self, operation, **kwargs):
+        """
+        Process the result of a session restore operation.  If the saved
+        state was restored, the session is ready.  Otherwise this is the
+        result of a log-in, which is saved if it succeeded.
+        """
+        if operation.restored:
+            self._auth_op = None
+            return
+
+        self._on_authenticate_done(operation, **kwargs)
+        if self.is_logged_in:
+            self._save_state()
+
+    def _state_key(self):
+        """
+        Return the key identifying this session's saved state.
+        """
+        return "%s %s %s" % (
+            self.__class__.__name__,
+            self._client.uri,
+            getattr(self, "_username", None),
+        )
+
+    def _export_state(self):
+        """
+        Return the authentication state of the session as a JSON-compatible
+        dict.  Subclasses add anything else they need to resume, and set
+        'expires' (seconds since epoch) if their credentials expire.
+        """
+        return {
+            "headers": pack_map(self._client.headers),
+            "cookies": pack_map(self._client.cookies),
+            "expires": None,
+        }
+
+    def _import_state(self, state):
+        """
+        Resume the authentication state exported by `_export_state`.  If state
+        is None, put back the state the session had before.  Subclasses mark
+        themselves logged in (or out) accordingly.
+        """
+        if state is None:
+            if self._pre_state is not None:
+                (self._client.headers, self._client.cookies) = self._pre_state
+                self._pre_state = None
+            return
+
+        self._pre_state = (self._client.headers, self._client.cookies)
+        self._client.headers = unpack_map(state.get("headers"))
+        self._client.cookies = unpack_map(state.get("cookies"))
+
+    def _load_state(self):
+        """
+        Return the saved state of this session, if any.
+        """
+        if self._state_store is None:
+            return None
+        return self._state_store.load(self._state_key())
+
+    def _save_state(self):
+        """
+        Save the authentication state of this session.
+        """
+        if self._state_store is None:
+            return
+        try:
+            self._state_store.save(self._state_key(), self._export_state())
+        except:  # Saving is best-effort, we're logged in regardless.
+            self._log.warning("Unable to save session state", exc_info=1)
+
+    def _discard_state(self):
+        """
+        Forget the saved state of this session.
+        """
+        if self._state_store is not None:
+            self._state_store.discard(self._state_key())
+
     def config_pint(self, value=False):
         if value:
             self._use_pint = True
@@ -701,6 +1020,49 @@ class HaystackSession(object):
     def logout(self):
         raise NotImplementedError("Must be defined depending on each implementation")
 
+    def _store_cur_vals_callback(self, callback):
+        """
+        Return a read callback that records the current values found before
+        calling `callback`.
+        """
+
+        def _on_read_done(operation, **kwargs):
+            self._store_cur_vals(operation)
+            if callback is not None:
+                callback(operation=operation, **kwargs)
+
+        return _on_read_done
+
+    def _store_cur_vals(self, operation):
+        """
+        Record the current values found in the result of a read.
+        """
+        if operation.is_failed:
+            # The caller will see the error.
+            return
+        # The grid is only read, so spare copying it.
+        self._cur_vals.update_rows(operation._result)
+
+    def _close_his_buffers(self):
+        """
+        Flush and close any history write buffers still open.
+        """
+        for buf in list(self._his_buffers):
+            try:
+                buf.close()
+            except:  # Don't let one buffer stop the others.
+                self._log.warning("Failed to flush history buffer", exc_info=1)
+
+    def _close_watch_managers(self):
+        """
+        Stop and close any watch managers still open.
+        """
+        for manager in list(self._watch_managers):
+            try:
+                manager.close()
+            except:  # Don't let one watch stop the others.
+                self._log.warning("Failed to close watch", exc_info=1)
+
     def __enter__(self):
         """Entering context manager
 
@@ -713,5 +1075,8 @@ class HaystackSession(object):
         return self
 
     def __exit__(self, _type, value, traceback):
-        """On exit, call the logout procedure defined in the class"""
+        """On exit, flush history buffers and close watches then call the
+        logout procedure defined in the class"""
+        self._close_his_buffers()
+        self._close_watch_managers()
         self.logout()
@@ -164,6 +164,10 @@ class SkysparkScramHaystackSession(HaystackSession, evalexpr.EvalOpsMixin):
         finally:
             self._auth_op = None
 
+    def _import_state(self, state):
+        super(SkysparkScramHaystackSession, self)._import_state(state)
+        self._authenticated = state is not None
+
     def logout(self):
         """close session when leaving context by trick given by Brian Frank
 
@@ -171,6 +175,10 @@ class SkysparkScramHaystackSession(HaystackSession, evalexpr.EvalOpsMixin):
 
         but beware that this is not standard!"""
 
+        self._close_his_buffers()
+        self._close_watch_managers()
+        self._discard_state()
+
         # TODO: Rewrite this when a standard way to close sessions is
         #       implemented in Skyspark.
         def callback(response):
@@ -0,0 +1,581 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Watch manager.  This maintains server-side watches on behalf of the
+application: it subscribes points, polls the watches for changes on a regular
+cadence in a background thread, keeps the watches' leases alive and
+re-subscribes if the server loses a watch.  Changes are dispatched to
+callbacks registered against a list of points or a filter expression.
+
+Large point sets may be split across several watches (shards) of a limited
+size, which are polled together; their changes are merged into a single
+stream.
+
+Typical usage::
+
+    def on_change(changes):
+        for (point_id, row) in changes.items():
+            print(point_id, row.get('curVal'))
+
+    watches = session.watch_manager(poll_interval=5.0, shard_size=1000)
+    watches.watch(['my.point.a', 'my.point.b'], on_change)
+    watches.watch_filter('point and sensor and temp', on_change)
+    watches.start()
+    # … later …
+    watches.close()
+"""
+
+from threading import Event, RLock, Thread
+from time import time
+
+import hszinc
+from six import string_types
+
+from ..exception import HaystackError
+from .ops import watch as watch_ops
+
+
+class WatchShard(object):
+    """
+    One server-side watch, holding some or all of a manager's points.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.points = set()
+        self.watch_id = None
+        self.opening = False
+        self.deferred = set()
+        self.last_contact = None
+
+    def __repr__(self):
+        return "<%s %d: %s, %d points>" % (
+            self.__class__.__name__,
+            self.index,
+            self.watch_id,
+            len(self.points),
+        )
+
+
+class WatchListener(object):
+    """
+    A set of watched points, and the callback to notify when any of them
+    change.  Returned by `WatchManager.watch` and `WatchManager.watch_filter`.
+    """
+
+    def __init__(self, points, on_change, filter_expr=None):
+        self.points = frozenset(points)
+        self.on_change = on_change
+        self.filter_expr = filter_expr
+
+    def __repr__(self):
+        return "<%s %s>" % (
+            self.__class__.__name__,
+            self.filter_expr or ("%d points" % len(self.points)),
+        )
+
+
+class WatchManager(object):
+    """
+    Manage watches on the server, polling them for changes.
+    """
+
+    _POLL_OPERATION = watch_ops.WatchPollOperation
+
+    # Fraction of the lease that may elapse before the server is contacted
+    # again to keep a watch alive.
+    LEASE_MARGIN = 0.5
+
+    # Length in seconds of each of the lease units a server may return.
+    LEASE_UNITS = {
+        None: 1.0,
+        "": 1.0,
+        "ms": 0.001,
+        "s": 1.0,
+        "sec": 1.0,
+        "min": 60.0,
+        "h": 3600.0,
+        "hr": 3600.0,
+    }
+
+    def __init__(
+        self,
+        session,
+        poll_interval=10.0,
+        lease=60.0,
+        watch_dis=None,
+        shard_size=None,
+        log=None,
+    ):
+        """
+        Initialise a new watch manager.
+
+        :param session: Haystack HTTP session object.
+        :param poll_interval: Number of seconds between polls of the watches.
+        :param lease: Lease time (in seconds) to request for the watches.
+        :param watch_dis: Debug string to give the watches on the server.
+        :param shard_size: Maximum number of points per server-side watch.
+                           If None, all points share one watch.
+        :param log: Logging object for reporting messages.
+        """
+        if log is None:
+            log = session._log.getChild("watch")
+        self._log = log
+        self._session = session
+        self._poll_interval = poll_interval
+        self._lease = lease
+        self._watch_dis = watch_dis
+        self._shard_size = shard_size
+
+        self._lock = RLock()
+        self._listeners = []
+        self._points = {}  # point_id -> number of listeners
+        self._values = {}  # point_id -> last row seen
+        self._shards = []
+        self._shard_of = {}  # point_id -> shard
+        self._next_shard = 0
+        self._last_poll = 0.0
+
+        self._thread = None
+        self._stop_evt = Event()
+
+    @property
+    def watch_id(self):
+        """
+        Return the server's ID for the (first) watch, or None if not
+        subscribed.
+        """
+        ids = self.watch_ids
+        if ids:
+            return ids[0]
+        return None
+
+    @property
+    def watch_ids(self):
+        """
+        Return the server's IDs for all open watches.
+        """
+        with self._lock:
+            return [s.watch_id for s in self._shards if s.watch_id is not None]
+
+    @property
+    def lease(self):
+        """
+        Return the lease time of the watches, in seconds.
+        """
+        return self._lease
+
+    @property
+    def points(self):
+        """
+        Return the IDs of all points being watched.
+        """
+        with self._lock:
+            return frozenset(self._points.keys())
+
+    @property
+    def is_running(self):
+        """
+        Return true if the background poll thread is running.
+        """
+        return (self._thread is not None) and self._thread.is_alive()
+
+    def get(self, point):
+        """
+        Return the last row seen for a point, or None if not yet known.
+        """
+        with self._lock:
+            return self._values.get(self._point_id(point))
+
+    def watch(self, points, on_change=None):
+        """
+        Watch a list of points.  on_change is called as on_change(changes)
+        with a dict mapping the IDs of the points that changed to their new
+        watch rows.
+
+        :param points: List of point entities or IDs to watch.
+        :param on_change: Callback function for changes.
+        """
+        listener = WatchListener(map(self._point_id, points), on_change)
+        self._add_listener(listener)
+        return listener
+
+    def watch_filter(self, filter_expr, on_change=None):
+        """
+        Watch the points that match a filter expression.  The matching points
+        are looked up once, when this method is called.
+
+        :param filter_expr: Filter expression selecting the points.
+        :param on_change: Callback function for changes.
+        """
+        listener = WatchListener([], on_change, filter_expr=filter_expr)
+
+        def _on_read(operation, **kwargs):
+            try:
+                grid = operation.result
+            except:  # Catch all exceptions to report them.
+                self._log.warning("Failed to look up %r", filter_expr, exc_info=1)
+                return
+            listener.points = frozenset(
+                [row["id"].name for row in grid if row.get("id") is not None]
+            )
+            self._add_listener(listener)
+
+        self._session.read(filter_expr=filter_expr, callback=_on_read)
+        return listener
+
+    def unwatch(self, listener):
+        """
+        Stop delivering changes to a listener.  Points no longer of interest
+        to any listener are removed from the watches.
+        """
+        by_shard = {}
+        with self._lock:
+            try:
+                self._listeners.remove(listener)
+            except ValueError:
+                return
+
+            for point_id in listener.points:
+                count = self._points.get(point_id, 0) - 1
+                if count > 0:
+                    self._points[point_id] = count
+                    continue
+
+                self._points.pop(point_id, None)
+                self._values.pop(point_id, None)
+                shard = self._shard_of.pop(point_id, None)
+                if shard is not None:
+                    shard.points.discard(point_id)
+                    by_shard.setdefault(shard, []).append(point_id)
+
+            requests = []
+            for shard, removed in by_shard.items():
+                if shard.watch_id is None:
+                    continue
+                if shard.points:
+                    requests.append((shard.watch_id, removed))
+                else:
+                    # Nothing left on this watch, close it.
+                    requests.append((shard.watch_id, None))
+                    shard.watch_id = None
+            self._shards = [s for s in self._shards if s.points]
+
+        for watch_id, removed in requests:
+            self._session.watch_unsub(watch_id, points=removed)
+
+    def poll(self, refresh=False, callback=None):
+        """
+        Poll the watches for changes.  Any watch not currently open on the
+        server is (re-)subscribed instead.  Returns the operation, whose
+        result is a dict mapping the IDs of changed points to their rows.
+
+        :param refresh: Request the current values of all watched points.
+        :param callback: Asynchronous result callback.
+        """
+        with self._lock:
+            self._last_poll = time()
+            shards = list(self._shards)
+
+        op = self._POLL_OPERATION(self, shards, refresh)
+        op.done_sig.connect(self._on_poll_done)
+        if callback is not None:
+            op.done_sig.connect(callback)
+        op.go()
+        return op
+
+    def start(self):
+        """
+        Start polling in a background thread.
+        """
+        if self.is_running:
+            return
+        self._stop_evt.clear()
+        self._thread = Thread(target=self._run, name="pyhaystack-watch")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background poll thread.
+        """
+        self._stop_evt.set()
+        thread = self._thread
+        self._thread = None
+        if (thread is not None) and thread.is_alive():
+            thread.join()
+
+    def close(self):
+        """
+        Stop polling and close the watches on the server.
+        """
+        self.stop()
+        with self._lock:
+            watch_ids = []
+            for shard in self._shards:
+                if shard.watch_id is not None:
+                    watch_ids.append(shard.watch_id)
+                    shard.watch_id = None
+        for watch_id in watch_ids:
+            self._session.watch_unsub(watch_id)
+
+    # Private methods
+
+    def _point_id(self, point):
+        """
+        Return the fully qualified ID of a point as a string.
+        """
+        if isinstance(point, string_types):
+            return point
+        return self._session._obj_to_ref(point).name
+
+    def _assign_shard(self, point_id):
+        """
+        Choose a shard for a newly watched point, creating one if all are
+        full.
+        """
+        for shard in self._shards:
+            if (self._shard_size is None) or (len(shard.points) < self._shard_size):
+                break
+        else:
+            shard = WatchShard(self._next_shard)
+            self._next_shard += 1
+            self._shards.append(shard)
+
+        shard.points.add(point_id)
+        self._shard_of[point_id] = shard
+        return shard
+
+    def _add_listener(self, listener):
+        """
+        Register a listener and subscribe any points not yet watched.
+        """
+        by_shard = {}
+        with self._lock:
+            self._listeners.append(listener)
+            for point_id in listener.points:
+                if point_id not in self._points:
+                    self._points[point_id] = 0
+                    shard = self._assign_shard(point_id)
+                    by_shard.setdefault(shard, []).append(point_id)
+                self._points[point_id] += 1
+
+        for shard, added in by_shard.items():
+            self._request(shard, on_changes=self._dispatch, points=added)
+
+    def _request(self, shard, on_changes, points=None, refresh=False):
+        """
+        Issue the next request for a shard: open its watch, add points to
+        the open watch or poll it.  on_changes is called with the changes
+        reported in the response.  Returns the operation, or None if the
+        watch is still being opened.
+        """
+        with self._lock:
+            watch_id = shard.watch_id
+            if watch_id is None:
+                if shard.opening:
+                    # Add these once the watch is open.
+                    shard.deferred.update(points or [])
+                    return None
+                # Open the watch with everything the shard has.
+                points = list(shard.points)
+                if not points:
+                    return None
+                shard.opening = True
+
+        if watch_id is None:
+            self._log.debug("Opening watch %d with %d points", shard.index, len(points))
+            watch_dis = self._watch_dis
+            if (watch_dis is not None) and (self._shard_size is not None):
+                watch_dis = "%s #%d" % (watch_dis, shard.index)
+            return self._session.watch_sub(
+                points,
+                watch_dis=watch_dis,
+                lease=hszinc.Quantity(self._lease, "s"),
+                callback=lambda operation, **kw: self._on_open(
+                    shard, operation, on_changes
+                ),
+            )
+
+        if points:
+            self._log.debug("Adding %d points to watch %s", len(points), watch_id)
+            return self._session.watch_sub(
+                points,
+                watch_id=watch_id,
+                callback=lambda operation, **kw: on_changes(
+                    self._on_sub(shard, operation)
+                ),
+            )
+
+        return self._session.watch_poll(
+            watch_id,
+            refresh=refresh,
+            callback=lambda operation, **kw: on_changes(
+                self._on_poll(shard, operation)
+            ),
+        )
+
+    def _on_open(self, shard, operation, on_changes):
+        """
+        Handle the response to the watchSub request that opens a watch, then
+        subscribe any points added to the shard in the meantime.
+        """
+        with self._lock:
+            shard.opening = False
+            deferred = [p for p in shard.deferred if p in shard.points]
+            shard.deferred.clear()
+
+        on_changes(self._on_sub(shard, operation))
+        if deferred and (shard.watch_id is not None):
+            self._request(shard, on_changes=self._dispatch, points=deferred)
+
+    def _on_sub(self, shard, operation):
+        """
+        Handle the response to a watchSub request, returning the changes.
+        """
+        try:
+            grid = operation.result
+        except:  # Catch all exceptions so we retry on the next poll.
+            self._log.warning("Failed to subscribe watch", exc_info=1)
+            self._on_failure(shard)
+            return {}
+
+        with self._lock:
+            watch_id = grid.metadata.get("watchId")
+            if watch_id is not None:
+                shard.watch_id = watch_id
+            lease = grid.metadata.get("lease")
+            if lease is not None:
+                self._lease = self._lease_seconds(lease)
+            shard.last_contact = time()
+        return self._process(grid)
+
+    def _on_poll(self, shard, operation):
+        """
+        Handle the response to a watchPoll request, returning the changes.
+        """
+        try:
+            grid = operation.result
+        except HaystackError:
+            # The server has most likely forgotten our watch.
+            self._log.warning("Watch %s lost", shard.watch_id, exc_info=1)
+            with self._lock:
+                shard.watch_id = None
+            return {}
+        except:  # Catch all exceptions so we retry on the next poll.
+            self._log.warning("Failed to poll watch", exc_info=1)
+            self._on_failure(shard)
+            return {}
+
+        with self._lock:
+            shard.last_contact = time()
+            points = list(shard.points)
+        # Points not reported have not changed, so their values are current.
+        self._session.cur_vals.touch(points, shard.last_contact)
+        return self._process(grid)
+
+    def _on_poll_done(self, operation, **kwargs):
+        """
+        Dispatch the merged changes from a poll of all the watches.
+        """
+        try:
+            changes = operation.result
+        except:  # Catch all exceptions to report them.
+            self._log.warning("Poll failed", exc_info=1)
+            return
+        self._dispatch(changes)
+
+    def _on_failure(self, shard):
+        """
+        Decide whether a watch survived a failed request: once its lease has
+        lapsed we must assume the server has closed it.
+        """
+        with self._lock:
+            if (shard.last_contact is None) or (
+                (time() - shard.last_contact) >= self._lease
+            ):
+                shard.watch_id = None
+
+    def _process(self, grid):
+        """
+        Pick out the rows of points that have changed from a watch grid.
+        """
+        changes = {}
+        seen = []
+        with self._lock:
+            for row in grid:
+                ref = row.get("id")
+                if not isinstance(ref, hszinc.Ref):
+                    continue
+                point_id = ref.name
+                if point_id not in self._points:
+                    continue
+                seen.append(point_id)
+                rec = dict(row)
+                if self._values.get(point_id) != rec:
+                    self._values[point_id] = rec
+                    changes[point_id] = rec
+        self._session.cur_vals.touch(seen)
+        self._session.cur_vals.update_rows(changes.values())
+        return changes
+
+    def _dispatch(self, changes):
+        """
+        Notify the listeners interested in the changed points.
+        """
+        if not changes:
+            return
+
+        self._log.debug("%d points changed", len(changes))
+        with self._lock:
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            if listener.on_change is None:
+                continue
+            listener_changes = dict(
+                [(p, changes[p]) for p in listener.points if p in changes]
+            )
+            if not listener_changes:
+                continue
+            try:
+                listener.on_change(listener_changes)
+            except:  # Don't let one listener stop the others.
+                self._log.warning("Listener %r failed", listener, exc_info=1)
+
+    def _lease_seconds(self, lease):
+        """
+        Convert a lease time given by the server to seconds.
+        """
+        if isinstance(lease, hszinc.Quantity):
+            return float(lease.value) * self.LEASE_UNITS.get(lease.unit, 1.0)
+        return float(lease)
+
+    def _next_delay(self):
+        """
+        Return the number of seconds until the next poll is due.  Polling a
+        watch renews its lease, so we poll early if a lease demands it.
+        """
+        with self._lock:
+            due = []
+            if self._poll_interval is not None:
+                due.append(self._last_poll + self._poll_interval)
+            for shard in self._shards:
+                if (shard.watch_id is not None) and (shard.last_contact is not None):
+                    due.append(shard.last_contact + (self._lease * self.LEASE_MARGIN))
+        if not due:
+            return None
+        return max(min(due) - time(), 0.0)
+
+    def _run(self):
+        """
+        Background poll loop.
+        """
+        while not self._stop_evt.wait(self._next_delay()):
+            try:
+                self.poll().wait()
+            except:  # Never let the poll thread die.
+                self._log.warning("Poll failed", exc_info=1)
+                # Don't spin if poll fails straight away.
+                self._last_poll = time()
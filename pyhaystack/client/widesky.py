@@ -4,14 +4,19 @@
 VRT Widesky Client support
 """
 
+from threading import Lock, Timer
 from time import time
 from .session import HaystackSession
 from .ops.vendor.widesky import (
     WideskyAuthenticateOperation,
+    WideskyRefreshTokenOperation,
     CreateEntityOperation,
+    BulkCreateEntityOperation,
+    BulkDeleteOperation,
     WideSkyHasFeaturesOperation,
     WideSkyPasswordChangeOperation,
 )
+from .entity.ops.crud import EntityTagCommitAllOperation
 from .mixins.vendor.widesky import crud, multihis, password
 from ..util.asyncexc import AsynchronousException
 from .http.exceptions import HTTPStatusError
@@ -41,7 +46,11 @@ class WideskyHaystackSession(
     """
 
     _AUTH_OPERATION = WideskyAuthenticateOperation
+    _REFRESH_TOKEN_OPERATION = WideskyRefreshTokenOperation
     _CREATE_ENTITY_OPERATION = CreateEntityOperation
+    _BULK_CREATE_ENTITY_OPERATION = BulkCreateEntityOperation
+    _BULK_DELETE_OPERATION = BulkDeleteOperation
+    _ENTITY_TAG_COMMIT_ALL_OPERATION = EntityTagCommitAllOperation
     _HAS_FEATURES_OPERATION = WideSkyHasFeaturesOperation
     _PASSWORD_CHANGE_OPERATION = WideSkyPasswordChangeOperation
 
@@ -55,6 +64,7 @@ class WideskyHaystackSession(
         api_dir="api",
         auth_dir="oauth2/token",
         impersonate=None,
+        refresh_margin=60.0,
         **kwargs
     ):
         """
@@ -66,6 +76,10 @@ class WideskyHaystackSession(
         :param client_id: Authentication client ID.
         :param client_secret: Authentication client secret.
         :param impersonate: A widesky user ID to impersonate (or None)
+        :param refresh_margin: Number of seconds before the access token
+                               expires to obtain a new one using the refresh
+                               token.  None disables refreshing, so a new
+                               log-in happens once the token has expired.
         """
         super(WideskyHaystackSession, self).__init__(uri, api_dir, **kwargs)
         self._auth_dir = auth_dir
@@ -75,6 +89,9 @@ class WideskyHaystackSession(
         self._client_secret = client_secret
         self._auth_result = None
         self._impersonate = impersonate
+        self._refresh_margin = refresh_margin
+        self._refresh_lk = Lock()
+        self._refresh_timer = None
 
     @property
     def is_logged_in(self):
@@ -86,6 +103,17 @@ class WideskyHaystackSession(
         # Return true if our token expires in the future.
         return (self._auth_result.get("expires_in") or 0.0) > (1000.0 * time())
 
+    def logout(self):
+        """
+        Stop refreshing the access token and forget it.
+        """
+        self._close_his_buffers()
+        self._close_watch_managers()
+        self._discard_state()
+        self._cancel_refresh()
+        self._auth_result = None
+        self._client.headers = {}
+
     # Private methods/properties
 
     def _on_read(self, ids, filter_expr, limit, callback, **kwargs):
@@ -108,6 +136,7 @@ class WideskyHaystackSession(
 
         if (status_code == 401) and (self._auth_result is not None):
             self._log.warning("Authentication lost due to HTTP error 401.")
+            self._cancel_refresh()
             self._auth_result = None
             self._client.headers = {}
 
@@ -119,22 +148,123 @@ class WideskyHaystackSession(
         attribute on the base class.
         """
         try:
-            self._auth_result = operation.result
-            self._client.headers = {
-                "Authorization": (
-                    u"%s %s"
-                    % (
-                        _decode_str(self._auth_result["token_type"], "us-ascii"),
-                        _decode_str(self._auth_result["access_token"], "us-ascii"),
-                    )
-                ).encode("us-ascii")
-            }
-
-            if self._impersonate:
-                self._client.headers["X-IMPERSONATE"] = self._impersonate
+            self._set_auth_result(operation.result)
         except:
             self._auth_result = None
             self._client.headers = {}
             self._log.warning("Log-in fails", exc_info=1)
         finally:
             self._auth_op = None
+
+    def _export_state(self):
+        state = super(WideskyHaystackSession, self)._export_state()
+        state["auth_result"] = self._auth_result
+        state["expires"] = (self._auth_result.get("expires_in") or 0.0) / 1000.0
+        return state
+
+    def _import_state(self, state):
+        super(WideskyHaystackSession, self)._import_state(state)
+        if state is None:
+            self._cancel_refresh()
+            self._auth_result = None
+        else:
+            self._auth_result = state["auth_result"]
+            self._schedule_refresh()
+
+    def _set_auth_result(self, auth_result):
+        """
+        Store the token from a log-in or refresh reply, and schedule its
+        refresh.
+        """
+        headers = {
+            "Authorization": (
+                u"%s %s"
+                % (
+                    _decode_str(auth_result["token_type"], "us-ascii"),
+                    _decode_str(auth_result["access_token"], "us-ascii"),
+                )
+            ).encode("us-ascii")
+        }
+        if self._impersonate:
+            headers["X-IMPERSONATE"] = self._impersonate
+
+        self._auth_result = auth_result
+        self._client.headers = headers
+        self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        """
+        Arrange for the access token to be refreshed `refresh_margin` seconds
+        before it expires.  If the token lives for less than that, it is
+        refreshed half-way through its life instead.
+        """
+        self._cancel_refresh()
+        auth_result = self._auth_result
+        if (
+            (self._refresh_margin is None)
+            or (auth_result is None)
+            or (not auth_result.get("refresh_token"))
+        ):
+            return
+
+        remaining = (auth_result.get("expires_in") or 0.0) / 1000.0 - time()
+        if remaining <= 0:
+            return
+
+        delay = max(remaining - self._refresh_margin, remaining / 2.0)
+        self._log.debug("Refreshing access token in %.1f seconds", delay)
+        with self._refresh_lk:
+            self._refresh_timer = Timer(delay, self._refresh_token)
+            self._refresh_timer.daemon = True
+            self._refresh_timer.start()
+
+    def _cancel_refresh(self):
+        """
+        Cancel any pending refresh of the access token.
+        """
+        with self._refresh_lk:
+            timer = self._refresh_timer
+            self._refresh_timer = None
+        if timer is not None:
+            timer.cancel()
+
+    def _refresh_token(self):
+        """
+        Obtain a new access token.  The current token stays in use until the
+        new one arrives, so requests in progress are not held up.
+        """
+        with self._refresh_lk:
+            self._refresh_timer = None
+        auth_result = self._auth_result
+        if auth_result is None:
+            return
+
+        self._log.debug("Refreshing access token")
+        op = self._REFRESH_TOKEN_OPERATION(self, auth_result["refresh_token"])
+        op.done_sig.connect(self._on_refresh_token_done)
+        op.go()
+        return op
+
+    def _on_refresh_token_done(self, operation, **kwargs):
+        """
+        Process the result of a token refresh.  If it failed, the current
+        token is kept, and a new log-in happens once it expires.
+        """
+        try:
+            auth_result = dict(operation.result)
+        except:
+            self._log.warning("Access token refresh fails", exc_info=1)
+            return
+
+        if self._auth_result is None:
+            # Logged out or lost the token in the meantime.
+            return
+
+        # The server may not issue a new refresh token, keep the old one.
+        auth_result.setdefault("refresh_token", self._auth_result.get("refresh_token"))
+        try:
+            self._set_auth_result(auth_result)
+        except:
+            self._log.warning("Access token refresh fails", exc_info=1)
+            return
+        self._save_state()
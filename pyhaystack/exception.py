@@ -39,3 +39,11 @@ class AuthenticationProblem(Exception):
 
 class UnknownHistoryType(Exception):
     pass
+
+
+class HisWriteBufferFullError(Exception):
+    """
+    Exception thrown when a history write buffer cannot accept more samples.
+    """
+
+    pass
@@ -25,5 +25,16 @@ class AsynchronousException(object):
     def __init__(self):
         self._exc_info = exc_info()
 
+    def __deepcopy__(self, memo):
+        # Tracebacks cannot be copied, share the captured exception instead.
+        return self
+
+    @property
+    def exception(self):
+        """
+        Return the captured exception instance, without raising it.
+        """
+        return self._exc_info[1]
+
     def reraise(self):
         reraise(*self._exc_info)
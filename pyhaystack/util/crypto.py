@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Encryption of data kept at rest, such as saved session state and cached
+SCRAM keys.  Data is encrypted and authenticated with AES-GCM (which needs
+the `cryptography` package), using a key derived from a secret with PBKDF2.
+"""
+
+import os
+
+from six import text_type
+
+try:
+    # Python 3.4+
+    from hashlib import pbkdf2_hmac
+except ImportError:
+    # Python 3.3 and earlier, needs backports-hashlib.pbkdf2
+    # https://pypi.python.org/pypi/backports.pbkdf2/
+    from backports.pbkdf2 import pbkdf2_hmac
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    HAVE_CRYPTOGRAPHY = True
+except ImportError:  # pragma: no cover
+    # Not covered, since we'll always have 'cryptography' available during tests.
+    HAVE_CRYPTOGRAPHY = False
+
+# Format identifier, written at the start of each sealed blob.
+_MAGIC = b"PHS2"
+
+# Sizes (in bytes) of the fields of a sealed blob.
+_SALT_SIZE = 16
+_NONCE_SIZE = 12
+
+# Number of PBKDF2 rounds used to derive the key from the secret.
+_KDF_ITERATIONS = 100000
+
+
+def check_cryptography(purpose):
+    """
+    Raise NotImplementedError if `cryptography` is missing.
+
+    :param purpose: What it is needed for, for the error message.
+    """
+    if not HAVE_CRYPTOGRAPHY:
+        raise NotImplementedError(
+            "cryptography not available, it is needed to %s." % purpose
+        )
+
+
+def _derive_key(secret, salt):
+    """
+    Return the AES-256 key for a given secret and salt.
+    """
+    if isinstance(secret, text_type):
+        secret = secret.encode("utf-8")
+    return pbkdf2_hmac("sha256", secret, salt, _KDF_ITERATIONS, 32)
+
+
+def seal(secret, data):
+    """
+    Encrypt and authenticate `data` (bytes) with AES-GCM, using a key
+    derived from `secret`.
+    """
+    check_cryptography("encrypt data")
+    salt = os.urandom(_SALT_SIZE)
+    nonce = os.urandom(_NONCE_SIZE)
+    header = _MAGIC + salt + nonce
+    aead = AESGCM(_derive_key(secret, salt))
+    return header + aead.encrypt(nonce, data, header)
+
+
+def unseal(secret, blob):
+    """
+    Verify and decrypt data encrypted by `seal`.  Raises ValueError if the
+    data has been tampered with or the secret is wrong.
+    """
+    check_cryptography("decrypt data")
+    size = len(_MAGIC) + _SALT_SIZE + _NONCE_SIZE
+    if (len(blob) <= size) or (not blob.startswith(_MAGIC)):
+        raise ValueError("Not sealed data")
+
+    header = blob[:size]
+    salt = header[len(_MAGIC) : len(_MAGIC) + _SALT_SIZE]
+    nonce = header[len(_MAGIC) + _SALT_SIZE :]
+    aead = AESGCM(_derive_key(secret, salt))
+    try:
+        return aead.decrypt(nonce, blob[size:], header)
+    except InvalidTag:
+        raise ValueError("Sealed data fails authentication")
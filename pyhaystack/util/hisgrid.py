@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming ZINC encoder for history write grids.  hisWrite requests always
+have the same shape: ``ts,val`` for a single point, or ``ts,v0..vN`` for a
+multi-point write.  Rather than building an hszinc.Grid row by row and then
+dumping it, the grid text is written out directly in chunks of UTF-8 bytes.
+
+Typical usage::
+
+    body = dump_his_write(hszinc.Ref('my.point'), sorted(records.items()))
+"""
+
+import math
+
+import hszinc
+from hszinc.zoneinfo import timezone_name
+
+# Version of ZINC written, the same as hszinc.Grid uses by default.
+ZINC_VERSION = "2.0"
+
+# Number of rows encoded per chunk.
+CHUNK_ROWS = 1000
+
+# Haystack timezone names, keyed by (tzinfo, utcoffset).  Looking these up
+# is expensive for tzinfo objects that do not come from pytz.
+_TZ_NAMES = {}
+
+
+def dump_ts(ts):
+    """
+    Return the ZINC representation of a timezone-aware timestamp.
+    """
+    if ts.tzinfo is None:
+        raise ValueError("%r has no timezone" % ts)
+
+    key = (ts.tzinfo, ts.utcoffset())
+    try:
+        tz_name = _TZ_NAMES[key]
+    except KeyError:
+        tz_name = timezone_name(ts)
+        _TZ_NAMES[key] = tz_name
+    return "%s %s" % (ts.isoformat(), tz_name)
+
+
+def dump_val(val):
+    """
+    Return the ZINC representation of a value, with fast paths for the types
+    that are typical of history samples.
+    """
+    if val is None:
+        return "N"
+    if isinstance(val, bool):
+        return "T" if val else "F"
+    if isinstance(val, float):
+        if math.isnan(val):
+            return "NaN"
+        if math.isinf(val):
+            return "INF" if val > 0 else "-INF"
+        # Subclasses (e.g. numpy.float64) may not repr() as a plain number.
+        return repr(float(val))
+    return hszinc.dump_scalar(val)
+
+
+def iter_his_write(point, records, chunk_rows=CHUNK_ROWS):
+    """
+    Generate a single-point hisWrite grid as chunks of UTF-8 bytes.
+
+    :param point: Reference (hszinc.Ref) to the point being written.
+    :param records: Iterable of (timestamp, value) tuples, in time order.
+    :param chunk_rows: Number of rows per chunk.
+    """
+    yield (
+        'ver:"%s" id:%s\nts,val\n' % (ZINC_VERSION, hszinc.dump_scalar(point))
+    ).encode("utf-8")
+
+    rows = []
+    for ts, val in records:
+        rows.append("%s,%s\n" % (dump_ts(ts), dump_val(val)))
+        if len(rows) >= chunk_rows:
+            yield "".join(rows).encode("utf-8")
+            rows = []
+    if rows:
+        yield "".join(rows).encode("utf-8")
+
+
+def iter_multi_his_write(points, records, chunk_rows=CHUNK_ROWS):
+    """
+    Generate a multi-point hisWrite grid as chunks of UTF-8 bytes.  The value
+    for ``points[N]`` is written in column ``vN``.
+
+    :param points: List of references (hszinc.Ref) to the points.
+    :param records: Iterable of (timestamp, values) tuples, in time order,
+                    where values is a sequence aligned with `points`.  None
+                    is written where a point has no value.
+    :param chunk_rows: Number of rows per chunk.
+    """
+    columns = ["ts"] + [
+        "v%d id:%s" % (idx, hszinc.dump_scalar(point))
+        for (idx, point) in enumerate(points)
+    ]
+    yield ('ver:"%s"\n%s\n' % (ZINC_VERSION, ",".join(columns))).encode("utf-8")
+
+    rows = []
+    for ts, values in records:
+        rows.append("%s,%s\n" % (dump_ts(ts), ",".join(map(dump_val, values))))
+        if len(rows) >= chunk_rows:
+            yield "".join(rows).encode("utf-8")
+            rows = []
+    if rows:
+        yield "".join(rows).encode("utf-8")
+
+
+def dump_his_write(point, records):
+    """
+    Return a single-point hisWrite grid as a ZINC encoded body.
+    """
+    return b"".join(iter_his_write(point, records))
+
+
+def dump_multi_his_write(points, records):
+    """
+    Return a multi-point hisWrite grid as a ZINC encoded body.
+    """
+    return b"".join(iter_multi_his_write(points, records))
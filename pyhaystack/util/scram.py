@@ -14,6 +14,13 @@ except ImportError:
     # https://pypi.python.org/pypi/backports.pbkdf2/
     from backports.pbkdf2 import pbkdf2_hmac
 
+from collections import OrderedDict
+from threading import Lock
+
+from .crypto import check_cryptography, seal, unseal
+
+import hmac
+import json
 import re
 import os
 
@@ -32,20 +39,197 @@ def _hash_sha256(client_key, algorithm):
     return hashFunc.hexdigest()
 
 
-def salted_password(salt, iterations, algorithm_name, password):
-    dk = pbkdf2_hmac(
-        algorithm_name, password.encode(), urlsafe_b64decode(salt), int(iterations)
-    )
+class FileKeyStore(object):
+    """
+    Stores salted passwords in a file that only its owner may read, so that
+    other processes (or later runs) may skip deriving them again.  The
+    stored values are password-equivalent for SCRAM log-ins, and the
+    verifiers could be used to guess passwords, so the file is encrypted
+    with a key derived from `secret` (this needs the `cryptography`
+    package).  A file that fails to decrypt is treated as empty.
+    """
+
+    def __init__(self, path, secret):
+        check_cryptography("encrypt the key store")
+        if not secret:
+            raise ValueError("A secret is required to encrypt the key store")
+        self._path = os.path.expanduser(path)
+        self._secret = secret
+        self._lock = Lock()
+
+    def load(self):
+        """
+        Return the stored entries, as a dict.
+        """
+        with self._lock:
+            try:
+                with open(self._path, "rb") as f:
+                    blob = f.read()
+                return json.loads(unseal(self._secret, blob).decode("utf-8"))
+            except (IOError, OSError, ValueError):
+                return {}
+
+    def save(self, entries):
+        """
+        Replace the stored entries.
+        """
+        blob = seal(self._secret, json.dumps(entries).encode("utf-8"))
+        with self._lock:
+            directory = os.path.dirname(self._path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory, 0o700)
+            tmp_path = "%s.%d.tmp" % (self._path, os.getpid())
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            os.rename(tmp_path, self._path)
+
+
+class SaltedPasswordCache(object):
+    """
+    Cache of salted passwords (the result of PBKDF2), keyed by server, user
+    name, salt, iteration count and algorithm.  Deriving these is
+    deliberately slow, and the salt only changes when the password does, so
+    re-logins may reuse them.  The client and server keys are cheap to
+    compute from the salted password, so they are not cached.
+
+    Each entry also holds a verifier: an HMAC of the password under a
+    random per-entry salt.  An entry is only returned for the password it
+    was derived from, so a wrong or changed password is always derived (and
+    checked by the server) afresh.
+
+    Entries are held in memory, and optionally in a store such as
+    FileKeyStore::
+
+        scram.KEY_CACHE.store = scram.FileKeyStore(
+            "~/.pyhaystack/scram.keys", secret=os.environ["KEY"]
+        )
+    """
+
+    def __init__(self, store=None, max_entries=64):
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._store = None
+        self.store = store
+
+    @property
+    def store(self):
+        return self._store
+
+    @store.setter
+    def store(self, store):
+        with self._lock:
+            self._store = store
+            if store is not None:
+                for key, entry in store.load().items():
+                    if isinstance(entry, dict) and (
+                        set(entry.keys()) == set(["value", "salt", "verifier"])
+                    ):
+                        self._entries.setdefault(key, entry)
+
+    @staticmethod
+    def key(server, username, salt, iterations, algorithm_name):
+        if isinstance(salt, bytes):
+            salt = salt.decode("us-ascii")
+        return json.dumps(
+            [server, username, algorithm_name, salt, int(iterations)],
+            separators=(",", ":"),
+        )
+
+    @staticmethod
+    def _verifier(salt, password):
+        return hmac.new(unhexlify(salt), password.encode("utf-8"), sha256).hexdigest()
+
+    def get(self, key, password):
+        """
+        Return the salted password for a key, or None if it is not known or
+        was derived from a different password.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            verifier = self._verifier(entry["salt"], password)
+            if not hmac.compare_digest(verifier, entry["verifier"]):
+                return None
+            # Keep recently used entries.
+            self._entries.pop(key)
+            self._entries[key] = entry
+            return entry["value"].encode("us-ascii")
+
+    def put(self, key, value, password):
+        salt = b2a_hex(os.urandom(16)).decode("us-ascii")
+        entry = {
+            "value": value.decode("us-ascii"),
+            "salt": salt,
+            "verifier": self._verifier(salt, password),
+        }
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def discard(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._save()
+
+    def _save(self):
+        if self._store is not None:
+            self._store.save(dict(self._entries))
+
+
+# Process-wide salted password cache.
+KEY_CACHE = SaltedPasswordCache()
+
+
+def _salted_password(
+    raw_salt, salt, iterations, algorithm_name, password, username, server
+):
+    if (username is None) or (server is None):
+        # Without a user name and server, the cache cannot tell users apart.
+        key = None
+    else:
+        key = KEY_CACHE.key(server, username, salt, iterations, algorithm_name)
+        encrypt_password = KEY_CACHE.get(key, password)
+        if encrypt_password is not None:
+            return encrypt_password
+
+    dk = pbkdf2_hmac(algorithm_name, password.encode(), raw_salt, int(iterations))
     encrypt_password = hexlify(dk)
+    if key is not None:
+        KEY_CACHE.put(key, encrypt_password, password)
     return encrypt_password
 
 
-def salted_password_2(salt, iterations, algorithm_name, password):
-    dk = pbkdf2_hmac(
-        algorithm_name, password.encode(), unhexlify(salt), int(iterations)
+def salted_password(
+    salt, iterations, algorithm_name, password, username=None, server=None
+):
+    return _salted_password(
+        urlsafe_b64decode(salt),
+        salt,
+        iterations,
+        algorithm_name,
+        password,
+        username,
+        server,
+    )
+
+
+def salted_password_2(
+    salt, iterations, algorithm_name, password, username=None, server=None
+):
+    return _salted_password(
+        unhexlify(salt), salt, iterations, algorithm_name, password, username, server
     )
-    encrypt_password = hexlify(dk)
-    return encrypt_password
 
 
 def base64_no_padding(s):
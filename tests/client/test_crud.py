@@ -0,0 +1,288 @@
+#!python
+# -*- coding: utf-8 -*-
+"""
+Bulk CRUD tests.  These test creating, updating and deleting many entities
+at once.
+"""
+
+# Assume unicode literals as per Python 3
+from __future__ import unicode_literals
+
+import threading
+import time
+
+import pytest
+
+from .test_his import (
+    server_session,
+    respond_empty,
+    respond_grid,
+    BASE_URI,
+    SyncDummyServer,
+)
+from .test_point import read_grid
+from .test_pool import make_server
+
+import hszinc
+
+
+def get_entities(server, session, count):
+    """
+    Retrieve some entities for the tests to work on.
+    """
+    ids = ["my.entity.%d" % n for n in range(count)]
+    op = session.get_entity(ids, single=False)
+    rq = server.next_request()
+    respond_grid(
+        rq,
+        [
+            {"id": hszinc.Ref(entity_id), "dis": "Entity %s" % entity_id[-1]}
+            for entity_id in ids
+        ],
+    )
+    entities = op.result
+    return [entities[entity_id] for entity_id in ids]
+
+
+def respond_rows(rq):
+    """
+    Answer a CRUD request by echoing back the rows posted.
+    """
+    rows = []
+    for row in read_grid(rq):
+        rows.append(
+            dict(
+                (tag, value)
+                for (tag, value) in row.items()
+                if (value is not None) and (value is not hszinc.REMOVE)
+            )
+        )
+    respond_grid(rq, rows)
+
+
+@pytest.mark.usefixtures("server_session")
+class TestCommitAll(object):
+    def test_batched(self, server_session):
+        server, session = server_session
+        entities = get_entities(server, session, 5)
+        for entity in entities:
+            entity.tags["newTag"] = hszinc.MARKER
+        del entities[1].tags["dis"]
+        # Not dirty, so not sent
+        entities.append(get_entities(server, session, 6)[5])
+
+        op = session.commit_all(entities, batch_size=2)
+        assert server.requests() == 3
+        sent = []
+        for rq in list(server.next_requests()):
+            assert rq.uri == BASE_URI + "api/updateRec"
+            grid = read_grid(rq)
+            assert len(grid) <= 2
+            sent.extend(row["id"].name for row in grid)
+            respond_rows(rq)
+
+        assert sent == ["my.entity.%d" % n for n in range(5)]
+        updated = op.result
+        assert sorted(updated.keys()) == sent
+        for entity in entities:
+            assert not entity.tags.is_dirty
+        assert entities[0].tags["newTag"] is hszinc.MARKER
+        assert "dis" not in entities[1].tags
+
+    def test_failed_batch(self, server_session):
+        server, session = server_session
+        entities = get_entities(server, session, 3)
+        for entity in entities:
+            entity.tags["newTag"] = hszinc.MARKER
+
+        op = session.commit_all(entities, batch_size=2)
+        rqs = list(server.next_requests())
+        respond_rows(rqs[0])
+        rqs[1].throw(IOError, "Server went away")
+        while server.requests():
+            server.next_request().throw(IOError, "Server went away")
+
+        with pytest.raises(IOError):
+            op.result
+        # The failed entity may be committed again.
+        assert not entities[0].tags.is_dirty
+        assert entities[2].tags.is_dirty
+
+    def test_change_in_flight(self, server_session):
+        server, session = server_session
+        entities = get_entities(server, session, 2)
+        entities[0].tags["newTag"] = 1.0
+        entities[1].tags["newTag"] = 1.0
+
+        op = session.commit_all(entities)
+        # Changed again before the commit finishes
+        entities[0].tags["newTag"] = 2.0
+        respond_rows(server.next_request())
+        op.result
+
+        # The newer change is still pending
+        assert entities[0].tags.is_dirty
+        assert entities[0].tags["newTag"] == 2.0
+        assert not entities[1].tags.is_dirty
+
+    def test_unit_of_work(self, server_session):
+        server, session = server_session
+        entities = get_entities(server, session, 2)
+
+        def _serve():
+            while not server.requests():
+                time.sleep(0.01)
+            respond_rows(server.next_request())
+
+        server_thread = threading.Thread(target=_serve)
+        server_thread.start()
+        with session.unit_of_work() as work:
+            entities[0].tags["newTag"] = hszinc.MARKER
+            entities[1].tags["other"] = 1.0
+            work.add(entities[0])
+            # Nothing is sent until the block exits.
+            assert server.requests() == 0
+        server_thread.join()
+
+        assert list(work.operation.result.keys()) == ["my.entity.0"]
+        assert not entities[0].tags.is_dirty
+        assert entities[1].tags.is_dirty
+
+    def test_unit_of_work_abandoned(self, server_session):
+        server, session = server_session
+        entities = get_entities(server, session, 1)
+        with pytest.raises(ValueError):
+            with session.unit_of_work() as work:
+                entities[0].tags["newTag"] = hszinc.MARKER
+                raise ValueError("Changed my mind")
+
+        assert server.requests() == 0
+        assert work.operation is None
+        assert entities[0].tags.is_dirty
+
+
+@pytest.mark.usefixtures("server_session")
+class TestBulkCreateEntity(object):
+    def test_grouped_chunks(self, server_session):
+        server, session = server_session
+        entities = [
+            {"id": "site.point%d" % n, "dis": "Point %d" % n, "point": hszinc.MARKER}
+            for n in range(5)
+        ] + [{"id": "site.equip", "dis": "Equipment", "equip": hszinc.MARKER}]
+        op = session.bulk_create_entity(entities, chunk_size=2, max_concurrency=2)
+
+        created = []
+        while server.requests():
+            # Never more than two chunks in flight
+            assert server.requests() <= 2
+            rq = server.next_request()
+            assert rq.uri == BASE_URI + "api/createRec"
+            grid = read_grid(rq)
+            assert len(grid) <= 2
+            for row in grid:
+                # No padding: every row carries every column
+                assert all(row.get(col) is not None for col in grid.column)
+                created.append(row["id"].name)
+            respond_rows(rq)
+
+        assert sorted(created) == ["equip"] + ["point%d" % n for n in range(5)]
+        result = op.result
+        assert sorted(result.keys()) == sorted(created)
+        assert result["equip"].tags["dis"] == "Equipment"
+        assert session._entities["point3"] is result["point3"]
+
+    def test_synchronous(self):
+        # Chunks that finish before create returns do not recurse.
+        server, session = make_server(SyncDummyServer(respond_rows))
+        entities = [{"id": "point%d" % n, "point": hszinc.MARKER} for n in range(200)]
+        op = session.bulk_create_entity(entities, chunk_size=1, max_concurrency=4)
+        assert server.count == 200
+        assert len(op.result) == 200
+
+    def test_failed_chunk(self, server_session):
+        server, session = server_session
+        entities = [{"id": "point%d" % n, "point": hszinc.MARKER} for n in range(3)]
+        op = session.bulk_create_entity(entities, chunk_size=2)
+        rqs = list(server.next_requests())
+        assert len(rqs) == 2
+        rqs[0].throw(IOError, "Server went away")
+        respond_rows(rqs[1])
+        while server.requests():
+            server.next_request().throw(IOError, "Server went away")
+
+        with pytest.raises(IOError):
+            op.result
+        assert "point2" in session._entities
+
+
+@pytest.mark.usefixtures("server_session")
+class TestBulkDelete(object):
+    def test_preview(self, server_session):
+        server, session = server_session
+        op = session.bulk_delete(filter_expr="point and old", preview=True)
+        rq = server.next_request()
+        assert rq.uri == BASE_URI + "api/read?filter=point+and+old"
+        respond_grid(rq, [{"id": hszinc.Ref("a")}, {"id": hszinc.Ref("b")}])
+        assert op.result == ["a", "b"]
+        assert server.requests() == 0
+
+    def test_synchronous(self):
+        # Batches that finish before delete returns do not recurse.
+        server, session = make_server(SyncDummyServer(respond_empty))
+        ids = ["my.entity.%d" % n for n in range(200)]
+        op = session.bulk_delete(ids=ids, batch_size=1)
+        assert server.count == 200
+        assert op.result == ids
+
+    def test_batched(self, server_session):
+        server, session = server_session
+        entities = get_entities(server, session, 5)
+        progress = []
+        op = session.bulk_delete(
+            ids=entities,
+            batch_size=2,
+            progress=lambda deleted, total: progress.append((deleted, total)),
+        )
+
+        deleted = []
+        while server.requests():
+            # One batch at a time
+            assert server.requests() == 1
+            rq = server.next_request()
+            if rq.method == "POST":
+                assert rq.uri == BASE_URI + "api/deleteRec"
+                deleted.extend(row["id"].name for row in read_grid(rq))
+            else:
+                assert rq.uri == BASE_URI + "api/deleteRec?id=%40my.entity.4"
+                deleted.append("my.entity.4")
+            respond_grid(rq, [{"empty": None}])
+
+        assert deleted == ["my.entity.%d" % n for n in range(5)]
+        assert op.result == deleted
+        assert progress == [(2, 5), (4, 5), (5, 5)]
+        assert not any(entity_id in session._entities for entity_id in deleted)
+
+    def test_rate_limited(self, server_session):
+        server, session = server_session
+        op = session.bulk_delete(ids=["a", "b"], batch_size=1, rate=20.0)
+        start = time.time()
+        respond_grid(server.next_request(), [{"empty": None}])
+        while not server.requests():
+            time.sleep(0.005)
+        assert (time.time() - start) >= 0.04
+        respond_grid(server.next_request(), [{"empty": None}])
+        assert op.result == ["a", "b"]
+
+    def test_failed_batch(self, server_session):
+        server, session = server_session
+        entities = get_entities(server, session, 3)
+        op = session.bulk_delete(ids=entities, batch_size=2)
+        respond_grid(server.next_request(), [{"empty": None}])
+        server.next_request().throw(IOError, "Server went away")
+        while server.requests():
+            server.next_request().throw(IOError, "Server went away")
+
+        with pytest.raises(IOError):
+            op.result
+        assert "my.entity.0" not in session._entities
+        assert "my.entity.2" in session._entities
@@ -0,0 +1,456 @@
+#!python
+# -*- coding: utf-8 -*-
+"""
+Haystack history operation tests.  These test the high-level history read
+and write interfaces of the session.
+"""
+
+# Assume unicode literals as per Python 3
+from __future__ import unicode_literals
+
+import pytest
+
+from pyhaystack.client.http import dummy as dummy_http
+from pyhaystack.exception import HisWriteBufferFullError
+
+# For simplicity's sake, we'll just use the WideSky client.
+from pyhaystack.client import widesky
+from pyhaystack.client.retry import RetryPolicy
+
+# hszinc has its own tests, we'll assume they work
+import hszinc
+
+# For date/time generation
+import datetime
+import gc
+import pytz
+import time
+import weakref
+
+# Logging setup so we can see what's going on
+import logging
+
+logging.basicConfig(level=logging.DEBUG)
+
+BASE_URI = "https://myserver/api/"
+
+
+@pytest.fixture
+def server_session():
+    """
+    Initialise a HaystackSession and dummy HTTP server instance.
+    """
+    server = dummy_http.DummyHttpServer()
+    session = widesky.WideskyHaystackSession(
+        uri=BASE_URI,
+        username="testuser",
+        password="testpassword",
+        client_id="testclient",
+        client_secret="testclientsecret",
+        http_client=dummy_http.DummyHttpClient,
+        http_args={"server": server, "debug": True},
+        grid_format=hszinc.MODE_ZINC,
+        retry_policy=RetryPolicy(base_delay=0),
+    )
+    # Force an authentication.
+    op = session.authenticate()
+    # Pop the request off the stack.  We'll assume it's fine for now.
+    rq = server.next_request()
+    assert server.requests() == 0, "More requests waiting"
+    rq.respond(
+        status=200,
+        headers={b"Content-Type": "application/json"},
+        content="""{
+                "token_type": "Bearer",
+                "access_token": "DummyAccessToken",
+                "refresh_token": "DummyRefreshToken",
+                "expires_in": %f
+            }""" % ((time.time() + 86400) * 1000.0),
+    )
+    assert op.state == "done"
+    assert server.requests() == 0
+    assert session.is_logged_in
+    return (server, session)
+
+
+def respond_about(server, version="0.5.0"):
+    """
+    Answer an 'about' request, claiming to be a given WideSky version.
+    """
+    rq = server.next_request()
+    assert rq.method == "GET", "Expecting GET, got %s" % rq
+    assert rq.uri == BASE_URI + "api/about"
+
+    about = hszinc.Grid()
+    about.column["productName"] = {}
+    about.column["productVersion"] = {}
+    about.append({"productName": "WideSky", "productVersion": version})
+    rq.respond(
+        status=200,
+        headers={b"Content-Type": "text/zinc"},
+        content=hszinc.dump(about, mode=hszinc.MODE_ZINC),
+    )
+
+
+class SyncDummyServer(dummy_http.DummyHttpServer):
+    """
+    A dummy server that answers each request as soon as it is made, as
+    happens with the synchronous HTTP client.  `responder` is called with
+    each request to answer it.
+    """
+
+    def __init__(self, responder):
+        super(SyncDummyServer, self).__init__()
+        self.responder = responder
+        self.count = 0
+
+    def submit_request(self, *args, **kwargs):
+        super(SyncDummyServer, self).submit_request(*args, **kwargs)
+        self.count += 1
+        self.responder(self.next_request())
+
+
+def respond_empty(rq):
+    """
+    Answer a request with an empty grid.
+    """
+    empty = hszinc.Grid()
+    empty.column["empty"] = {}
+    rq.respond(
+        status=200,
+        headers={b"Content-Type": "text/zinc"},
+        content=hszinc.dump(empty, mode=hszinc.MODE_ZINC),
+    )
+
+
+@pytest.mark.usefixtures("server_session")
+class TestHisWriteBuffer(object):
+    def test_flush_on_size(self, server_session):
+        server, session = server_session
+        flushed = []
+        buf = session.his_write_buffer(
+            max_samples=3, flush_interval=None, on_flushed=flushed.append
+        )
+        ts = pytz.utc.localize(datetime.datetime(2020, 1, 1, 0, 0))
+
+        buf.add("my.point.a", ts, 1.0)
+        buf.add("my.point.b", ts, 2.0)
+
+        # Nothing shall be sent yet
+        assert server.requests() == 0
+        assert buf.pending == 2
+
+        buf.add("my.point.a", ts + datetime.timedelta(minutes=5), 3.0)
+        assert buf.pending == 0
+        assert buf.inflight == 3
+
+        # We shall probe for multi-hisWrite, then get a single POST
+        respond_about(server)
+        assert server.requests() == 1
+        rq = server.next_request()
+        assert rq.method == "POST", "Expecting POST, got %s" % rq
+        assert rq.uri == BASE_URI + "api/hisWrite"
+
+        grid = hszinc.parse(rq.body.decode("utf-8"), mode=hszinc.MODE_ZINC, single=True)
+        assert len(grid) == 2
+        assert set(grid.column.keys()) == set(["ts", "v0", "v1"])
+        respond_empty(rq)
+
+        assert buf.inflight == 0
+        assert flushed == [
+            {
+                "my.point.a": {ts: 1.0, ts + datetime.timedelta(minutes=5): 3.0},
+                "my.point.b": {ts: 2.0},
+            }
+        ]
+
+    def test_requeue_on_failure(self, server_session):
+        server, session = server_session
+        errors = []
+        buf = session.his_write_buffer(
+            max_samples=None,
+            flush_interval=None,
+            on_error=lambda batch, op: errors.append(batch),
+        )
+        ts = pytz.utc.localize(datetime.datetime(2020, 1, 1, 0, 0))
+        buf.add("my.point.a", ts, 1.0)
+        buf.flush()
+
+        respond_about(server)
+        # Fail the POST and its retries.
+        while server.requests():
+            rq = server.next_request()
+            assert rq.uri == BASE_URI + "api/hisWrite"
+            rq.throw(IOError, "Server went away")
+
+        assert len(errors) == 1
+        assert buf.pending == 1
+        assert buf.inflight == 0
+
+    def test_backpressure(self, server_session):
+        server, session = server_session
+        buf = session.his_write_buffer(
+            max_samples=None, flush_interval=None, max_pending=2
+        )
+        ts = pytz.utc.localize(datetime.datetime(2020, 1, 1, 0, 0))
+        buf.add("my.point.a", ts, 1.0)
+        buf.add("my.point.b", ts, 2.0)
+
+        # Non-blocking add must refuse straight away.
+        with pytest.raises(HisWriteBufferFullError):
+            buf.add("my.point.c", ts, 3.0, block=False)
+        assert server.requests() == 0
+
+    def test_held_until_closed(self, server_session):
+        server, session = server_session
+        buf = session.his_write_buffer(max_samples=None, flush_interval=None)
+        ts = pytz.utc.localize(datetime.datetime(2020, 1, 1, 0, 0))
+        buf.add("my.point.a", ts, 1.0)
+
+        # The session keeps the buffer (and its samples) for logout.
+        ref = weakref.ref(buf)
+        del buf
+        gc.collect()
+        assert ref() is not None
+        assert list(session._his_buffers) == [ref()]
+        assert ref().pending == 1
+
+        # Closing releases it.
+        empty = session.his_write_buffer(max_samples=None, flush_interval=None)
+        empty.close()
+        assert empty not in session._his_buffers
+
+
+def respond_grid(rq, rows):
+    """
+    Answer a request with a grid made from the given rows.
+    """
+    grid = hszinc.Grid()
+    columns = set()
+    for row in rows:
+        columns.update(row.keys())
+    for column in sorted(columns):
+        grid.column[column] = {}
+    grid.extend(rows)
+    rq.respond(
+        status=200,
+        headers={b"Content-Type": "text/zinc"},
+        content=hszinc.dump(grid, mode=hszinc.MODE_ZINC),
+    )
+
+
+@pytest.mark.usefixtures("server_session")
+class TestPointTzResolve(object):
+    def test_bulk_resolve(self, server_session):
+        server, session = server_session
+        op = session.resolve_point_tz(["my.point.a", "my.point.b", "my.point.c"])
+
+        # All points are read in one request
+        assert server.requests() == 1
+        rq = server.next_request()
+        assert rq.method == "POST", "Expecting POST, got %s" % rq
+        assert rq.uri == BASE_URI + "api/read"
+        respond_grid(
+            rq,
+            [
+                {
+                    "id": hszinc.Ref("my.point.a"),
+                    "point": hszinc.MARKER,
+                    "tz": "Brisbane",
+                },
+                {
+                    "id": hszinc.Ref("my.point.b"),
+                    "point": hszinc.MARKER,
+                    "equipRef": hszinc.Ref("my.equip"),
+                },
+                {
+                    "id": hszinc.Ref("my.point.c"),
+                    "point": hszinc.MARKER,
+                    "siteRef": hszinc.Ref("my.site"),
+                },
+            ],
+        )
+
+        # Then the equip
+        rq = server.next_request()
+        assert rq.uri == BASE_URI + "api/read?id=%40my.equip"
+        respond_grid(
+            rq,
+            [
+                {
+                    "id": hszinc.Ref("my.equip"),
+                    "equip": hszinc.MARKER,
+                    "tz": "Montreal",
+                }
+            ],
+        )
+
+        # Then the site
+        rq = server.next_request()
+        assert rq.uri == BASE_URI + "api/read?id=%40my.site"
+        respond_grid(
+            rq,
+            [{"id": hszinc.Ref("my.site"), "site": hszinc.MARKER, "tz": "Paris"}],
+        )
+
+        assert op.is_done
+        assert op.result == {
+            "my.point.a": pytz.timezone("Australia/Brisbane"),
+            "my.point.b": pytz.timezone("America/Montreal"),
+            "my.point.c": pytz.timezone("Europe/Paris"),
+        }
+
+        point_b = session._entities["my.point.b"]
+
+        # A second resolve is answered from cache
+        op = session.resolve_point_tz(["my.point.b"])
+        assert server.requests() == 0
+        assert op.result == {"my.point.b": pytz.timezone("America/Montreal")}
+
+        # Moving the point to another equip invalidates its timezone
+        point_b._update_tags(
+            {"point": hszinc.MARKER, "equipRef": hszinc.Ref("other.equip")}
+        )
+        assert session._get_cached_point_tz("my.point.b") is None
+        assert session._get_cached_point_tz("my.point.a") is not None
+
+        # Changing the site's timezone invalidates points derived from it
+        session._invalidate_point_tz("my.site")
+        assert session._get_cached_point_tz("my.point.c") is None
+
+
+@pytest.mark.usefixtures("server_session")
+class TestHisTzConversion(object):
+    def test_read_series_tz(self, server_session):
+        server, session = server_session
+        op = session.his_read_series(
+            "my.point", rng="today", tz="Brisbane", series_format="series"
+        )
+
+        rq = server.next_request()
+        assert rq.method == "GET", "Expecting GET, got %s" % rq
+        ts = pytz.utc.localize(datetime.datetime(2020, 1, 1, 0, 0))
+        respond_grid(
+            rq,
+            [
+                {"ts": ts, "val": 1.0},
+                {"ts": ts + datetime.timedelta(minutes=5), "val": 2.0},
+            ],
+        )
+
+        series = op.result
+        assert str(series.index.tz) == "Australia/Brisbane"
+        assert series.index[0].hour == 10
+        assert list(series) == [1.0, 2.0]
+
+    def test_write_frame_localise(self, server_session):
+        server, session = server_session
+        pd = pytest.importorskip("pandas")
+        frame = pd.DataFrame(
+            {"my.point.a": [1.0, 2.0]},
+            index=pd.DatetimeIndex(
+                [
+                    datetime.datetime(2020, 1, 1, 0, 0),
+                    datetime.datetime(2020, 1, 1, 0, 5),
+                ]
+            ),
+        )
+        op = session.his_write_frame(frame, tz="Brisbane")
+
+        respond_about(server)
+        rq = server.next_request()
+        assert rq.uri == BASE_URI + "api/hisWrite"
+        grid = hszinc.parse(rq.body.decode("utf-8"), mode=hszinc.MODE_ZINC, single=True)
+        timestamps = sorted(row["ts"] for row in grid)
+        assert timestamps[0] == pytz.timezone("Australia/Brisbane").localize(
+            datetime.datetime(2020, 1, 1, 0, 0)
+        )
+        respond_empty(rq)
+        assert op.is_done
+
+    def test_write_frame_point_tz(self, server_session):
+        server, session = server_session
+        pd = pytest.importorskip("pandas")
+        ts = pytz.utc.localize(datetime.datetime(2020, 1, 1, 0, 0))
+        frame = pd.DataFrame(
+            {"my.point.a": [1.0, 2.0], "my.point.b": [3.0, 4.0]},
+            index=pd.DatetimeIndex([ts, ts + datetime.timedelta(minutes=5)]),
+        )
+        op = session.his_write_frame(frame)
+
+        # No multi-point hisWrite, so the points' timezones are resolved in
+        # one read, and each point is written in its own timezone.
+        respond_about(server, version="0.4.0")
+        rq = server.next_request()
+        assert rq.uri == BASE_URI + "api/read"
+        respond_grid(
+            rq,
+            [
+                {
+                    "id": hszinc.Ref("my.point.a"),
+                    "point": hszinc.MARKER,
+                    "tz": "Brisbane",
+                },
+                {"id": hszinc.Ref("my.point.b"), "point": hszinc.MARKER, "tz": "Paris"},
+            ],
+        )
+
+        zones = {}
+        for rq in list(server.next_requests()):
+            assert rq.uri == BASE_URI + "api/hisWrite"
+            grid = hszinc.parse(
+                rq.body.decode("utf-8"), mode=hszinc.MODE_ZINC, single=True
+            )
+            assert grid[0]["ts"] == ts
+            zones[grid.metadata["id"].name] = grid[0]["ts"].tzinfo.zone
+            respond_empty(rq)
+        assert zones == {
+            "my.point.a": "Australia/Brisbane",
+            "my.point.b": "Europe/Paris",
+        }
+        assert op.is_done
+        op.result
+
+    def test_write_frame_columns(self, server_session):
+        server, session = server_session
+        pd = pytest.importorskip("pandas")
+        ts = pytz.utc.localize(datetime.datetime(2020, 1, 1, 0, 0))
+        frame = pd.DataFrame(
+            {
+                "a": [1.0, float("nan"), 3.0],
+                "b": [float("nan"), 2.0, float("nan")],
+                "c": [float("nan")] * 3,
+            },
+            index=pd.DatetimeIndex(
+                [
+                    ts,
+                    ts + datetime.timedelta(minutes=5),
+                    ts + datetime.timedelta(minutes=10),
+                ]
+            ),
+        )
+        op = session.his_write_frame(
+            frame, columns={"a": "my.point.a", "b": "my.point.b", "c": "my.point.c"}
+        )
+
+        respond_about(server)
+        rq = server.next_request()
+        assert rq.uri == BASE_URI + "api/hisWrite"
+        grid = hszinc.parse(rq.body.decode("utf-8"), mode=hszinc.MODE_ZINC, single=True)
+
+        # The empty column is not sent, NaN cells are left out.
+        ids = dict(
+            (col, meta["id"].name) for col, meta in grid.column.items() if col != "ts"
+        )
+        assert sorted(ids.values()) == ["my.point.a", "my.point.b"]
+        data = {}
+        for row in grid:
+            for col, point in ids.items():
+                if row.get(col) is not None:
+                    data.setdefault(point, {})[row["ts"]] = row[col]
+        assert data == {
+            "my.point.a": {ts: 1.0, ts + datetime.timedelta(minutes=10): 3.0},
+            "my.point.b": {ts + datetime.timedelta(minutes=5): 2.0},
+        }
+        respond_empty(rq)
+        assert op.is_done
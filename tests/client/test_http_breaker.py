@@ -0,0 +1,83 @@
+#!python
+# -*- coding: utf-8 -*-
+"""
+HTTP client circuit breaker tests.
+"""
+
+# Assume unicode literals as per Python 3
+from __future__ import unicode_literals
+
+import time
+
+import pytest
+
+from pyhaystack.client.http.breaker import CLOSED, HALF_OPEN, OPEN
+from pyhaystack.client.http.exceptions import (
+    HTTPCircuitOpenError,
+    HTTPStatusError,
+    HTTPTimeoutError,
+)
+from pyhaystack.client.retry import RetryPolicy
+
+from .test_http_limit import get_client, respond_ok, BASE_URI
+
+
+def test_unbroken():
+    server, client = get_client()
+    assert client.get_breaker(BASE_URI) is None
+    assert client.circuit_status == {}
+
+
+class TestCircuitBreaker(object):
+    def get_client(self):
+        server, client = get_client(circuit_threshold=2, circuit_reset_timeout=0.1)
+        responses = []
+        return (server, client, client.get_breaker(BASE_URI), responses)
+
+    def test_trip_and_reset(self):
+        server, client, breaker, responses = self.get_client()
+
+        # A server error means the host is up.
+        client.get("about", responses.append)
+        server.next_request().throw(HTTPStatusError, "Internal Server Error", 500)
+        for _ in range(2):
+            client.get("about", responses.append)
+            server.next_request().throw(HTTPTimeoutError, "Timed out")
+        assert breaker.state == OPEN
+
+        # Requests now fail without being sent.
+        client.get("about", responses.append)
+        assert server.requests() == 0
+        with pytest.raises(HTTPCircuitOpenError):
+            responses[-1].reraise()
+        assert client.circuit_status["myserver"]["state"] == OPEN
+
+        # Later, one probe is let through.
+        time.sleep(0.15)
+        assert breaker.state == HALF_OPEN
+        client.get("about", responses.append)
+        client.get("about", responses.append)
+        assert server.requests() == 1
+        assert isinstance(responses[-1].exception, HTTPCircuitOpenError)
+
+        # It fails, so the breaker opens again.
+        server.next_request().throw(HTTPTimeoutError, "Timed out")
+        assert breaker.state == OPEN
+
+        # The next probe succeeds and the breaker closes.
+        time.sleep(0.15)
+        client.get("about", responses.append)
+        respond_ok(server.next_request())
+        assert breaker.state == CLOSED
+        assert breaker.failures == 0
+        client.get("about", responses.append)
+        assert server.requests() == 1
+
+    def test_not_retried(self):
+        policy = RetryPolicy(base_delay=0)
+        server, client, breaker, responses = self.get_client()
+        for _ in range(2):
+            client.get("about", responses.append)
+            server.next_request().throw(HTTPTimeoutError, "Timed out")
+        client.get("about", responses.append)
+        assert not policy.is_retryable(responses[-1].exception, True)
@@ -0,0 +1,98 @@
+#!python
+# -*- coding: utf-8 -*-
+"""
+HTTP client throttling tests.
+"""
+
+# Assume unicode literals as per Python 3
+from __future__ import unicode_literals
+
+import time
+
+from pyhaystack.client.http import dummy as dummy_http
+from pyhaystack.client.http.exceptions import HTTPStatusError
+from pyhaystack.client.http.limit import AIMDLimit, TokenBucket
+
+BASE_URI = "https://myserver/api/"
+
+
+def get_client(**kwargs):
+    server = dummy_http.DummyHttpServer()
+    client = dummy_http.DummyHttpClient(server, uri=BASE_URI, **kwargs)
+    return (server, client)
+
+
+def respond_ok(rq):
+    rq.respond(status=200, headers={b"Content-Type": "text/plain"}, content="ok")
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=2.0, burst=2)
+    now = time.time()
+    assert bucket.take(now) == 0.0
+    assert bucket.take(now) == 0.0
+    assert bucket.take(now) == 0.5
+    assert bucket.take(now + 0.5) == 0.0
+
+
+def test_aimd_limit():
+    limit = AIMDLimit(initial=4, minimum=1, maximum=5, latency_target=1.0)
+    started = time.time()
+    for _ in range(4):
+        limit.update(started, 0.1, False)
+    assert limit.limit == 4
+    limit.update(started, 0.1, False)
+    assert limit.limit == 5
+
+    # Overload halves the limit, once per round of requests.
+    limit.update(started, 0.1, True)
+    assert limit.limit == 2
+    limit.update(started, 0.1, True)
+    assert limit.limit == 2
+
+    # So do slow responses.
+    limit.update(time.time(), 2.0, False)
+    assert limit.limit == 1
+
+
+class TestHostLimiter(object):
+    def test_unlimited(self):
+        server, client = get_client()
+        for _ in range(3):
+            client.get("about", lambda response: None)
+        assert server.requests() == 3
+        assert client.get_limiter(BASE_URI) is None
+
+    def test_concurrency_limit(self):
+        server, client = get_client(max_concurrency=8, initial_concurrency=2)
+        responses = []
+        for _ in range(3):
+            client.get("about", responses.append)
+
+        # Only two are sent, the third waits.
+        assert server.requests() == 2
+        limiter = client.get_limiter(BASE_URI)
+        assert limiter.queued == 1
+
+        respond_ok(server.next_request())
+        assert server.requests() == 2
+        assert limiter.queued == 0
+
+        # The server is overloaded, back off.
+        server.next_request().throw(HTTPStatusError, "Service Unavailable", 503)
+        assert limiter.limit == 1
+        respond_ok(server.next_request())
+        assert len(responses) == 3
+        assert limiter.in_flight == 0
+
+    def test_rate_limit(self):
+        server, client = get_client(rate_limit=50.0, rate_burst=1)
+        for _ in range(2):
+            client.get("about", lambda response: None)
+        assert server.requests() == 1
+
+        # The second is sent once a token is available.
+        deadline = time.time() + 2.0
+        while (server.requests() < 2) and (time.time() < deadline):
+            time.sleep(0.01)
+        assert server.requests() == 2
@@ -0,0 +1,151 @@
+#!python
+# -*- coding: utf-8 -*-
+"""
+Point operation tests.  These test reading and writing the present values
+of many points at once.
+"""
+
+# Assume unicode literals as per Python 3
+from __future__ import unicode_literals
+
+import pytest
+
+from .test_his import (
+    server_session,
+    respond_empty,
+    respond_grid,
+    BASE_URI,
+    SyncDummyServer,
+)
+from .test_pool import make_server
+
+import hszinc
+
+
+def read_grid(rq):
+    """
+    Parse the grid posted by a request.
+    """
+    return hszinc.parse(rq.body.decode("utf-8"), mode=hszinc.MODE_ZINC, single=True)
+
+
+@pytest.mark.usefixtures("server_session")
+class TestReadCurVals(object):
+    def test_batched(self, server_session):
+        server, session = server_session
+        points = ["my.point.%d" % n for n in range(5)]
+        op = session.read_cur_vals(points + ["my.point.0"], batch_size=2)
+
+        # Three batches, duplicates removed
+        assert server.requests() == 3
+        requested = []
+        for rq in list(server.next_requests()):
+            if rq.method == "POST":
+                assert rq.uri == BASE_URI + "api/read"
+                ids = [row["id"].name for row in read_grid(rq)]
+            else:
+                # A single ID is read with a GET
+                assert rq.uri == BASE_URI + "api/read?id=%40my.point.4"
+                ids = ["my.point.4"]
+            requested.extend(ids)
+            respond_grid(
+                rq,
+                [
+                    {
+                        "id": hszinc.Ref(point_id),
+                        "curVal": hszinc.Quantity(float(point_id[-1]), "kW"),
+                    }
+                    for point_id in ids
+                    if point_id != "my.point.3"
+                ],
+            )
+        assert requested == points
+
+        series = op.result
+        assert list(series.index) == points
+        assert list(series[["my.point.0", "my.point.4"]]) == [0.0, 4.0]
+        assert series.isna()["my.point.3"]
+        assert series.meta["units"]["my.point.1"] == "kW"
+
+    def test_dict(self, server_session):
+        server, session = server_session
+        op = session.read_cur_vals(["my.point.a", "my.point.b"], result_format="dict")
+        respond_grid(
+            server.next_request(),
+            [
+                {"id": hszinc.Ref("my.point.a"), "curVal": True},
+                {"id": hszinc.Ref("my.point.b"), "curVal": "text"},
+            ],
+        )
+        assert op.result == {"my.point.a": True, "my.point.b": "text"}
+
+
+@pytest.mark.usefixtures("server_session")
+class TestPointWriteMany(object):
+    def test_bounded_concurrency(self, server_session):
+        server, session = server_session
+        writes = [("my.point.%d" % n, 16, float(n)) for n in range(5)]
+        op = session.point_write_many(writes, max_concurrency=2)
+
+        written = []
+        while server.requests():
+            # Never more than two writes in flight
+            assert server.requests() <= 2
+            rq = server.next_request()
+            assert rq.method == "GET"
+            assert rq.uri.startswith(BASE_URI + "api/pointWrite?")
+            written.append(rq.uri)
+            if "my.point.3" in rq.uri:
+                rq.throw(IOError, "Server went away")
+            else:
+                respond_empty(rq)
+
+        # Failed writes are retried
+        assert len(set(written)) == 5
+        result = op.result
+        assert len(result) == 5
+        assert [r is None for r in result] == [True, True, True, False, True]
+        assert isinstance(result[3], IOError)
+
+    def test_synchronous(self):
+        # Writes that finish before point_write returns do not recurse.
+        server, session = make_server(SyncDummyServer(respond_empty))
+        writes = [("my.point.%d" % n, 16, float(n)) for n in range(500)]
+        op = session.point_write_many(writes, max_concurrency=4)
+        assert server.count == 500
+        assert op.result == [None] * 500
+
+    def test_multi(self, server_session):
+        server, session = server_session
+        writes = [
+            ("my.point.a", 8, 1.0),
+            ("my.point.b", 8, 2.0, hszinc.Quantity(5, "min")),
+            ("my.point.c", 8, 3.0),
+        ]
+        op = session.point_write_many(
+            writes, who="tester", batch_size=2, strategy="multi"
+        )
+
+        assert server.requests() == 2
+        rqs = list(server.next_requests())
+        first = read_grid(rqs[0])
+        assert [row["id"].name for row in first] == ["my.point.a", "my.point.b"]
+        assert first[0]["who"] == "tester"
+        assert first[1]["duration"] == hszinc.Quantity(5, "min")
+        assert "duration" not in first[0] or first[0]["duration"] is None
+        assert [row["id"].name for row in read_grid(rqs[1])] == ["my.point.c"]
+
+        respond_empty(rqs[0])
+        rqs[1].throw(IOError, "Server went away")
+        # Fail its retries too.
+        while server.requests():
+            server.next_request().throw(IOError, "Server went away")
+        result = op.result
+        assert result[0:2] == [None, None]
+        assert isinstance(result[2], IOError)
+
+    def test_empty(self, server_session):
+        server, session = server_session
+        op = session.point_write_many([])
+        assert server.requests() == 0
+        assert op.result == []
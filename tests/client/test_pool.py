@@ -0,0 +1,107 @@
+#!python
+# -*- coding: utf-8 -*-
+"""
+Session pool tests.  These test queries fanned out across many servers.
+"""
+
+# Assume unicode literals as per Python 3
+from __future__ import unicode_literals
+
+import time
+
+import hszinc
+import pytest
+
+from pyhaystack.client import widesky
+from pyhaystack.client.http import dummy as dummy_http
+from pyhaystack.client.pool import SessionPool
+from pyhaystack.client.retry import RetryPolicy
+
+from .test_his import respond_grid, BASE_URI
+
+
+def make_server(server=None):
+    """
+    Create a dummy server (unless one is given) and a logged-in session to
+    it.
+    """
+    if server is None:
+        server = dummy_http.DummyHttpServer()
+    session = widesky.WideskyHaystackSession(
+        uri=BASE_URI,
+        username="testuser",
+        password="testpassword",
+        client_id="testclient",
+        client_secret="testclientsecret",
+        http_client=dummy_http.DummyHttpClient,
+        http_args={"server": server, "debug": True},
+        grid_format=hszinc.MODE_ZINC,
+        retry_policy=RetryPolicy(base_delay=0),
+    )
+    session._set_auth_result(
+        {
+            "token_type": "Bearer",
+            "access_token": "DummyAccessToken",
+            "expires_in": (time.time() + 86400) * 1000.0,
+        }
+    )
+    return (server, session)
+
+
+@pytest.fixture
+def pool_servers():
+    servers = {}
+    pool = SessionPool(max_concurrency=1)
+    for key in ("site1", "site2"):
+        (server, session) = make_server()
+        servers[key] = server
+        pool.add(key, session)
+    return (pool, servers)
+
+
+@pytest.mark.usefixtures("pool_servers")
+class TestSessionPool(object):
+    def test_read_merged(self, pool_servers):
+        (pool, servers) = pool_servers
+        op = pool.read(filter_expr="site")
+
+        # Both servers are queried at once.
+        rq1 = servers["site1"].next_request()
+        rq2 = servers["site2"].next_request()
+        assert rq1.uri == BASE_URI + "api/read?filter=site"
+        respond_grid(rq2, [{"id": hszinc.Ref("b"), "area": 2.0}])
+        assert not op.is_done
+        respond_grid(rq1, [{"id": hszinc.Ref("a"), "dis": "Site A"}])
+
+        grid = op.result
+        assert op.errors == {}
+        rows = sorted((row["server"], row["id"].name) for row in grid)
+        assert rows == [("site1", "a"), ("site2", "b")]
+        assert set(grid.column.keys()) == set(["server", "id", "dis", "area"])
+
+    def test_failure_isolated(self, pool_servers):
+        (pool, servers) = pool_servers
+        op = pool.fan_out("read", kwargs={"ids": ["a"]})
+
+        respond_grid(servers["site2"].next_request(), [{"id": hszinc.Ref("a")}])
+        while servers["site1"].requests():
+            servers["site1"].next_request().throw(IOError, "Server went away")
+
+        assert list(op.result.keys()) == ["site2"]
+        assert list(op.errors.keys()) == ["site1"]
+        assert isinstance(op.errors["site1"], IOError)
+
+    def test_per_server_limit(self, pool_servers):
+        (pool, servers) = pool_servers
+        op1 = pool.read(ids={"site1": ["a"]})
+        op2 = pool.read(ids={"site1": ["b"]})
+
+        # The second query waits for the first to finish.
+        assert servers["site1"].requests() == 1
+        assert servers["site2"].requests() == 0
+        respond_grid(servers["site1"].next_request(), [{"id": hszinc.Ref("a")}])
+        assert op1.is_done
+
+        rq = servers["site1"].next_request()
+        respond_grid(rq, [{"id": hszinc.Ref("b")}])
+        assert [row["id"].name for row in op2.result] == ["b"]
@@ -0,0 +1,79 @@
+#!python
+# -*- coding: utf-8 -*-
+"""
+Replica-aware session tests.
+"""
+
+# Assume unicode literals as per Python 3
+from __future__ import unicode_literals
+
+import hszinc
+import pytest
+
+from pyhaystack.client.http.exceptions import HTTPConnectionError
+from pyhaystack.client.replica import ReplicaHaystackSession
+
+from .test_his import respond_grid
+from .test_pool import make_server
+
+
+@pytest.fixture
+def replica_servers():
+    servers = []
+    sessions = []
+    for _ in range(2):
+        (server, session) = make_server()
+        servers.append(server)
+        sessions.append(session)
+    return (ReplicaHaystackSession(sessions), servers)
+
+
+@pytest.mark.usefixtures("replica_servers")
+class TestReplicaSession(object):
+    def test_reads_spread(self, replica_servers):
+        replicas, servers = replica_servers
+        op1 = replicas.read(ids=["a"])
+        op2 = replicas.read(ids=["b"])
+
+        # One request in progress on each replica.
+        assert [s.requests() for s in servers] == [1, 1]
+        assert replicas.outstanding == [1, 1]
+        respond_grid(servers[0].next_request(), [{"id": hszinc.Ref("a")}])
+        respond_grid(servers[1].next_request(), [{"id": hszinc.Ref("b")}])
+        assert [row["id"].name for row in op1.result] == ["a"]
+        assert [row["id"].name for row in op2.result] == ["b"]
+        assert replicas.outstanding == [0, 0]
+
+    def test_writes_to_primary(self, replica_servers):
+        replicas, servers = replica_servers
+        assert replicas.point_write.__self__ is replicas.primary
+        assert replicas.is_logged_in
+
+    def test_failover(self, replica_servers):
+        replicas, servers = replica_servers
+        op = replicas.read(ids=["a"])
+
+        # The first replica is unreachable, including its retries.
+        while servers[0].requests():
+            servers[0].next_request().throw(HTTPConnectionError, "Connection refused")
+        respond_grid(servers[1].next_request(), [{"id": hszinc.Ref("a")}])
+        assert [row["id"].name for row in op.result] == ["a"]
+        assert replicas.healthy == [1]
+
+        # It is left alone from now on.
+        replicas.read(ids=["b"])
+        assert servers[0].requests() == 0
+        assert servers[1].requests() == 1
+
+    def test_all_down(self, replica_servers):
+        replicas, servers = replica_servers
+        op = replicas.read(ids=["a"])
+        while any(s.requests() for s in servers):
+            for server in servers:
+                while server.requests():
+                    server.next_request().throw(
+                        HTTPConnectionError, "Connection refused"
+                    )
+
+        with pytest.raises(HTTPConnectionError):
+            op.result
@@ -0,0 +1,109 @@
+#!python
+# -*- coding: utf-8 -*-
+"""
+Retry policy tests.
+"""
+
+# Assume unicode literals as per Python 3
+from __future__ import unicode_literals
+
+import time
+from email.utils import formatdate
+
+import hszinc
+import pytest
+
+from pyhaystack.client.http.exceptions import (
+    HTTPConnectionError,
+    HTTPRedirectError,
+    HTTPStatusError,
+)
+from pyhaystack.client.retry import RetryPolicy
+
+from .test_his import respond_grid
+from .test_pool import make_server
+
+
+class TestRetryPolicy(object):
+    def test_retryable(self):
+        policy = RetryPolicy()
+        assert policy.is_retryable(HTTPConnectionError("refused"), True)
+        assert policy.is_retryable(HTTPStatusError("Bad Gateway", 502), True)
+        assert not policy.is_retryable(HTTPStatusError("Not Found", 404), True)
+        assert not policy.is_retryable(HTTPRedirectError("Loop"), True)
+        assert not policy.is_retryable(ValueError("Bad grid"), True)
+
+        # Requests that may have changed something are only repeated if the
+        # server did not act on them.
+        assert not policy.is_retryable(HTTPConnectionError("refused"), False)
+        assert not policy.is_retryable(HTTPStatusError("Bad Gateway", 502), False)
+        assert policy.is_retryable(HTTPStatusError("Busy", 503), False)
+        assert policy.is_retryable(HTTPStatusError("Unauthorized", 401), False)
+
+    def test_backoff(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=4.0)
+        error = HTTPConnectionError("refused")
+        for attempt in range(5):
+            delay = policy.get_delay(error, attempt, True)
+            assert 0 <= delay <= min(4.0, 2**attempt)
+
+        # No waiting to log in again.
+        assert policy.get_delay(HTTPStatusError("Unauthorized", 401), 3, True) == 0
+
+    def test_retry_after(self):
+        policy = RetryPolicy(base_delay=0, max_retry_after=60.0)
+        error = HTTPStatusError("Busy", 503, headers={"Retry-After": "5"})
+        assert policy.get_delay(error, 0, True) == 5.0
+
+        when = formatdate(time.time() + 30, usegmt=True)
+        error = HTTPStatusError("Busy", 503, headers={"retry-after": when})
+        assert 28.0 <= policy.get_retry_after(error) <= 30.0
+
+        # Too long a wait fails the request.
+        error = HTTPStatusError("Busy", 503, headers={"Retry-After": "600"})
+        assert policy.get_delay(error, 0, True) is None
+
+    def test_budget(self):
+        policy = RetryPolicy(base_delay=0, budget_ratio=0.5, budget_min=2)
+        error = HTTPConnectionError("refused")
+        for _ in range(4):
+            policy.note_request()
+        assert policy.get_delay(error, 0, True) == 0
+        assert policy.get_delay(error, 0, True) == 0
+        assert policy.get_delay(error, 0, True) is None
+
+        # More requests earn more retries.
+        for _ in range(2):
+            policy.note_request()
+        assert policy.get_delay(error, 0, True) == 0
+
+
+class TestOperationRetry(object):
+    def test_not_found_not_retried(self):
+        (server, session) = make_server()
+        op = session.read(ids=["a"])
+        server.next_request().throw(HTTPStatusError, "Not Found", 404)
+        assert server.requests() == 0
+        with pytest.raises(HTTPStatusError):
+            op.result
+
+    def test_action_not_repeated(self):
+        (server, session) = make_server()
+        op = session.invoke_action("my.equip", "setSpeed", speed=50)
+        server.next_request().throw(HTTPConnectionError, "Connection reset")
+        assert server.requests() == 0
+        with pytest.raises(HTTPConnectionError):
+            op.result
+
+    def test_backoff(self):
+        (server, session) = make_server()
+        session._retry_policy = RetryPolicy(base_delay=0.05)
+        op = session.read(ids=["a"])
+        server.next_request().throw(HTTPStatusError, "Bad Gateway", 502)
+
+        # The retry waits for a timer.
+        deadline = time.time() + 2.0
+        while (not server.requests()) and (time.time() < deadline):
+            time.sleep(0.01)
+        respond_grid(server.next_request(), [{"id": hszinc.Ref("a")}])
+        assert [row["id"].name for row in op.result] == ["a"]
@@ -0,0 +1,271 @@
+#!python
+# -*- coding: utf-8 -*-
+"""
+Watch manager tests.  These test subscription, polling, change dispatch and
+re-subscription of the session's watch manager.
+"""
+
+# Assume unicode literals as per Python 3
+from __future__ import unicode_literals
+
+import pytest
+
+from .test_his import server_session, respond_grid, BASE_URI
+
+import hszinc
+
+from pyhaystack.client import curval
+from pyhaystack.client.curval import CurValStore
+
+
+def read_grid(rq):
+    """
+    Parse the grid posted by a request.
+    """
+    return hszinc.parse(rq.body.decode("utf-8"), mode=hszinc.MODE_ZINC, single=True)
+
+
+def respond_watch(rq, rows, watch_id="w1", lease=None):
+    """
+    Answer a watch request with the given rows.
+    """
+    grid = hszinc.Grid()
+    grid.metadata["watchId"] = watch_id
+    if lease is not None:
+        grid.metadata["lease"] = lease
+    grid.column["id"] = {}
+    grid.column["curVal"] = {}
+    grid.extend(rows)
+    rq.respond(
+        status=200,
+        headers={b"Content-Type": "text/zinc"},
+        content=hszinc.dump(grid, mode=hszinc.MODE_ZINC),
+    )
+
+
+def respond_error(rq, dis):
+    """
+    Answer a request with an error grid.
+    """
+    grid = hszinc.Grid()
+    grid.metadata["err"] = hszinc.MARKER
+    grid.metadata["dis"] = dis
+    grid.column["empty"] = {}
+    rq.respond(
+        status=200,
+        headers={b"Content-Type": "text/zinc"},
+        content=hszinc.dump(grid, mode=hszinc.MODE_ZINC),
+    )
+
+
+@pytest.mark.usefixtures("server_session")
+class TestWatchManager(object):
+    def test_subscribe_and_poll(self, server_session):
+        server, session = server_session
+        changes_a = []
+        changes_all = []
+        watches = session.watch_manager(poll_interval=None)
+        watches.watch(["my.point.a"], changes_a.append)
+        watches.watch(["my.point.a", "my.point.b"], changes_all.append)
+
+        # The watch is opened with the first point
+        rq = server.next_request()
+        assert rq.uri == BASE_URI + "api/watchSub"
+        grid = read_grid(rq)
+        assert [row["id"].name for row in grid] == ["my.point.a"]
+        assert "watchId" not in grid.metadata
+        respond_watch(
+            rq,
+            [{"id": hszinc.Ref("my.point.a"), "curVal": 1.0}],
+            lease=hszinc.Quantity(2, "min"),
+        )
+        assert watches.watch_id == "w1"
+        assert watches.lease == 120.0
+        assert changes_a == [
+            {"my.point.a": {"id": hszinc.Ref("my.point.a"), "curVal": 1.0}}
+        ]
+
+        # The second listener only adds the missing point
+        rq = server.next_request()
+        assert rq.uri == BASE_URI + "api/watchSub"
+        grid = read_grid(rq)
+        assert grid.metadata["watchId"] == "w1"
+        assert [row["id"].name for row in grid] == ["my.point.b"]
+        respond_watch(rq, [{"id": hszinc.Ref("my.point.b"), "curVal": 2.0}])
+        assert len(changes_all) == 2
+        assert list(changes_all[0].keys()) == ["my.point.a"]
+        assert list(changes_all[1].keys()) == ["my.point.b"]
+
+        # Poll: only changed points are dispatched
+        watches.poll()
+        rq = server.next_request()
+        assert rq.uri == BASE_URI + "api/watchPoll"
+        respond_watch(
+            rq,
+            [
+                {"id": hszinc.Ref("my.point.a"), "curVal": 1.0},
+                {"id": hszinc.Ref("my.point.b"), "curVal": 3.0},
+            ],
+        )
+        assert len(changes_a) == 1
+        assert changes_all[-1] == {
+            "my.point.b": {"id": hszinc.Ref("my.point.b"), "curVal": 3.0}
+        }
+        assert watches.get("my.point.b")["curVal"] == 3.0
+
+    def test_resubscribe(self, server_session):
+        server, session = server_session
+        changes = []
+        watches = session.watch_manager(poll_interval=None)
+        watches.watch(["my.point.a"], changes.append)
+        respond_watch(
+            server.next_request(), [{"id": hszinc.Ref("my.point.a"), "curVal": 1.0}]
+        )
+
+        # The server forgets the watch
+        watches.poll()
+        respond_error(server.next_request(), "Unknown watch")
+        assert watches.watch_id is None
+
+        # The next poll opens a new watch
+        watches.poll()
+        rq = server.next_request()
+        assert rq.uri == BASE_URI + "api/watchSub"
+        respond_watch(
+            rq, [{"id": hszinc.Ref("my.point.a"), "curVal": 5.0}], watch_id="w2"
+        )
+        assert watches.watch_id == "w2"
+        assert changes[-1]["my.point.a"]["curVal"] == 5.0
+
+        # Closing it unsubscribes
+        watches.close()
+        rq = server.next_request()
+        assert rq.uri == BASE_URI + "api/watchUnsub"
+        grid = read_grid(rq)
+        assert grid.metadata["watchId"] == "w2"
+        assert "close" in grid.metadata
+
+    def test_sharding(self, server_session):
+        server, session = server_session
+        changes = []
+        watches = session.watch_manager(
+            poll_interval=None, shard_size=2, watch_dis="test"
+        )
+        points = ["my.point.%d" % n for n in range(5)]
+        watches.watch(points, changes.append)
+
+        # Three watches are opened
+        assert server.requests() == 3
+        subscribed = []
+        for n, rq in enumerate(list(server.next_requests())):
+            assert rq.uri == BASE_URI + "api/watchSub"
+            grid = read_grid(rq)
+            assert grid.metadata["watchDis"] == "test #%d" % n
+            ids = [row["id"].name for row in grid]
+            assert len(ids) <= 2
+            subscribed.extend(ids)
+            respond_watch(rq, [], watch_id="w%d" % n)
+        assert sorted(subscribed) == points
+        assert watches.watch_ids == ["w0", "w1", "w2"]
+
+        # A poll hits every watch, and the results are merged
+        op = watches.poll()
+        assert server.requests() == 3
+        for n, rq in enumerate(list(server.next_requests())):
+            assert rq.uri == BASE_URI + "api/watchPoll"
+            assert read_grid(rq).metadata["watchId"] == "w%d" % n
+            assert not op.is_done
+            respond_watch(
+                rq,
+                [{"id": hszinc.Ref("my.point.%d" % (n * 2)), "curVal": float(n)}],
+                watch_id="w%d" % n,
+            )
+
+        assert op.is_done
+        assert sorted(op.result.keys()) == ["my.point.0", "my.point.2", "my.point.4"]
+        assert len(changes) == 1
+        assert sorted(changes[0].keys()) == ["my.point.0", "my.point.2", "my.point.4"]
+
+
+class TestCurValStore(object):
+    def test_ring(self):
+        store = CurValStore(capacity=4)
+        for n in range(6):
+            store.update("my.point", float(n), ts=1000.0 + n)
+        store.update("my.point", hszinc.Quantity(6, "kW"), ts=1006.0)
+
+        # Oldest values have been overwritten
+        assert list(store.recent("my.point")) == [3.0, 4.0, 5.0, 6.0]
+        assert list(store.recent("my.point", 2)) == [5.0, 6.0]
+        assert list(store.recent_times("my.point", 2)) == [1005.0, 1006.0]
+
+        # The result is a read-only view, not a copy
+        recent = store.recent("my.point", 2)
+        assert recent.base is not None
+        assert not recent.flags.writeable
+
+        # The raw value is kept as received
+        assert store.get("my.point", max_age=1e12) == hszinc.Quantity(6, "kW")
+        assert store.get("my.point", max_age=0.0) is None
+        assert len(store.recent("other.point")) == 0
+
+    def test_max_age_zero(self, monkeypatch):
+        # The clock has not moved since the value was stored.
+        monkeypatch.setattr(curval, "time", lambda: 1000.0)
+        store = CurValStore()
+        store.update("my.point", 1.0)
+        assert not store.enabled
+        assert store.get("my.point") is None
+        assert store.get("my.point", default=2.0) == 2.0
+        assert store.get("my.point", max_age=1.0) == 1.0
+
+
+@pytest.mark.usefixtures("server_session")
+class TestCurValFromWatch(object):
+    def test_value_from_watch(self, server_session):
+        server, session = server_session
+        session._cur_vals = CurValStore(max_age=60.0)
+        watches = session.watch_manager(poll_interval=None)
+        watches.watch(["my.point.a"])
+        respond_watch(
+            server.next_request(), [{"id": hszinc.Ref("my.point.a"), "curVal": 1.0}]
+        )
+
+        # Obtain the point entity
+        op = session.get_entity("my.point.a", single=True)
+        respond_grid(
+            server.next_request(),
+            [{"id": hszinc.Ref("my.point.a"), "point": hszinc.MARKER, "curVal": 1.0}],
+        )
+        point = op.result
+
+        # The value comes from the store, no request is made
+        assert point.value == 1.0
+        assert server.requests() == 0
+
+        watches.poll()
+        respond_watch(
+            server.next_request(), [{"id": hszinc.Ref("my.point.a"), "curVal": 2.0}]
+        )
+        assert point.value == 2.0
+        # Seen in the watch, the read, then the poll
+        assert list(point.recent_values()) == [1.0, 1.0, 2.0]
+        assert server.requests() == 0
+
+    def test_read_not_recorded_when_disabled(self, server_session):
+        server, session = server_session
+        assert not session.cur_vals.enabled
+        op = session.read(ids=["my.point.a"])
+        respond_grid(
+            server.next_request(), [{"id": hszinc.Ref("my.point.a"), "curVal": 1.0}]
+        )
+        assert op.result[0]["curVal"] == 1.0
+        assert "my.point.a" not in session.cur_vals
+
+        session._cur_vals = CurValStore(max_age=60.0)
+        op = session.read(ids=["my.point.a"])
+        respond_grid(
+            server.next_request(), [{"id": hszinc.Ref("my.point.a"), "curVal": 2.0}]
+        )
+        assert op.result[0]["curVal"] == 2.0
+        assert session.cur_vals.get("my.point.a") == 2.0
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the streaming hisWrite grid encoder.  The output is checked by
+parsing it back with hszinc.
+"""
+
+from __future__ import unicode_literals
+
+import datetime
+
+import hszinc
+import pytest
+import pytz
+
+from pyhaystack.util import hisgrid
+
+TS = pytz.timezone("Australia/Brisbane").localize(datetime.datetime(2020, 1, 1, 0, 0))
+
+
+def test_his_write():
+    records = [
+        (TS, 1.5),
+        (TS + datetime.timedelta(minutes=5), True),
+        (TS + datetime.timedelta(minutes=10), hszinc.Quantity(3, "kW")),
+        (TS + datetime.timedelta(minutes=15), "text"),
+    ]
+    chunks = list(hisgrid.iter_his_write(hszinc.Ref("my.point"), records, chunk_rows=2))
+    # Header, then two chunks of two rows
+    assert len(chunks) == 3
+
+    grid = hszinc.parse(b"".join(chunks).decode("utf-8"), single=True)
+    assert grid.metadata["id"] == hszinc.Ref("my.point")
+    assert list(grid.column.keys()) == ["ts", "val"]
+    assert [(row["ts"], row["val"]) for row in grid] == records
+    assert grid[0]["ts"].tzinfo.zone == "Australia/Brisbane"
+
+
+def test_multi_his_write():
+    body = hisgrid.dump_multi_his_write(
+        [hszinc.Ref("my.point.a"), hszinc.Ref("my.point.b")],
+        [(TS, [1.0, None]), (TS + datetime.timedelta(minutes=5), [None, 2.0])],
+    )
+    grid = hszinc.parse(body.decode("utf-8"), single=True)
+    assert grid.column["v0"]["id"] == hszinc.Ref("my.point.a")
+    assert grid.column["v1"]["id"] == hszinc.Ref("my.point.b")
+    assert grid[0]["v0"] == 1.0
+    assert grid[0]["v1"] is None
+    assert grid[1]["v1"] == 2.0
+
+
+def test_numpy_values():
+    numpy = pytest.importorskip("numpy")
+    records = [
+        (TS, numpy.float64(1.5)),
+        (TS + datetime.timedelta(minutes=5), numpy.float64("nan")),
+    ]
+    body = b"".join(hisgrid.iter_his_write(hszinc.Ref("my.point"), records))
+    assert b"np." not in body
+
+    grid = hszinc.parse(body.decode("utf-8"), single=True)
+    assert grid[0]["val"] == 1.5
+    assert type(grid[0]["val"]) is float
@@ -2,10 +2,15 @@
 """
 First test... just import something...
 """
+
 import pytest
 
+from pyhaystack.client.http import dummy as dummy_http
+from pyhaystack.client.mixins.vendor.niagara.bql import split_bql
 from pyhaystack.client.niagara import NiagaraHaystackSession
 
+from .client.test_his import SyncDummyServer
+
 
 @pytest.fixture(scope="module")
 def session(request):
@@ -27,3 +32,148 @@ def test_session_username(session):
 
 def test_session_password(session):
     assert session._password == "M87h$&"
+
+
+def make_session(server):
+    """
+    A Niagara session that believes it is already logged in.
+    """
+    session = NiagaraHaystackSession(
+        uri="http://www.myserver.com/",
+        username="user_name",
+        password="M87h$&",
+        http_client=dummy_http.DummyHttpClient,
+        http_args={"server": server},
+    )
+    session._authenticated = True
+    return session
+
+
+@pytest.fixture
+def server_session():
+    server = dummy_http.DummyHttpServer()
+    return (server, make_session(server))
+
+
+BQL_CSV = b"name,out\nAHU1_SAT,21.5\nAHU1_RAT,23\nAHU2_SAT,19.0\n"
+
+
+def respond_csv(rq, content=BQL_CSV):
+    rq.respond(status=200, headers={b"Content-Type": "text/csv"}, content=content)
+
+
+def test_get_bql_dtype(server_session):
+    server, session = server_session
+    op = session.get_bql("station:|slot:/|bql:select name, out", dtype={"out": str})
+    rq = server.next_request()
+    assert rq.uri.startswith("http://www.myserver.com/ord?station")
+    respond_csv(rq)
+    df = op.result
+    assert list(df["out"]) == ["21.5", "23", "19.0"]
+
+
+def test_stream_bql(server_session):
+    server, session = server_session
+    chunks = []
+    op = session.stream_bql(
+        "station:|slot:/|bql:select name, out",
+        chunksize=2,
+        dtype={"out": float},
+        on_chunk=chunks.append,
+    )
+    respond_csv(server.next_request())
+    assert op.result == 3
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert chunks[1]["out"].dtype == float
+
+
+def test_stream_bql_joined(server_session):
+    server, session = server_session
+    op = session.stream_bql("station:|slot:/|bql:select name, out", chunksize=2)
+    respond_csv(server.next_request())
+    assert list(op.result["name"]) == ["AHU1_SAT", "AHU1_RAT", "AHU2_SAT"]
+
+
+def test_stream_bql_parquet(server_session, tmp_path):
+    pytest.importorskip("pyarrow")
+    pd = pytest.importorskip("pandas")
+    server, session = server_session
+    path = str(tmp_path / "out.parquet")
+    op = session.stream_bql(
+        "station:|slot:/|bql:select name, out",
+        chunksize=2,
+        dtype={"out": float},
+        parquet=path,
+    )
+    respond_csv(server.next_request())
+    assert op.result == 3
+    assert list(pd.read_parquet(path)["out"]) == [21.5, 23.0, 19.0]
+
+
+def test_get_bql_cached(server_session):
+    server, session = server_session
+    bql = "station:|slot:/|bql:select name, out"
+    op1 = session.get_bql(bql, cache_expiry=60.0)
+    op2 = session.get_bql(bql, cache_expiry=60.0)
+    # Coalesced into one request
+    assert server.requests() == 1
+    respond_csv(server.next_request())
+    assert len(op1.result) == 3
+    assert len(op2.result) == 3
+
+    # Then served from cache
+    op3 = session.get_bql(bql)
+    assert server.requests() == 0
+    assert list(op3.result["name"]) == list(op1.result["name"])
+
+    # Queries that start with this one are not dropped with it.
+    longer = bql + "|bql:select name"
+    session.get_bql(longer, cache_expiry=60.0)
+    respond_csv(server.next_request())
+    session.invalidate_bql(bql)
+    session.get_bql(longer)
+    assert server.requests() == 0
+
+    session.get_bql(bql)
+    assert server.requests() == 1
+
+
+def test_split_bql():
+    assert split_bql(
+        "station:|slot:/Drivers|bql:select name, out", ["/Drivers/A", "/Drivers/B"]
+    ) == [
+        "station:|slot:/Drivers/A|bql:select name, out",
+        "station:|slot:/Drivers/B|bql:select name, out",
+    ]
+    with pytest.raises(ValueError):
+        split_bql("station:|bql:select name", ["/A"])
+
+
+def test_get_bql_pages(server_session):
+    server, session = server_session
+    queries = split_bql(
+        "station:|slot:/Drivers|bql:select name, out",
+        ["/Drivers/A", "/Drivers/B", "/Drivers/C"],
+    )
+    op = session.get_bql_pages(queries, max_concurrency=2)
+    assert server.requests() == 2
+    rqs = list(server.next_requests())
+    # Answer out of order
+    respond_csv(rqs[1], b"name,out\nB1,2\n")
+    rq = server.next_request()
+    assert "Drivers/C" in rq.uri
+    respond_csv(rq, b"name,out\nC1,3\n")
+    respond_csv(rqs[0], b"name,out\nA1,1\nA2,1.5\n")
+    assert list(op.result["name"]) == ["A1", "A2", "B1", "C1"]
+
+
+def test_get_bql_pages_synchronous():
+    # Queries that finish before get_bql returns do not recurse.
+    server = SyncDummyServer(respond_csv)
+    session = make_session(server)
+    queries = [
+        "station:|slot:/Drivers/N%d|bql:select name, out" % n for n in range(200)
+    ]
+    op = session.get_bql_pages(queries, max_concurrency=4)
+    assert server.count == 200
+    assert len(op.result) == 600
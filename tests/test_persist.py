@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Session state persistence tests.
+"""
+
+# Assume unicode literals as per Python 3
+from __future__ import unicode_literals
+
+import os
+import stat
+import time
+
+import hszinc
+import pytest
+
+from pyhaystack.client import niagara, persist, widesky
+from pyhaystack.client.http import dummy as dummy_http
+from pyhaystack.client.http.exceptions import HTTPStatusError
+from pyhaystack.util import crypto
+
+pytest.importorskip("cryptography")
+
+BASE_URI = "https://myserver/api/"
+
+
+@pytest.fixture(autouse=True)
+def fast_kdf(monkeypatch):
+    """
+    Key derivation is deliberately slow, speed it up for testing.
+    """
+    monkeypatch.setattr(crypto, "_KDF_ITERATIONS", 10)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return persist.SessionStateStore(str(tmp_path / "state"), secret="s3cret")
+
+
+def get_session(server, store):
+    return widesky.WideskyHaystackSession(
+        uri=BASE_URI,
+        username="testuser",
+        password="testpassword",
+        client_id="testclient",
+        client_secret="testclientsecret",
+        http_client=dummy_http.DummyHttpClient,
+        http_args={"server": server, "debug": True},
+        state_store=store,
+    )
+
+
+def respond_login(server, token):
+    rq = server.next_request()
+    assert rq.uri == BASE_URI + "oauth2/token"
+    rq.respond(
+        status=200,
+        headers={b"Content-Type": "application/json"},
+        content="""{
+                "token_type": "Bearer",
+                "access_token": "%s",
+                "refresh_token": "DummyRefreshToken",
+                "expires_in": %f
+            }"""
+        % (token, (time.time() + 86400) * 1000.0),
+    )
+
+
+def test_seal_round_trip():
+    blob = persist.seal("key", b"some state")
+    assert b"some state" not in blob
+    assert persist.unseal("key", blob) == b"some state"
+
+    with pytest.raises(ValueError):
+        persist.unseal("wrong key", blob)
+
+    tampered = blob[:-40] + bytes(bytearray([blob[-40] ^ 1])) + blob[-39:]
+    with pytest.raises(ValueError):
+        persist.unseal("key", tampered)
+
+
+def test_store_round_trip(store, tmp_path):
+    state = {
+        "headers": persist.pack_map({"Authorization": b"Bearer abc"}),
+        "cookies": None,
+        "expires": None,
+    }
+    store.save("session", state)
+
+    files = os.listdir(str(tmp_path / "state"))
+    assert len(files) == 1
+    mode = os.stat(str(tmp_path / "state" / files[0])).st_mode
+    assert stat.S_IMODE(mode) == 0o600
+
+    loaded = store.load("session")
+    assert persist.unpack_map(loaded["headers"]) == {"Authorization": b"Bearer abc"}
+    assert store.load("another session") is None
+
+    # Expired state is thrown away.
+    store.save("session", dict(state, expires=time.time() - 1.0))
+    assert store.load("session") is None
+    assert os.listdir(str(tmp_path / "state")) == []
+
+
+def test_session_restored(store):
+    server = dummy_http.DummyHttpServer()
+    session = get_session(server, store)
+    op = session.authenticate()
+    respond_login(server, "FirstToken")
+    assert op.state == "done"
+    assert session.is_logged_in
+    session._cancel_refresh()
+
+    # A new session resumes where the first left off.
+    server = dummy_http.DummyHttpServer()
+    session = get_session(server, store)
+    op = session.authenticate()
+
+    rq = server.next_request()
+    assert server.requests() == 0
+    assert rq.uri == BASE_URI + "api/about"
+    assert rq.headers.get("Authorization") == b"Bearer FirstToken"
+
+    about = hszinc.Grid()
+    about.column["productName"] = {}
+    about.append({"productName": "WideSky"})
+    rq.respond(
+        status=200,
+        headers={b"Content-Type": "text/zinc"},
+        content=hszinc.dump(about, mode=hszinc.MODE_ZINC),
+    )
+    assert op.state == "done"
+    assert op.restored
+    assert session.is_logged_in
+    assert server.requests() == 0
+    session._cancel_refresh()
+
+
+def test_session_stale(store):
+    server = dummy_http.DummyHttpServer()
+    session = get_session(server, store)
+    session.authenticate()
+    respond_login(server, "FirstToken")
+    session._cancel_refresh()
+
+    server = dummy_http.DummyHttpServer()
+    session = get_session(server, store)
+    op = session.authenticate()
+
+    # The server has forgotten the token, so log in again.
+    server.next_request().throw(HTTPStatusError, "Unauthorized", 401)
+    respond_login(server, "SecondToken")
+    assert op.state == "done"
+    assert not op.restored
+    assert session.is_logged_in
+    assert session._client.headers["Authorization"] == b"Bearer SecondToken"
+    assert store.load(session._state_key())["auth_result"]["access_token"] == (
+        "SecondToken"
+    )
+
+    # Logging out forgets the saved state.
+    session.logout()
+    assert store.load(session._state_key()) is None
+
+
+def test_ax_session_restored(store):
+    server = dummy_http.DummyHttpServer()
+    session = niagara.NiagaraHaystackSession(
+        uri=BASE_URI,
+        username="testuser",
+        password="testpassword",
+        http_client=dummy_http.DummyHttpClient,
+        http_args={"server": server, "debug": True},
+        state_store=store,
+    )
+    cookies = persist.pack_map({"niagara_session": "abc"})
+    store.save(
+        session._state_key(), {"headers": None, "cookies": cookies, "expires": None}
+    )
+    op = session.authenticate()
+
+    # AX needs Basic credentials as well as the session cookie.
+    rq = server.next_request()
+    assert rq.auth.username == "testuser"
+    assert rq.auth.password == "testpassword"
+    assert rq.cookies == {"niagara_session": "abc"}
+
+    # If the server does not accept it, the credentials are cleared again
+    # before logging in normally.
+    rq.throw(HTTPStatusError, "Unauthorized", 401)
+    assert session._client.cookies is None
+    assert session._client.auth is None
+    assert not op.restored
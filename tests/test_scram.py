@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+SCRAM helper tests.
+"""
+
+import os
+import stat
+
+import pytest
+
+from pyhaystack.util import scram
+
+SALT = "c2FsdHNhbHRzYWx0c2FsdA=="
+
+
+@pytest.fixture
+def key_cache(monkeypatch):
+    """
+    Use a fresh salted password cache, and count PBKDF2 derivations.
+    """
+    cache = scram.SaltedPasswordCache()
+    monkeypatch.setattr(scram, "KEY_CACHE", cache)
+    calls = []
+    pbkdf2_hmac = scram.pbkdf2_hmac
+
+    def _pbkdf2_hmac(*args):
+        calls.append(args)
+        return pbkdf2_hmac(*args)
+
+    monkeypatch.setattr(scram, "pbkdf2_hmac", _pbkdf2_hmac)
+    return (cache, calls)
+
+
+SERVER = "https://myserver/"
+
+
+def test_salted_password_cached(key_cache):
+    cache, calls = key_cache
+    first = scram.salted_password(
+        SALT, 1000, "sha256", "secret", username="alice", server=SERVER
+    )
+    second = scram.salted_password(
+        SALT, 1000, "sha256", "secret", username="alice", server=SERVER
+    )
+    assert first == second
+    assert len(calls) == 1
+
+    # Anything else changing derives again
+    scram.salted_password(
+        SALT, 2000, "sha256", "secret", username="alice", server=SERVER
+    )
+    scram.salted_password(SALT, 1000, "sha256", "secret", username="bob", server=SERVER)
+    scram.salted_password(
+        SALT, 1000, "sha256", "secret", username="alice", server="https://other/"
+    )
+    assert len(calls) == 4
+
+    # Including the password
+    changed = scram.salted_password(
+        SALT, 1000, "sha256", "new", username="alice", server=SERVER
+    )
+    assert changed != first
+    assert len(calls) == 5
+
+
+def test_salted_password_no_user(key_cache):
+    cache, calls = key_cache
+    scram.salted_password_2("0011", 10, "sha256", "secret")
+    scram.salted_password_2("0011", 10, "sha256", "secret")
+    scram.salted_password_2("0011", 10, "sha256", "secret", username="a")
+    assert len(calls) == 3
+
+
+def test_file_key_store(key_cache, tmp_path, monkeypatch):
+    pytest.importorskip("cryptography")
+    from pyhaystack.util import crypto
+
+    monkeypatch.setattr(crypto, "_KDF_ITERATIONS", 10)
+    cache, calls = key_cache
+    path = str(tmp_path / "keys" / "scram.keys")
+    cache.store = scram.FileKeyStore(path, secret="s3cret")
+    value = scram.salted_password_2(
+        b"0011", 10, "sha256", "secret", username="a", server=SERVER
+    )
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    # Neither the salted password nor its verifier is readable.
+    with open(path, "rb") as f:
+        content = f.read()
+    assert value not in content
+    assert b"verifier" not in content
+
+    # Another process picks up the stored value, for the right password only.
+    other = scram.SaltedPasswordCache(store=scram.FileKeyStore(path, secret="s3cret"))
+    key = other.key(SERVER, "a", b"0011", 10, "sha256")
+    assert other.get(key, "secret") == value
+    assert other.get(key, "wrong") is None
+
+    # Nor without the secret.
+    assert scram.FileKeyStore(path, secret="wrong").load() == {}
+
+    cache.clear()
+    assert scram.FileKeyStore(path, secret="s3cret").load() == {}
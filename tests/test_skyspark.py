@@ -5,7 +5,14 @@ Created on Wed Jun  1 22:25:49 2016
 @author: CTremblay
 """
 
+import pytest
+import hszinc
+from six.moves.urllib.parse import urlencode
+
+from pyhaystack.client.http import dummy as dummy_http
+from pyhaystack.exception import HaystackError
 from pyhaystack.client.ops.vendor.skyspark import get_digest_info
+from pyhaystack.client.skyspark import SkysparkHaystackSession
 
 
 def test_digest_creation():
@@ -19,3 +26,135 @@ def test_digest_creation():
     test_result = get_digest_info(test_param)
     assert test_result["digest"] == "B2B3mIzE/+dqcqOJJ/ejSGXRKvE="
     assert test_result["hmac"] == "z9NILqJ3QHSG5+GlDnXsV9txjgo="
+
+
+BASE_URI = "https://myserver/"
+
+
+@pytest.fixture
+def server_session():
+    """
+    A SkySpark session that believes it is already logged in.
+    """
+    server = dummy_http.DummyHttpServer()
+    session = SkysparkHaystackSession(
+        uri=BASE_URI,
+        username="testuser",
+        password="testpassword",
+        project="demo",
+        http_client=dummy_http.DummyHttpClient,
+        http_args={"server": server},
+        grid_format=hszinc.MODE_ZINC,
+    )
+    session._authenticated = True
+    return (server, session)
+
+
+def test_eval_all(server_session):
+    server, session = server_session
+    op = session.eval_all(
+        ["readAll(kw).hisRead(today)", "hisRollup(_,max,1hr)", "x => x"],
+        args=[None, 0, ["prev", 1]],
+    )
+    rq = server.next_request()
+    assert rq.method == "POST"
+    assert rq.uri == BASE_URI + "api/demo/evalAll"
+    posted = hszinc.parse(rq.body.decode("utf-8"), mode=hszinc.MODE_ZINC, single=True)
+    assert [row["expr"] for row in posted] == [
+        "readAll(kw).hisRead(today)",
+        "hisRollup(_,max,1hr)",
+        "x => x",
+    ]
+    assert [row.get("args") for row in posted] == [None, "0", "prev,1"]
+
+    result = hszinc.Grid()
+    result.column["val"] = {}
+    result.append({"val": 1.0})
+    error = hszinc.Grid()
+    error.metadata["err"] = hszinc.MARKER
+    error.metadata["dis"] = "Unknown func"
+    error.column["empty"] = {}
+    rq.respond(
+        status=200,
+        headers={b"Content-Type": "text/zinc"},
+        content=hszinc.dump([result, result, error], mode=hszinc.MODE_ZINC),
+    )
+
+    grids = op.result
+    assert len(grids) == 3
+    assert grids[1][0]["val"] == 1.0
+    assert isinstance(grids[2], HaystackError)
+    assert str(grids[2]).startswith("Unknown func")
+
+
+def test_eval_all_bad_args(server_session):
+    server, session = server_session
+    with pytest.raises(ValueError):
+        session.eval_all(["a", "b"], args=[None])
+
+
+def respond_val(rq, val):
+    """
+    Answer an eval request with a single value.
+    """
+    grid = hszinc.Grid()
+    grid.column["val"] = {}
+    grid.append({"val": val})
+    rq.respond(
+        status=200,
+        headers={b"Content-Type": "text/zinc"},
+        content=hszinc.dump(grid, mode=hszinc.MODE_ZINC),
+    )
+
+
+def test_eval_coalesced(server_session):
+    server, session = server_session
+    op1 = session.get_eval("readAll(site).size")
+    op2 = session.get_eval("  readAll(site).size\n")
+    assert server.requests() == 1
+    rq = server.next_request()
+    # The expression is encoded
+    assert rq.uri == BASE_URI + "api/demo/eval?expr=readAll%28site%29.size"
+    respond_val(rq, 3.0)
+    assert op1.result[0]["val"] == 3.0
+    assert op2.result[0]["val"] == 3.0
+
+    # Not cached by default
+    session.get_eval("readAll(site).size")
+    assert server.requests() == 1
+
+
+def test_eval_multi_line(server_session):
+    server, session = server_session
+    expr = "do\n  a: readAll(site) // all sites\n  a.size\nend"
+    op = session.get_eval(expr)
+    # Sent as given: newlines end the comment and separate statements
+    rq = server.next_request()
+    assert rq.uri == BASE_URI + "api/demo/eval?" + urlencode({"expr": expr})
+    respond_val(rq, 3.0)
+    assert op.result[0]["val"] == 3.0
+
+    # Only whitespace that means the same is treated as the same
+    assert session._normalise_expr("do\n\n  a  b\nend ") == "do\na b\nend"
+    assert session._normalise_expr(expr) != session._normalise_expr(
+        expr.replace("\n", " ")
+    )
+
+def test_eval_cached(server_session):
+    server, session = server_session
+    op = session.get_eval('read(dis == "a  b")', cache_expiry=60.0)
+    respond_val(server.next_request(), 1.0)
+    assert op.result[0]["val"] == 1.0
+
+    op = session.get_eval('read(dis  ==  "a  b")', cache_expiry=60.0)
+    assert server.requests() == 0
+    assert op.result[0]["val"] == 1.0
+
+    # Whitespace in strings is significant
+    session.get_eval('read(dis == "a b")', cache_expiry=60.0)
+    assert server.requests() == 1
+    server.next_request()
+
+    session.invalidate_eval('read(dis == "a  b")')
+    session.get_eval('read(dis == "a  b")', cache_expiry=60.0)
+    assert server.requests() == 1
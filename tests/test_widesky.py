@@ -381,3 +381,69 @@ class TestOnHTTPGridResponse(object):
             assert auth_result[key] == session._auth_result[key], (
                 "Mismatching key %s" % key
             )
+
+
+@pytest.mark.usefixtures("server_session")
+class TestRefreshToken(object):
+    """
+    Test the proactive refresh of the access token.
+    """
+
+    def test_refresh_scheduled_before_expiry(self, server_session):
+        (server, session) = server_session
+        timer = session._refresh_timer
+        assert timer is not None
+        assert timer.interval == pytest.approx(86400.0 - 60.0, abs=5.0)
+
+        # Short-lived tokens are refreshed half-way through their life.
+        session._set_auth_result(
+            {
+                "token_type": "Bearer",
+                "access_token": "ShortToken",
+                "refresh_token": "DummyRefreshToken",
+                "expires_in": (time.time() + 30.0) * 1000.0,
+            }
+        )
+        assert timer.finished.is_set()
+        assert session._refresh_timer.interval == pytest.approx(15.0, abs=1.0)
+
+        session.logout()
+        assert session._refresh_timer is None
+        assert not session.is_logged_in
+
+    def test_refresh_replaces_token(self, server_session):
+        (server, session) = server_session
+        op = session._refresh_token()
+
+        rq = server.next_request()
+        assert server.requests() == 0, "More requests waiting"
+        assert json.loads(rq.body) == {
+            "refresh_token": "DummyRefreshToken",
+            "grant_type": "refresh_token",
+        }
+        rq.respond(
+            status=200,
+            headers={b"Content-Type": "application/json"},
+            content="""{
+                    "token_type": "Bearer",
+                    "access_token": "NewAccessToken",
+                    "expires_in": %f
+                }""" % ((time.time() + 86400) * 1000.0),
+        )
+        assert op.state == "done"
+        assert session._client.headers["Authorization"] == b"Bearer NewAccessToken"
+        assert session._auth_result["refresh_token"] == "DummyRefreshToken"
+        assert session._refresh_timer is not None
+        session.logout()
+
+    def test_refresh_failure_keeps_token(self, server_session):
+        (server, session) = server_session
+        session._cancel_refresh()
+        op = session._refresh_token()
+
+        rq = server.next_request()
+        rq.throw(HTTPStatusError, "Bad Request", 400)
+        assert op.state == "done"
+        assert session.is_logged_in
+        assert session._client.headers["Authorization"] == b"Bearer DummyAccessToken"
+        assert session._refresh_timer is None